@@ -1,55 +1,116 @@
 # /app/backend/agent.py
 
 import os
+import time
 import asyncio
-import json
-from typing import List, Dict, Any, AsyncGenerator
+from contextlib import aclosing
+from typing import TYPE_CHECKING, List, Dict, Any, AsyncGenerator, Optional
 
-import ollama
 from dotenv import load_dotenv
 
-from secret_sdk.client.lcd import AsyncLCDClient
-from secret_sdk.key.mnemonic import MnemonicKey
-from secret_sdk.core.wasm import MsgExecuteContract
-
-from shade import create_buy_scrt_msg_data
+import shade
+from routing import route_engine
+from llm_pool import LLMPool
 import db
+from ledger import ledger
 from arweave_storage import storage_client
-from prompts import SYSTEM_PROMPT
+from trade_journal import trade_log_queue
+from trade_stats import columns_from_records, summarize, trade_analytics
+from prompts import SUMMARY_PROMPT
+from conversation import conversation_store
+from response_cache import response_cache
+from balances import balance_service
+from scheduler import FairScheduler, weights_from_env
+from logger import get_logger
+from metrics import StreamTimer, span
+from startup_profile import lazy_import
+from serialization import dumps
+
+if TYPE_CHECKING:
+    # secret_sdk takes a large share of import time; it is loaded when the agent connects.
+    from secret_sdk.client.lcd import AsyncLCDClient
+
+log = get_logger(__name__)
 
 load_dotenv()
 
+# sUSDC (6 decimals) spent on one sSCRT purchase.
+TRADE_AMOUNT_USDC = "300000"
+
+
+def _build_lcd_client(url: str, chain_id: str) -> "AsyncLCDClient":
+    """
+    AsyncLCDClient fetches the chain's consensus key in its constructor with a
+    blocking `run_until_complete`, which raises inside a running event loop.
+    Build it on a private loop (called from a worker thread); `connect` then
+    hands it a session on the app's loop.
+    """
+    AsyncLCDClient = lazy_import("secret_sdk.client.lcd").AsyncLCDClient
+    loop = asyncio.new_event_loop()
+    try:
+        client = AsyncLCDClient(url=url, chain_id=chain_id, loop=loop)
+        loop.run_until_complete(client.session.close())
+    finally:
+        loop.close()
+    return client
+
 class TradingAgent:
     def __init__(self):
         self.mnemonic = os.getenv("MNEMONIC")
         self.lcd_url = os.getenv("LCD_URL", "https://rpc.ankr.com/http/scrt_cosmos")
         self.chain_id = os.getenv("CHAIN_ID", "secret-4")
-        host_url = os.getenv("SECRET_AI_URL")
+        host_url = os.getenv("SECRET_AI_ENDPOINTS") or os.getenv("SECRET_AI_URL")
         api_key = os.getenv("SECRET_AI_API_KEY")
-        self.model = os.getenv("OLLAMA_MODEL", "llama3")
+        self.trade_history_source = os.getenv("TRADE_HISTORY_SOURCE", "ledger")
+        self.response_cache_enabled = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+        # Setting an embedding model enables near-duplicate lookups in the response cache.
+        self.embed_model = os.getenv("RESPONSE_CACHE_EMBED_MODEL")
+        # Without routing, trades use the registered sUSDC->sSCRT path with no minimum output.
+        self.swap_routing_enabled = os.getenv("SWAP_ROUTING_ENABLED", "true").lower() == "true"
 
         if not self.mnemonic or not host_url or not api_key:
             raise ValueError("Required environment variables are missing.")
 
-        self.llm_client = ollama.AsyncClient(
-            host=host_url,
-            headers={"Authorization": f"Bearer {api_key}"}
+        # Every LLM call goes through the pool, which spreads load over the
+        # configured endpoints, limits concurrency and fails over between them.
+        self.llm_pool = LLMPool.from_env()
+        # Chat generations are admitted fairly per user, up to the pool's total capacity,
+        # so one busy wallet queues behind the others instead of filling every slot.
+        self.llm_scheduler = FairScheduler(
+            "llm",
+            concurrency=int(os.getenv("LLM_FAIR_CONCURRENCY", "0"))
+            or sum(endpoint.max_concurrency for endpoint in self.llm_pool.endpoints),
+            weights=weights_from_env(),
         )
-        self.secret_client: AsyncLCDClient = None
+        self.secret_client: Optional["AsyncLCDClient"] = None
         self.wallet = None
         self.is_initialized = False
-        print("Python TradingAgent configured.")
+        self._connect_lock = asyncio.Lock()
+        # Keeps fire-and-forget work (e.g. conversation summaries) referenced until done.
+        self._background_tasks = set()
+        log.info("Python TradingAgent configured.")
 
     async def connect(self):
-        """Asynchronously connects to the Secret Network."""
+        """
+        Asynchronously connects to the Secret Network. Idempotent and safe to call
+        concurrently, so each worker can connect lazily on first use.
+        """
         if self.is_initialized:
             return
-        self.secret_client = AsyncLCDClient(url=self.lcd_url, chain_id=self.chain_id)
-        mk = MnemonicKey(self.mnemonic)
-        self.wallet = self.secret_client.wallet(mk)
-        self.is_initialized = True
-        print("Python TradingAgent Initialized Successfully.")
-        print(f"Secret Wallet Address: {self.wallet.key.acc_address}")
+        async with self._connect_lock:
+            if self.is_initialized:
+                return
+            client = await asyncio.to_thread(_build_lcd_client, self.lcd_url, self.chain_id)
+            aiohttp = await asyncio.to_thread(lazy_import, "aiohttp")
+            mnemonic = await asyncio.to_thread(lazy_import, "secret_sdk.key.mnemonic")
+            client.loop = asyncio.get_running_loop()
+            client.session = aiohttp.ClientSession(headers={"Accept": "application/json"})
+            self.secret_client = client
+            mk = mnemonic.MnemonicKey(self.mnemonic)
+            self.wallet = self.secret_client.wallet(mk)
+            self.is_initialized = True
+        log.info("Python TradingAgent Initialized Successfully.")
+        log.info(f"Secret Wallet Address: {self.wallet.key.acc_address}")
 
     # --- User and DB Methods ---
     async def get_user(self, user_id: str):
@@ -59,7 +120,19 @@ class TradingAgent:
         return await db.create_user(user_id)
 
     async def set_viewing_keys(self, user_id: str, sscrt_key: str, susdc_key: str):
-        return await db.set_viewing_keys(user_id, sscrt_key, susdc_key)
+        user = await db.set_viewing_keys(user_id, sscrt_key, susdc_key)
+        await balance_service.invalidate(user_id, self.get_agent_secret_address())
+        return user
+
+    # --- Balance Methods ---
+    async def get_balances(self, user_id: str) -> Dict[str, Any]:
+        return await balance_service.get_balances(self.secret_client, user_id)
+
+    async def check_allowed_to_spend(self, user_id: str) -> Dict[str, Any]:
+        """Checks whether the user's sUSDC allowance for the agent wallet covers one trade."""
+        return await balance_service.check_allowed_to_spend(
+            self.secret_client, user_id, spender=self.get_agent_secret_address(), amount=TRADE_AMOUNT_USDC
+        )
 
     # --- Core Agent Logic ---
     def get_agent_secret_address(self) -> str:
@@ -67,27 +140,42 @@ class TradingAgent:
 
 
     async def _save_trade_history(self, user_id: str, trade_result: str):
-        """Saves a record of a completed trade to Arweave for auditing."""
-        print(f"AGENT: Saving TRADE HISTORY for user {user_id}...")
+        """
+        Saves a record of a completed trade for auditing. The record is appended to
+        the local trade journal and uploaded to Arweave in the background.
+        Raises if the record could not be journaled, so the client can retry.
+        """
+        log.debug(f"Saving TRADE HISTORY for user {user_id}...")
         try:
-            await storage_client.store_memory(
+            await trade_log_queue.enqueue(
                 user_id=user_id,
                 message="TRADE_EXECUTION",
                 response=trade_result
             )
-            print(f"AGENT: Successfully saved trade history to Arweave for user {user_id}.")
         except Exception as e:
-            print(f"CRITICAL: Failed to save trade history to Arweave. Error: {e}")
+            log.critical(f"Failed to journal trade history. Error: {e}")
+            raise
+        log.debug(f"Trade history for user {user_id} journaled for upload to Arweave.")
+        try:
+            # The trade moved funds; the next balance read must go to the chain.
+            await balance_service.invalidate(user_id, self.get_agent_secret_address())
+        except Exception as e:
+            log.warning(f"Failed to invalidate cached balances for {user_id}: {e}")
 
 
     async def get_trade_history(self, user_id: str) -> List[Dict]:
         """
-        Retrieves all records flagged as 'TRADE_EXECUTION' for a user from Arweave.
+        Retrieves all records flagged as 'TRADE_EXECUTION' for a user from the local
+        trade ledger. Arweave is the audit copy, replicated to in the background.
         """
-        print(f"AGENT: Retrieving TRADE HİSTORY for user {user_id}...")
+        log.debug(f"Retrieving TRADE HİSTORY for user {user_id}...")
         try:
-            # Use the existing storage client to get all memory records
-            all_records = await storage_client.get_memory(user_id)
+            if self.trade_history_source == "arweave":
+                # Multi-node deployments without a shared ledger volume read from the bucket.
+                all_records = await storage_client.get_memory(user_id)
+            else:
+                # read_user takes the ledger lock (held by appends across fsync) and may reopen the file.
+                all_records = await asyncio.to_thread(ledger.read_user, user_id)
 
             # Filter for records that are specifically trade executions
             trade_records = [
@@ -97,59 +185,159 @@ class TradingAgent:
             
             return trade_records
         except Exception as e:
-            print(f"ERROR: Could not retrieve trade history from Arweave: {e}")
+            log.error(f"Could not retrieve trade history from the ledger: {e}")
             # Return an empty list on failure to avoid crashing the frontend
             return []
 
 
-    async def chat_stream(self, user_id: str, messages: List[Dict]) -> AsyncGenerator[str, None]:
+    async def get_trade_stats(self, user_id: str, start: Optional[int] = None, end: Optional[int] = None,
+                              bucket: Optional[str] = "day") -> Dict[str, Any]:
+        """
+        Success rates, volume and a time-bucketed series of the user's trades, plus
+        the same over all users. Without a local ledger (TRADE_HISTORY_SOURCE=arweave)
+        only the user's own stats are available.
+        """
+        trade_volume = int(TRADE_AMOUNT_USDC) / 10**6
+        if self.trade_history_source == "arweave":
+            columns = columns_from_records(await self.get_trade_history(user_id))
+            return {
+                "user": summarize(*columns, start=start, end=end, bucket=bucket, trade_volume=trade_volume),
+                "global": None,
+            }
+        return await asyncio.to_thread(
+            trade_analytics.query, user_id, start=start, end=end, bucket=bucket, trade_volume=trade_volume
+        )
+
+
+    async def _summarize(self, summary: str, turns: List[Dict]) -> str:
+        """Folds older chat turns into the running conversation summary."""
+        transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+        response = await self.llm_pool.chat(
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+            ],
+        )
+        return response.strip()
+
+    async def _embed(self, text: str) -> List[float]:
+        return await self.llm_pool.embed(text, model=self.embed_model)
+
+    async def chat_events(self, user_id: str, messages: List[Dict]) -> AsyncGenerator[Dict[str, Any], None]:
         """
-        Handles chat, and saves a record to Arweave ONLY when a trade occurs.
+        Runs one chat turn as a stream of typed events (see chat_transport):
+        `token` chunks of the answer, an `action` when the user triggers a trade,
+        or an `error`. Only the last message is new; earlier turns come from the
+        server-side conversation store (seeded from `messages` if it is empty).
+        Closing the generator early cancels the upstream LLM request.
         """
+        started = time.perf_counter()
         if not self.is_initialized:
-            yield "Error: Agent is not connected."
+            yield {"type": "error", "message": "Error: Agent is not connected."}
             return
 
-        # We still need the original message content for saving
-        user_message_content = messages[-1].get('content', '')
+        new_message = {"role": "user", "content": messages[-1].get('content', '')}
+        user_message_content = new_message["content"]
 
         try:
             # --- Trade Trigger Logic ---
             if user_message_content.lower() == "you have convinced me":
-                yield json.dumps({
-                    "action": "execute_trade",
-                    "message": "Great! I've prepared the transaction for you. Please review and sign it in your wallet to execute the trade for .3 sUSDC.",
-                    "trade_args": self.prepare_trade_transaction(user_id)
-                })
+                trade_args = await self.prepare_trade_transaction(user_id)
+                message = "Excellent! Please approve the transaction in your wallet to execute the trade."
+                await conversation_store.record(user_id, [new_message, {"role": "assistant", "content": message}])
+                yield {"type": "action", "action": "execute_trade", "message": message, "trade_args": trade_args}
                 return
 
+            with span("context"):
+                await conversation_store.seed(user_id, messages[:-1])
+                conversation = await conversation_store.load(user_id)
+                messages_with_prompt = conversation_store.build_context(conversation, new_message)
+                # Answers are cached per conversation state (summary and recent turns),
+                # so follow-ups and personalized replies are never served to another wallet.
+                cache_context = response_cache.context_hash(messages_with_prompt[1:-1])
+
+            cached, embedding = None, None
+            if self.response_cache_enabled:
+                with span("response_cache_lookup"):
+                    cached, embedding = await response_cache.lookup(
+                        user_message_content, embed=self._embed if self.embed_model else None,
+                        context=cache_context,
+                    )
+
+            if cached is not None:
+                timer = StreamTimer("cache", started=started)
+                async for content in response_cache.replay(cached):
+                    timer.chunk()
+                    yield {"type": "token", "content": content}
+                timer.finish()
+                full_response = cached
             else:
-                messages_with_prompt = [
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    *messages
-                ]
-                
-                full_response = ""
-                async for chunk in await self.llm_client.chat(model=self.model, messages=messages_with_prompt, stream=True):
-                    content = chunk['message']['content']
-                    full_response += content
-                    yield content
-                
-                
+                timer = StreamTimer("llm", started=started)
+                parts: List[str] = []
+                async with self.llm_scheduler.slot(user_id):
+                    async with aclosing(self.llm_pool.chat_stream(messages_with_prompt)) as stream:
+                        async for content in stream:
+                            timer.chunk()
+                            parts.append(content)
+                            yield {"type": "token", "content": content}
+                timer.finish()
+                full_response = "".join(parts)
+                if self.response_cache_enabled:
+                    response_cache.store(user_message_content, full_response, embedding, context=cache_context)
+
+            # Summarization (if due) runs after the response, off the streaming path.
+            task = asyncio.create_task(conversation_store.record(
+                user_id,
+                [new_message, {"role": "assistant", "content": full_response}],
+                summarize=self._summarize,
+            ))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
         except Exception as e:
-            yield f"Sorry, I encountered an error: {e}"
+            log.exception("Chat stream failed")
+            yield {"type": "error", "message": f"Sorry, I encountered an error: {e}"}
 
-    def prepare_trade_transaction(self, user_id: str) -> dict:
+    async def chat_stream(self, user_id: str, messages: List[Dict]) -> AsyncGenerator[str, None]:
+        """The plain-text rendering of `chat_events` served to text/plain clients."""
+        async with aclosing(self.chat_events(user_id, messages)) as events:
+            async for event in events:
+                if event["type"] == "token":
+                    yield event["content"]
+                elif event["type"] == "action":
+                    yield dumps({key: event[key] for key in ("action", "message", "trade_args")}).decode("utf-8")
+                else:
+                    yield event["message"]
+
+    async def prepare_trade_transaction(self, user_id: str) -> dict:
         """
         Prepares the arguments for a trade transaction for the frontend to execute.
+        The swap follows the best Shade route for the trade amount, and its
+        expected_return is the quoted output less the slippage tolerance. If no
+        quote can be made (e.g. the LCD is unreachable), it falls back to the
+        registered sUSDC->sSCRT route with no minimum output.
         """
         if not self.is_initialized:
             raise Exception("Agent is not ready.")
         
-        print(f"Preparing trade transaction for user: {user_id}")
-        amount_usdc = "300000"
-        
-        contract_address, code_hash, msg_dict = create_buy_scrt_msg_data(amount_usdc, user_id)
+        log.debug(f"Preparing trade transaction for user: {user_id}")
+        offer_token = shade.TOKENS["sUSDC"]
+        quote = None
+        if self.swap_routing_enabled:
+            try:
+                quote = await route_engine.quote(
+                    self.secret_client, offer_token.address, shade.TOKENS["sSCRT"].address, int(TRADE_AMOUNT_USDC)
+                )
+            except Exception as e:
+                log.warning(f"Swap routing failed, using the registered sUSDC->sSCRT route: {e}")
+        if quote is not None:
+            log.info(f"Quoted {quote.amount_in} sUSDC -> {quote.amount_out} sSCRT over {len(quote.path)} hop(s), "
+                     f"minimum {quote.min_out}.")
+            contract_address, code_hash, msg_dict = shade.create_send_msg_data(
+                offer_token, TRADE_AMOUNT_USDC, user_id, shade.encode_swap_msg(quote.path, str(quote.min_out))
+            )
+        else:
+            contract_address, code_hash, msg_dict = shade.create_buy_scrt_msg_data(TRADE_AMOUNT_USDC, user_id)
 
         # Return a dictionary of the arguments that SecretJS on the frontend can use directly.
         # CRUCIALLY, the sender is now the user.
@@ -158,4 +346,4 @@ class TradingAgent:
             "contract_address": contract_address,
             "code_hash": code_hash,
             "msg": msg_dict
-        }
\ No newline at end of file
+        }
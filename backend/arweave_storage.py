@@ -1,13 +1,29 @@
 # /app/backend/arweave_storage.py (Rewritten without SDK)
 
 import os
-import json
 import time
 import asyncio
 import base64
-from typing import List, Dict
+import uuid
+from contextlib import aclosing
+from typing import TYPE_CHECKING, AsyncGenerator, List, Dict, Optional, Set, Tuple
 
-import aiohttp
+from history_cache import history_cache
+from scheduler import storage_scheduler
+from logger import get_logger
+from metrics import apillon_request_duration, span
+from startup_profile import lazy_import
+from serialization import dumps, loads
+
+if TYPE_CHECKING:
+    # aiohttp is imported when the session is opened, not when the app is imported.
+    import aiohttp
+
+log = get_logger(__name__)
+
+# Trade records live under a per-user prefix (`trades/<user_id>/`) so that a
+# history lookup only has to list that user's slice of the bucket.
+TRADES_DIRECTORY = "trades"
 
 class ArweaveStorageClient:
     """
@@ -23,7 +39,9 @@ class ArweaveStorageClient:
             raise ValueError("APILLON_API_KEY, APILLON_API_SECRET, and APILLON_BUCKET_UUID must be set.")
 
         # 2. Prepare for direct API calls
-        self.base_url = f"https://api.apillon.io/storage/buckets/{self.bucket_uuid}"
+        # APILLON_API_URL can point at a stand-in server (see benchmarks/fake_services.py).
+        api_url = os.getenv("APILLON_API_URL", "https://api.apillon.io").rstrip("/")
+        self.base_url = f"{api_url}/storage/buckets/{self.bucket_uuid}"
         
         # Create the Basic Auth header from API key and secret
         auth_string = f"{api_key}:{api_secret}"
@@ -32,122 +50,325 @@ class ArweaveStorageClient:
             "Authorization": f"Basic {auth_bytes.decode('utf-8')}",
             "Content-Type": "application/json"
         }
-        print("ArweaveStorageClient (HTTP Direct) configured successfully.")
+        self.history_cache = history_cache
 
-    async def store_memory(self, user_id: str, message: str, response: str) -> None:
+        # Bucket listings are walked page by page, newest first.
+        self.page_size = int(os.getenv("APILLON_PAGE_SIZE", "100"))
+        self._trades_directory_uuid: Optional[str] = None
+
+        # One long-lived, pooled HTTP session is shared by all Apillon/Arweave
+        # traffic. It is opened on app startup (or lazily on first use).
+        self.connector_limit = int(os.getenv("APILLON_CONNECTION_LIMIT", "100"))
+        self.connector_limit_per_host = int(os.getenv("APILLON_CONNECTION_LIMIT_PER_HOST", "20"))
+        self.keepalive_timeout = float(os.getenv("APILLON_KEEPALIVE_TIMEOUT", "30"))
+        self.dns_cache_ttl = int(os.getenv("APILLON_DNS_CACHE_TTL", "300"))
+        self.request_timeout = float(os.getenv("APILLON_REQUEST_TIMEOUT", "30"))
+        self.connect_timeout = float(os.getenv("APILLON_CONNECT_TIMEOUT", "10"))
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._download_semaphore = asyncio.Semaphore(int(os.getenv("APILLON_DOWNLOAD_CONCURRENCY", "16")))
+        log.info("ArweaveStorageClient (HTTP Direct) configured successfully.")
+
+    async def start(self) -> None:
+        """Opens the shared HTTP session. Safe to call more than once."""
+        if self._session is not None and not self._session.closed:
+            return
+        aiohttp = await asyncio.to_thread(lazy_import, "aiohttp")
+        if self._session is not None and not self._session.closed:
+            return  # Opened by a concurrent caller while aiohttp was loading.
+        connector = aiohttp.TCPConnector(
+            limit=self.connector_limit,
+            limit_per_host=self.connector_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout, connect=self.connect_timeout)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        log.debug("Shared HTTP session opened.")
+
+    async def warmup(self) -> None:
         """
-        Stores a single trade record as a JSON file in the bucket.
-        Follows the three-step upload process: start, upload, end.
+        Opens the session and resolves the trades directory, so the first history
+        read does not pay for a new connection and an extra listing.
         """
-        print(f"ARWEAVE: Storing trade history for user {user_id}...")
-        payload = {
+        session = await self._get_session()
+        if not self._trades_directory_uuid:
+            self._trades_directory_uuid = await self._find_directory(session, TRADES_DIRECTORY)
+
+    async def close(self) -> None:
+        """Closes the shared HTTP session and its connection pool."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            log.debug("Shared HTTP session closed.")
+        self._session = None
+
+    async def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    @staticmethod
+    def new_record(user_id: str, message: str, response: str) -> Dict:
+        """Builds a trade record in the shape it is stored in the bucket."""
+        return {
+            "id": uuid.uuid4().hex,
             "user_id": user_id,
             "timestamp": int(time.time()),
             "message": message, # This will be "TRADE_EXECUTION"
             "response": response
         }
-        file_content = json.dumps(payload).encode('utf-8')
-        file_name = f"trade-{user_id}-{int(time.time())}.json"
-        
-        async with aiohttp.ClientSession() as session:
-            try:
-                # --- Step 1: Start the upload session ---
-                upload_start_data = {"files": [{"fileName": file_name, "contentType": "application/json"}]}
+
+    def record_key(self, record: Dict) -> str:
+        """Returns the bucket path + file name a record is (or will be) stored under."""
+        suffix = f"-{record['id'][:8]}" if record.get("id") else ""
+        return f"{self._user_prefix(record['user_id'])}trade-{record['user_id']}-{record['timestamp']}{suffix}.json"
+
+    async def store_memory(self, user_id: str, message: str, response: str) -> None:
+        """Stores a single trade record as a JSON file in the bucket."""
+        log.debug(f"Storing trade history for user {user_id}...")
+        await self.store_memories([self.new_record(user_id, message, response)])
+
+    async def store_memories(self, records: List[Dict]) -> None:
+        """
+        Stores a batch of trade records, one JSON file each, in a single upload session.
+        Follows the three-step upload process: start, upload, end.
+        """
+        if not records:
+            return
+        files = {}
+        for record in records:
+            file_path, file_name = self.record_key(record).rsplit("/", 1)
+            files[file_name] = (f"{file_path}/", record)
+
+        session = await self._get_session()
+        try:
+            # --- Step 1: Start one upload session for the whole batch ---
+            upload_start_data = {"files": [
+                {"fileName": file_name, "contentType": "application/json", "path": file_path}
+                for file_name, (file_path, _) in files.items()
+            ]}
+            with span("apillon", apillon_request_duration, step="upload_start"):
                 async with session.post(f"{self.base_url}/upload", headers=self.headers, json=upload_start_data) as resp:
                     resp.raise_for_status()
                     upload_details = await resp.json()
-                
-                session_uuid = upload_details['data']['sessionUuid']
-                file_to_upload = next((f for f in upload_details['data']['files'] if f['fileName'] == file_name), None)
 
-                if not file_to_upload:
-                    raise Exception("Failed to get upload URL for the file.")
-                
-                upload_url = file_to_upload['url']
+            session_uuid = upload_details['data']['sessionUuid']
+            upload_urls = {f['fileName']: f['url'] for f in upload_details['data']['files'] if f['fileName'] in files}
 
-                # --- Step 2: Upload the actual file content ---
-                async with session.put(upload_url, data=file_content) as upload_resp:
-                    upload_resp.raise_for_status()
+            if len(upload_urls) != len(files):
+                raise Exception("Failed to get upload URLs for all files.")
 
-                # --- Step 3: End the upload session ---
+            # --- Step 2: Upload the actual file contents concurrently ---
+            async def upload(file_name: str) -> None:
+                file_content = dumps(files[file_name][1])
+                with span("apillon", apillon_request_duration, step="upload_put"):
+                    async with session.put(upload_urls[file_name], data=file_content) as upload_resp:
+                        upload_resp.raise_for_status()
+
+            await asyncio.gather(*(upload(file_name) for file_name in files))
+
+            # --- Step 3: End the upload session ---
+            with span("apillon", apillon_request_duration, step="upload_end"):
                 async with session.post(f"{self.base_url}/upload/{session_uuid}/end", headers=self.headers) as end_resp:
                     end_resp.raise_for_status()
-                
-                print(f"ARWEAVE: Successfully stored trade history: {file_name}")
 
-            except aiohttp.ClientError as e:
-                print(f"ARWEAVE ERROR: Failed to store memory via API. Error: {e}")
-                raise
+            # Index the records right away so the next history lookup
+            # neither waits for Apillon to confirm them nor downloads them.
+            for file_name, (file_path, record) in files.items():
+                self.history_cache.add(record['user_id'], f"{file_path}{file_name}", record)
+            log.info(f"Successfully stored {len(files)} trade history file(s) in session {session_uuid}.")
+
+        except lazy_import("aiohttp").ClientError as e:
+            log.error(f"Failed to store memory via API. Error: {e}")
+            raise
 
     async def _download_and_parse_json(self, session, url: str) -> Dict:
-        """Helper to asynchronously download a file from a URL and parse it as JSON."""
+        """
+        Helper to asynchronously download a file from a URL and parse it as JSON.
+        The number of concurrent downloads is bounded by `APILLON_DOWNLOAD_CONCURRENCY`.
+        """
         try:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                return await response.json()
+            async with self._download_semaphore:
+                with span("apillon", apillon_request_duration, step="download"):
+                    async with session.get(url) as response:
+                        response.raise_for_status()
+                        return loads(await response.read())
         except Exception as e:
-            print(f"ARWEAVE ERROR: Failed to download or parse file from {url}: {e}")
+            log.warning(f"Failed to download or parse file from {url}: {e}")
             return None
 
+    @staticmethod
+    def _user_prefix(user_id: str) -> str:
+        return f"{TRADES_DIRECTORY}/{user_id}/"
+
+    @staticmethod
+    def _is_uploaded_file(item: Dict) -> bool:
+        # `fileStatus == 4` means the file is fully uploaded; pending files
+        # (fileStatus: 2) have no download `link` yet.
+        return item.get('type') == 2 and item.get('fileStatus') == 4 and 'link' in item
+
+    async def _iter_content(self, session, **params) -> AsyncGenerator[Dict, None]:
+        """
+        Walks `GET /content` page by page and yields items as each page arrives,
+        so callers can start work (or stop early) without waiting for the whole listing.
+        """
+        query = {key: str(value) for key, value in params.items() if value is not None}
+        page = 1
+        while True:
+            query.update(page=str(page), limit=str(self.page_size))
+            with span("apillon", apillon_request_duration, step="list_page"):
+                async with session.get(f"{self.base_url}/content", headers=self.headers, params=query) as resp:
+                    if not resp.ok:
+                        log.error(f"Apillon API error: status {resp.status}, Body: {await resp.text()}")
+                    resp.raise_for_status()
+                    data = (await resp.json()).get('data', {})
+
+            items = data.get('items', [])
+            for item in items:
+                yield item
+
+            total = data.get('total')
+            if len(items) < self.page_size or (total is not None and page * self.page_size >= total):
+                return
+            page += 1
+
+    async def _find_directory(self, session, name: str, parent_uuid: Optional[str] = None) -> Optional[str]:
+        """Returns the UUID of the directory called `name` under `parent_uuid` (or the bucket root)."""
+        async with aclosing(self._iter_content(session, directoryUuid=parent_uuid, search=name)) as items:
+            async for item in items:
+                if item.get('type') == 1 and item.get('name') == name:
+                    return item.get('uuid')
+        return None
+
+    async def _resolve_user_directory(self, session, user_id: str) -> Optional[str]:
+        if not self._trades_directory_uuid:
+            self._trades_directory_uuid = await self._find_directory(session, TRADES_DIRECTORY)
+            if not self._trades_directory_uuid:
+                return None
+        return await self._find_directory(session, user_id, self._trades_directory_uuid)
+
     async def get_memory(self, user_id: str) -> List[Dict]:
         """
         Retrieves and parses all completed trade history files for a user from the bucket.
+        Served from the in-process history cache while it is fresh; otherwise the user's
+        directory is listed newest-first down to the persisted cursor, and only files
+        that are not yet indexed are downloaded.
         """
-        print(f"ARWEAVE: Retrieving trade history for user {user_id}...")
-        async with aiohttp.ClientSession() as session:
-            try:
-                # --- Step 1: List all content in the bucket ---
-                async with session.get(f"{self.base_url}/content", headers=self.headers) as resp:
-                    if not resp.ok:
-                        print(f"APPILLON API ERROR: Status {resp.status}, Body: {await resp.text()}")
-                        return []
-                    bucket_content = await resp.json()
-                
-                items_from_api = bucket_content.get('data', {}).get('items', [])
-                if not items_from_api:
-                    print("ARWEAVE: No items found in the bucket.")
-                    return []
-                
-                print(f"ARWEAVE: Found {len(items_from_api)} total items in the bucket. Now filtering...")
-
-                # --- Step 2: Filter for the user's files that are CONFIRMED UPLOADED ---
-                #
-                # THIS IS THE FIX: We add two conditions:
-                # 1. `item.get('fileStatus') == 4` ensures the file is fully uploaded.
-                # 2. `'link' in item` is a safeguard to ensure the download link exists.
-                # This prevents the KeyError when a file is still pending (fileStatus: 2).
-                #
-                user_files = [
-                    item for item in items_from_api
-                    if (item.get('name', '').startswith(f"trade-{user_id}-") and
-                        item.get('type') == 2 and
-                        item.get('fileStatus') == 4 and # Check for "Uploaded" status
-                        'link' in item)                 # Ensure the link key exists
-                ]
-                
-                if not user_files:
-                    print(f"ARWEAVE: No completed trade history files found for user {user_id}.")
-                    return []
-
-                # --- Step 3: Concurrently download and parse all relevant files ---
-                tasks = [self._download_and_parse_json(session, f['link']) for f in user_files]
-                memory_items = [item for item in await asyncio.gather(*tasks) if item]
-
-                # --- Step 4: Sort memory by timestamp to maintain chronological order ---
-                memory_items.sort(key=lambda x: x.get('timestamp', 0))
-
-                print(f"ARWEAVE: Found and loaded {len(memory_items)} trade history entries.")
-                return memory_items
-            
-            except aiohttp.ClientError as e:
-                print(f"ARWEAVE ERROR: Failed to retrieve history via API. Error: {e}")
-                return []
-            except Exception as e:
-                # Catching the KeyError here for better logging, though the fix should prevent it.
-                print(f"ARWEAVE ERROR: An unexpected error occurred: {e}")
-                import traceback
-                traceback.print_exc()
-                return []
+        log.debug(f"Retrieving trade history for user {user_id}...")
+        cached = self.history_cache.get(user_id)
+        if cached is not None:
+            log.debug(f"Served {len(cached)} trade history entries from cache.")
+            return cached
+
+        # Bucket reads are shared between users; a user refreshing in a loop queues behind the others.
+        async with storage_scheduler.slot(user_id):
+            return await self._fetch_memory(user_id)
+
+    async def _fetch_memory(self, user_id: str) -> List[Dict]:
+        state = self.history_cache.listing_state(user_id)
+        known_files = self.history_cache.known_files(user_id)
+        downloads = {}
+
+        session = await self._get_session()
+
+        def schedule_download(file_key: str, item: Dict) -> None:
+            # Downloads start as soon as their page arrives, while the listing continues.
+            if file_key not in known_files and file_key not in downloads:
+                downloads[file_key] = asyncio.ensure_future(
+                    self._download_and_parse_json(session, item['link'])
+                )
+
+        try:
+            # --- Step 1: Walk the user's directory, newest first, down to the cursor ---
+            cursor = state["cursor"]
+            high_water_mark = None
+            directory_uuid = state["directory_uuid"] or await self._resolve_user_directory(session, user_id)
+            if directory_uuid:
+                listing = self._iter_content(
+                    session, directoryUuid=directory_uuid, orderBy="createTime", desc="true"
+                )
+                async with aclosing(listing) as items:
+                    async for item in items:
+                        created = item.get('createTime') or ""
+                        if cursor and created <= cursor:
+                            break
+                        if not self._is_uploaded_file(item):
+                            # The cursor may not move past a file that is still pending.
+                            high_water_mark = None
+                            continue
+                        if high_water_mark is None:
+                            high_water_mark = created
+                        schedule_download(f"{self._user_prefix(user_id)}{item['name']}", item)
+
+            # --- Step 2: Scan legacy flat `trade-<user>-<ts>.json` files once per user ---
+            if not state["legacy_scanned"]:
+                legacy_prefix = f"trade-{user_id}-"
+                async with aclosing(self._iter_content(session, search=legacy_prefix)) as items:
+                    async for item in items:
+                        if item.get('name', '').startswith(legacy_prefix) and self._is_uploaded_file(item):
+                            schedule_download(item['name'], item)
+
+            # --- Step 3: Collect the concurrent downloads and index them ---
+            keys = list(downloads)
+            downloaded = await asyncio.gather(*(downloads[key] for key in keys))
+            self.history_cache.merge(
+                user_id,
+                {key: item for key, item in zip(keys, downloaded) if item},
+                cursor=high_water_mark,
+                directory_uuid=directory_uuid,
+                legacy_scanned=True,
+            )
+            await self.history_cache.save(user_id)
+
+            # --- Step 4: The cache returns memory sorted by timestamp ---
+            memory_items = self.history_cache.records(user_id)
+
+            log.info(f"Downloaded {len(keys)} new files, {len(memory_items)} trade history entries in total.")
+            return memory_items
+
+        except lazy_import("aiohttp").ClientError as e:
+            log.error(f"Failed to retrieve history via API. Error: {e}")
+            # Fall back to whatever is already indexed for this user.
+            return self.history_cache.records(user_id)
+        except Exception as e:
+            log.exception(f"An unexpected error occurred: {e}")
+            return []
+        finally:
+            for task in downloads.values():
+                task.cancel()
+
+    async def get_all_trade_records(self) -> Tuple[Dict[str, Dict], Set[str]]:
+        """
+        Lists every trade file in the bucket (all user directories plus legacy flat files)
+        and downloads the uploaded ones. Used to rebuild the local ledger.
+        Returns ({file_key: record}, {file keys of all trade files, including pending ones}).
+        """
+        session = await self._get_session()
+        items = {}
+
+        trades_uuid = await self._find_directory(session, TRADES_DIRECTORY)
+        if trades_uuid:
+            async with aclosing(self._iter_content(session, directoryUuid=trades_uuid)) as user_dirs:
+                async for user_dir in user_dirs:
+                    if user_dir.get('type') != 1:
+                        continue
+                    prefix = f"{TRADES_DIRECTORY}/{user_dir['name']}/"
+                    async with aclosing(self._iter_content(session, directoryUuid=user_dir['uuid'])) as files:
+                        async for item in files:
+                            if item.get('type') == 2:
+                                items[f"{prefix}{item['name']}"] = item
+
+        async with aclosing(self._iter_content(session, search="trade-")) as files:
+            async for item in files:
+                if item.get('type') == 2 and item.get('name', '').startswith("trade-"):
+                    items[item['name']] = item
+
+        uploaded = [(key, item) for key, item in items.items() if self._is_uploaded_file(item)]
+        downloaded = await asyncio.gather(
+            *(self._download_and_parse_json(session, item['link']) for _, item in uploaded)
+        )
+        records = {key: record for (key, _), record in zip(uploaded, downloaded) if record}
+        log.info(f"Found {len(items)} trade files in the bucket, loaded {len(records)}.")
+        return records, set(items)
 
 # Create a single, shared instance that can be imported and used throughout the application
 storage_client = ArweaveStorageClient()
\ No newline at end of file
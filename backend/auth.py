@@ -1,21 +1,134 @@
 # /app/backend/auth.py
 import os
+import time
+import uuid
+import hashlib
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from jose import JWTError, jwt
+from typing import Optional, Tuple
+
+import jwt
+
+import shared_state
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "a_very_secret_key_for_dev_only")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+
+
+class VerifiedTokenCache:
+    """
+    A bounded LRU of tokens that already passed signature verification, keyed by
+    the token's SHA-256 digest. Entries never outlive the token's own `exp`.
+    """
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        # digest -> (exp as a unix timestamp, sub)
+        self._entries: "OrderedDict[bytes, Tuple[float, str]]" = OrderedDict()
+        self._next_sweep = 0.0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, digest: bytes) -> Optional[str]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        if time.time() >= entry[0]:
+            del self._entries[digest]
+            return None
+        self._entries.move_to_end(digest)
+        return entry[1]
+
+    def put(self, digest: bytes, exp: float, sub: str) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[digest] = (exp, sub)
+        self._entries.move_to_end(digest)
+        if len(self._entries) <= self.max_entries:
+            return
+        now = time.time()
+        if now >= self._next_sweep:
+            # Expired tokens go first; the sweep is rate-limited to keep inserts O(1) amortized.
+            for expired in [d for d, (entry_exp, _) in self._entries.items() if now >= entry_exp]:
+                del self._entries[expired]
+            self._next_sweep = now + 1.0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+token_cache = VerifiedTokenCache(max_entries=int(os.getenv("JWT_CACHE_SIZE", "10000")))
+
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "typ": "access"})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def verify_token(token: str):
+    """Returns the `sub` of a valid access token, or None. Verified tokens are cached until they expire."""
+    digest = token_cache.digest(token)
+    sub = token_cache.get(digest)
+    if sub is not None:
+        return sub
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
-    except JWTError:
-        return None
\ No newline at end of file
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp"]})
+    except jwt.PyJWTError:
+        return None
+    # Tokens issued before refresh tokens existed carry no `typ`; treat them as access tokens.
+    if payload.get("typ", "access") != "access" or not payload.get("sub"):
+        return None
+    token_cache.put(digest, payload["exp"], payload["sub"])
+    return payload["sub"]
+
+
+# --- Refresh tokens ---
+# Refresh tokens are single-use: each one is recorded in shared_state by its `jti`
+# and consumed when exchanged, so a stolen token stops working after one rotation.
+
+def _refresh_key(jti: str) -> str:
+    return f"refresh:{jti}"
+
+async def create_refresh_token(sub: str) -> str:
+    jti = uuid.uuid4().hex
+    ttl = REFRESH_TOKEN_EXPIRE_DAYS * 86400
+    expire = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    await shared_state.store.set(_refresh_key(jti), sub, ttl=ttl)
+    return jwt.encode({"sub": sub, "jti": jti, "exp": expire, "typ": "refresh"}, SECRET_KEY, algorithm=ALGORITHM)
+
+def _decode_refresh_token(token: str) -> Optional[dict]:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp", "jti", "sub"]})
+    except jwt.PyJWTError:
+        return None
+    return payload if payload.get("typ") == "refresh" else None
+
+async def rotate_refresh_token(token: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Exchanges a refresh token for (sub, new access token, new refresh token).
+    Returns None if the token is invalid, expired, revoked or was already used.
+    """
+    payload = _decode_refresh_token(token)
+    if payload is None:
+        return None
+    key = _refresh_key(payload["jti"])
+    if await shared_state.store.get(key) != payload["sub"]:
+        return None
+    # Consume the token. With Redis, two concurrent exchanges can both see the key
+    # before either deletes it; `incr` makes exactly one of them the winner.
+    if await shared_state.store.incr(f"{key}:used", ttl=REFRESH_TOKEN_EXPIRE_DAYS * 86400) != 1:
+        return None
+    await shared_state.store.delete(key)
+    sub = payload["sub"]
+    return sub, create_access_token({"sub": sub}), await create_refresh_token(sub)
+
+async def revoke_refresh_token(token: str) -> None:
+    payload = _decode_refresh_token(token)
+    if payload is not None:
+        await shared_state.store.delete(_refresh_key(payload["jti"]))
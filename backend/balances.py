@@ -0,0 +1,152 @@
+# /app/backend/balances.py
+
+# Server-side SNIP-20 balance and allowance queries, using the viewing keys the
+# user registered through /api/user/keys. Results are cached in shared_state for
+# a few seconds, so a burst of panel refreshes (or several workers) costs one
+# round of LCD queries, and dropped after a trade so the next read is fresh.
+
+import os
+import asyncio
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+import db
+import shade
+import shared_state
+from logger import get_logger
+from metrics import span
+
+log = get_logger(__name__)
+
+# token name -> (contract address, code hash, decimals, column holding the user's viewing key)
+TOKENS: Dict[str, Tuple[str, str, int, str]] = {
+    "sSCRT": (*shade.TOKENS["sSCRT"], 6, "sscrt_key"),
+    "sUSDC": (*shade.TOKENS["sUSDC"], 6, "susdc_key"),
+}
+
+
+def _format_amount(amount: str, decimals: int) -> str:
+    return format(Decimal(amount).scaleb(-decimals).normalize(), "f")
+
+
+class BalanceService:
+    """
+    Queries SNIP-20 balances and allowances through the agent's AsyncLCDClient.
+
+    - All queries for one user are issued together and run concurrently, bounded
+      by a process-wide semaphore so a traffic spike cannot flood the LCD node.
+    - Concurrent requests for the same user share one round of queries.
+    - Results are cached for `ttl_seconds` and invalidated after a trade is logged.
+    """
+    def __init__(self, ttl_seconds: float = 15.0, max_concurrency: int = 8, query_timeout: float = 10.0):
+        self.ttl_seconds = ttl_seconds
+        self.query_timeout = query_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _balances_key(user_id: str) -> str:
+        return f"balances:{user_id}"
+
+    @staticmethod
+    def _allowance_key(user_id: str, spender: str) -> str:
+        return f"allowance:{user_id}:{spender}"
+
+    async def _query(self, client, token: str, query: Dict) -> Optional[Dict]:
+        """Runs one contract query. Returns None if the query fails (e.g. a wrong viewing key)."""
+        contract_address, code_hash, _, _ = TOKENS[token]
+        try:
+            async with self._semaphore:
+                with span("snip20_query"):
+                    return await asyncio.wait_for(
+                        client.wasm.contract_query(contract_address, query, contract_code_hash=code_hash),
+                        timeout=self.query_timeout,
+                    )
+        except Exception as e:
+            log.warning(f"{token} query {next(iter(query))} failed: {e}")
+            return None
+
+    async def _balance(self, client, token: str, address: str, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        result = await self._query(client, token, {"balance": {"address": address, "key": key}})
+        amount = (result or {}).get("balance", {}).get("amount")
+        return _format_amount(amount, TOKENS[token][2]) if amount is not None else None
+
+    async def _fetch_balances(self, client, user_id: str) -> Dict[str, Optional[str]]:
+        user = await db.get_user(user_id) or {}
+        amounts = await asyncio.gather(*(
+            self._balance(client, token, user_id, user.get(key_column))
+            for token, (_, _, _, key_column) in TOKENS.items()
+        ))
+        return dict(zip(TOKENS, amounts))
+
+    async def get_balances(self, client, user_id: str) -> Dict[str, Optional[str]]:
+        """
+        Returns {"sSCRT": "1.5", "sUSDC": None, ...}. A token is None when the user has
+        not registered a viewing key for it or the key was rejected.
+        """
+        cache_key = self._balances_key(user_id)
+        cached = await shared_state.store.get(cache_key)
+        if cached is not None:
+            return cached
+
+        pending = self._in_flight.get(cache_key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = asyncio.ensure_future(self._fetch_balances(client, user_id))
+        self._in_flight[cache_key] = pending
+        try:
+            balances = await asyncio.shield(pending)
+        finally:
+            self._in_flight.pop(cache_key, None)
+        # Failed lookups are not cached, so a freshly added viewing key shows up right away.
+        if all(amount is not None for amount in balances.values()):
+            await shared_state.store.set(cache_key, balances, ttl=self.ttl_seconds)
+        return balances
+
+    async def check_allowed_to_spend(self, client, user_id: str, spender: str, amount: str,
+                                     token: str = "sUSDC") -> Dict:
+        """
+        Checks the SNIP-20 allowance the user has granted `spender` (the agent wallet)
+        against `amount` (in the token's base units).
+        """
+        cache_key = self._allowance_key(user_id, spender)
+        allowance = await shared_state.store.get(cache_key)
+        if allowance is None:
+            user = await db.get_user(user_id)
+            key = (user or {}).get(TOKENS[token][3])
+            if not key:
+                raise ValueError(f"No {token} viewing key is registered for this user.")
+            result = await self._query(client, token, {
+                "allowance": {"owner": user_id, "spender": spender, "key": key}
+            })
+            if result is None:
+                raise ValueError(f"Could not query the {token} allowance.")
+            allowance = result.get("allowance", {})
+            await shared_state.store.set(cache_key, allowance, ttl=self.ttl_seconds)
+
+        granted = allowance.get("allowance", "0")
+        decimals = TOKENS[token][2]
+        return {
+            "token": token,
+            "spender": spender,
+            "allowance": _format_amount(granted, decimals),
+            "required": _format_amount(amount, decimals),
+            "expiration": allowance.get("expiration"),
+            "allowed": int(granted) >= int(amount),
+        }
+
+    async def invalidate(self, user_id: str, spender: Optional[str] = None) -> None:
+        """Drops cached balances (and the allowance for `spender`) after a trade."""
+        await shared_state.store.delete(self._balances_key(user_id))
+        if spender:
+            await shared_state.store.delete(self._allowance_key(user_id, spender))
+
+
+balance_service = BalanceService(
+    ttl_seconds=float(os.getenv("BALANCE_CACHE_TTL", "15")),
+    max_concurrency=int(os.getenv("LCD_MAX_CONCURRENCY", "8")),
+    query_timeout=float(os.getenv("LCD_QUERY_TIMEOUT", "10")),
+)
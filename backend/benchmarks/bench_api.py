@@ -0,0 +1,325 @@
+# /app/backend/benchmarks/bench_api.py
+
+# End-to-end load test of the API. Starts the Ollama/Apillon/LCD stand-ins from
+# fake_services.py, runs `uvicorn main:app` against them with throwaway data
+# paths, logs in a set of virtual wallets (real ADR-036 signatures) and drives
+# each endpoint at a fixed concurrency. Reports p50/p95/p99 latency, chat TTFT
+# and throughput, and writes them to a JSON file tagged with the git commit.
+#
+#   python benchmarks/bench_api.py --requests 500 --concurrency 32 --users 50
+#   python benchmarks/bench_api.py --compare benchmarks/results/<earlier run>.json
+
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import socket
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from ecdsa import SECP256k1, SigningKey
+from ecdsa.util import sigencode_string_canonize
+
+from wallet_auth import adr036_sign_bytes, pubkey_to_address
+from fake_services import add_latency_arguments, services_from_args
+from report import compare_results, git_revision, latency_summary, save_results, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("login", "log_trade", "trade_history", "trade_stats", "chat")
+# Well-known BIP-39 test vector; the agent wallet never signs anything here.
+TEST_MNEMONIC = " ".join(["abandon"] * 11 + ["about"])
+
+
+class VirtualUser:
+    """A wallet with its own secp256k1 key that logs in the way Keplr's signArbitrary does."""
+    def __init__(self):
+        self.key = SigningKey.generate(curve=SECP256k1)
+        self.pubkey = self.key.get_verifying_key().to_string("compressed")
+        self.address = pubkey_to_address(self.pubkey)
+        self.token: Optional[str] = None
+
+    def login_payload(self, timestamp_ms: int) -> Dict:
+        message = f"Login to Secret Trading App\nTimestamp: {timestamp_ms}\nWallet: {self.address}"
+        digest = hashlib.sha256(adr036_sign_bytes(self.address, message)).digest()
+        signature = self.key.sign_digest_deterministic(digest, hashfunc=hashlib.sha256,
+                                                       sigencode=sigencode_string_canonize)
+        std_signature = {
+            "pub_key": {"type": "tendermint/PubKeySecp256k1", "value": base64.b64encode(self.pubkey).decode()},
+            "signature": base64.b64encode(signature).decode(),
+        }
+        return {"walletAddress": self.address, "timestamp": timestamp_ms,
+                "signature": base64.b64encode(json.dumps(std_signature).encode()).decode()}
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class PhaseResult:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.errors = 0
+        self.error_samples: List[str] = []
+        self.elapsed = 0.0
+
+    def summary(self) -> Dict:
+        result = summarize(self.latencies, self.errors, self.elapsed)
+        if self.ttfts:
+            result.update(latency_summary(self.ttfts, prefix="ttft_"))
+        if self.error_samples:
+            result["error_samples"] = self.error_samples
+        return result
+
+
+async def run_phase(total: int, concurrency: int, call: Callable[[int], Awaitable[Optional[float]]]) -> PhaseResult:
+    """Runs `call(i)` for i in range(total) on `concurrency` workers; a call may return its TTFT."""
+    result = PhaseResult()
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                first_byte = await call(i)
+            except Exception as e:
+                result.errors += 1
+                if len(result.error_samples) < 5:
+                    result.error_samples.append(str(e)[:200])
+                continue
+            result.latencies.append(time.perf_counter() - started)
+            if first_byte is not None:
+                result.ttfts.append(first_byte - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _check(response: httpx.Response) -> None:
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.url.path} returned {response.status_code}: {response.text[:120]}")
+
+
+class ApiBenchmark:
+    def __init__(self, client: httpx.AsyncClient, users: List[VirtualUser]):
+        self.client = client
+        self.users = users
+
+    async def login(self, user: VirtualUser, payload: Dict) -> None:
+        response = await self.client.post("/api/login", json=payload)
+        _check(response)
+        user.token = response.json()["data"]["token"]
+
+    async def log_in_everyone(self, concurrency: int) -> None:
+        now = int(time.time() * 1000)
+        payloads = [user.login_payload(now) for user in self.users]
+        result = await run_phase(len(self.users), concurrency, lambda i: self.login(self.users[i], payloads[i]))
+        if result.errors:
+            raise RuntimeError(f"{result.errors} virtual user(s) could not log in: {result.error_samples}")
+
+    async def phase(self, endpoint: str, total: int, concurrency: int) -> PhaseResult:
+        users = self.users
+        if endpoint == "login":
+            # Signed up front so signing does not count against the server; each
+            # (wallet, timestamp) pair is unique because the server rejects replays.
+            now = int(time.time() * 1000) - 1
+            payloads = [users[i % len(users)].login_payload(now - i // len(users)) for i in range(total)]
+            return await run_phase(total, concurrency, lambda i: self.login(users[i % len(users)], payloads[i]))
+
+        async def log_trade(i: int) -> None:
+            # The result text the frontend logs after broadcasting a swap.
+            trade_result = f"Trade successful! Hash: {uuid.uuid4().hex.upper()}"
+            response = await self.client.post("/api/log_trade", json={"trade_result": trade_result},
+                                              headers=users[i % len(users)].headers)
+            _check(response)
+
+        async def trade_history(i: int) -> None:
+            _check(await self.client.get("/api/user/trade_history", headers=users[i % len(users)].headers))
+
+        async def trade_stats(i: int) -> None:
+            _check(await self.client.get("/api/user/trade_stats", headers=users[i % len(users)].headers))
+
+        async def chat(i: int) -> float:
+            # Unique messages, so the response cache never short-circuits the LLM.
+            message = f"What do you think about sSCRT right now? ({uuid.uuid4().hex[:8]})"
+            first_byte = None
+            async with self.client.stream("POST", "/api/chat", json={"message": message},
+                                          headers=users[i % len(users)].headers) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                _check(response)
+                async for chunk in response.aiter_text():
+                    if chunk and first_byte is None:
+                        first_byte = time.perf_counter()
+            if first_byte is None:
+                raise RuntimeError("chat stream was empty")
+            return first_byte
+
+        calls = {"log_trade": log_trade, "trade_history": trade_history, "trade_stats": trade_stats, "chat": chat}
+        return await run_phase(total, concurrency, calls[endpoint])
+
+
+# --- Server under test ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _tail(path: str, lines: int = 30) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return "".join(f.readlines()[-lines:])
+
+
+async def start_server(env: Dict[str, str], port: int, workers: int, log_path: str,
+                       timeout: float = 60.0) -> Tuple[subprocess.Popen, Dict[str, float]]:
+    """Starts uvicorn and waits for /api/ready. Also returns the cold-start times (ms since spawn)."""
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--no-access-log", "--log-level", "warning"]
+    log_file = open(log_path, "w", encoding="utf-8")
+    spawned = time.monotonic()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    log_file.close()
+    deadline = spawned + timeout
+    startup: Dict[str, float] = {}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}:\n{_tail(log_path)}")
+            try:
+                status = (await client.get("/api/ready")).status_code
+                startup.setdefault("listening_ms", (time.monotonic() - spawned) * 1000)
+                if status == 200:
+                    startup["ready_ms"] = (time.monotonic() - spawned) * 1000
+                    return process, startup
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.02)
+    process.terminate()
+    raise RuntimeError(f"Server was not ready after {timeout:.0f}s:\n{_tail(log_path)}")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def server_env(base: Dict[str, str], data_dir: str, args: argparse.Namespace) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(base)
+    env.update({
+        "MNEMONIC": TEST_MNEMONIC,
+        "JWT_SECRET_KEY": uuid.uuid4().hex,
+        "DATABASE_URL": f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+        "LEDGER_PATH": os.path.join(data_dir, "trade_ledger.bin"),
+        "LEDGER_REPLICATION_CHECKPOINT": os.path.join(data_dir, "replication.json"),
+        "TRADE_HISTORY_STATE_DIR": os.path.join(data_dir, "history_state"),
+        "TRADE_HISTORY_SOURCE": args.trade_history_source,
+        "LOG_LEVEL": args.server_log_level,
+        # Virtual users send far more than any per-wallet quota allows.
+        "RATE_LIMIT_CHAT": "0",
+        "RATE_LIMIT_LOG_TRADE": "0",
+        "RATE_LIMIT_TRADE_HISTORY": "0",
+    })
+    if args.shared_state_url:
+        env["SHARED_STATE_URL"] = args.shared_state_url
+    else:
+        env.pop("SHARED_STATE_URL", None)
+    return env
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="API load test against local service stand-ins")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=32, help="virtual wallets")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"comma-separated subset of {', '.join(ENDPOINTS)}, run in this order")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--trade-history-source", choices=("ledger", "arweave"), default="ledger")
+    parser.add_argument("--shared-state-url", default=None, help="Redis URL; required for --workers > 1")
+    parser.add_argument("--server-log-level", default="WARNING")
+    parser.add_argument("--output", default=None, help="result file (default: benchmarks/results/)")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regression threshold for --compare")
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(sorted(unknown))}")
+
+    commit, dirty = git_revision()
+    results = {
+        "benchmark": "api",
+        "started_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "commit": commit,
+        "dirty": dirty,
+        "config": vars(args),
+        "endpoints": {},
+    }
+
+    services = services_from_args(args)
+    await services.start()
+    with tempfile.TemporaryDirectory(prefix="bench-api-") as data_dir:
+        port = _free_port()
+        env = server_env(services.env(llm_concurrency=max(args.concurrency, 4)), data_dir, args)
+        log_path = os.path.join(data_dir, "server.log")
+        process, results["startup"] = await start_server(env, port, args.workers, log_path)
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits,
+                                         timeout=httpx.Timeout(120.0)) as client:
+                bench = ApiBenchmark(client, [VirtualUser() for _ in range(args.users)])
+                await bench.log_in_everyone(args.concurrency)
+                for endpoint in endpoints:
+                    phase = await bench.phase(endpoint, args.requests, args.concurrency)
+                    results["endpoints"][endpoint] = phase.summary()
+                    print(f"{endpoint}: done in {phase.elapsed:.1f}s, {phase.errors} error(s)")
+        finally:
+            stop_server(process)
+            await services.stop()
+
+    print(f"\n{args.requests} requests per endpoint, concurrency {args.concurrency}, {args.users} users, "
+          f"{args.workers} worker(s), commit {commit}{' (dirty)' if dirty else ''}")
+    print(f"{'endpoint':<15}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttft p50':>10}{'ttft p95':>10}{'req/s':>9}{'errors':>8}")
+    for endpoint, stats in results["endpoints"].items():
+        ttft = (f"{stats['ttft_p50_ms']:>10.1f}{stats['ttft_p95_ms']:>10.1f}"
+                if "ttft_p50_ms" in stats else f"{'-':>10}{'-':>10}")
+        print(f"{endpoint:<15}{stats.get('p50_ms', 0):>9.1f}{stats.get('p95_ms', 0):>9.1f}{stats.get('p99_ms', 0):>9.1f}"
+              f"{ttft}{stats.get('throughput_rps', 0):>9.1f}{stats['errors']:>8}")
+
+    print(f"\ncold start: listening after {results['startup']['listening_ms']:.0f} ms, "
+          f"ready after {results['startup']['ready_ms']:.0f} ms")
+
+    path = save_results(results, args.output, name="bench_api")
+    print(f"\nResults written to {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressed = compare_results(baseline, results, args.threshold)
+        print("\n" + "\n".join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
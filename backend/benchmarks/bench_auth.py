@@ -0,0 +1,112 @@
+# /app/backend/benchmarks/bench_auth.py
+
+# Measures the cost of authenticating a request: raw verify_token throughput
+# (cold vs. cached) and per-request latency of a protected route vs. an open one
+# under concurrent load, served in-process through httpx's ASGI transport.
+#
+#   python benchmarks/bench_auth.py --requests 5000 --concurrency 64 --users 200
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+import auth
+from report import percentile
+
+
+def build_app() -> FastAPI:
+    """Two routes that differ only in the bearer-token dependency main.py uses."""
+    app = FastAPI()
+    scheme = HTTPBearer()
+
+    async def current_user(credentials: HTTPAuthorizationCredentials = Depends(scheme)):
+        user_id = auth.verify_token(credentials.credentials)
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        return user_id
+
+    @app.get("/open")
+    async def open_route():
+        return {"data": "ok"}
+
+    @app.get("/protected")
+    async def protected_route(user_id: str = Depends(current_user)):
+        return {"data": user_id}
+
+    return app
+
+
+def bench_verify(tokens, rounds: int) -> None:
+    for label, cached in (("cold", False), ("cached", True)):
+        auth.token_cache.clear()
+        if cached:
+            for token in tokens:
+                auth.verify_token(token)
+        started = time.perf_counter()
+        for i in range(rounds):
+            if not cached:
+                auth.token_cache.clear()
+            auth.verify_token(tokens[i % len(tokens)])
+        elapsed = time.perf_counter() - started
+        print(f"verify_token {label:>6}: {rounds / elapsed:>10.0f} ops/s  {elapsed / rounds * 1e6:7.1f} us/op")
+
+
+async def bench_http(app: FastAPI, path: str, tokens, total: int, concurrency: int):
+    latencies = []
+    counter = iter(range(total))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for i in counter:
+                headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} returned {response.status_code}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, total / elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Auth overhead benchmark")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--verify-rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    tokens = [auth.create_access_token({"sub": f"secret1benchuser{i:04d}"}) for i in range(args.users)]
+    bench_verify(tokens, args.verify_rounds)
+
+    app = build_app()
+    baseline, _ = await bench_http(app, "/open", tokens, args.requests, args.concurrency)
+    results = {"open": baseline}
+    for label, size in (("protected (no cache)", 0), ("protected (cached)", 10_000)):
+        auth.token_cache.clear()
+        auth.token_cache.max_entries = size
+        results[label], _ = await bench_http(app, "/protected", tokens, args.requests, args.concurrency)
+
+    print(f"\n{args.requests} requests, concurrency {args.concurrency}, {args.users} users")
+    print(f"{'route':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'overhead us':>13}")
+    base_mean = statistics.mean(baseline)
+    for label, samples in results.items():
+        overhead = (statistics.mean(samples) - base_mean) * 1e6
+        print(f"{label:<22}{percentile(samples, 0.50) * 1e3:>9.2f}{percentile(samples, 0.95) * 1e3:>9.2f}"
+              f"{percentile(samples, 0.99) * 1e3:>9.2f}{overhead:>13.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
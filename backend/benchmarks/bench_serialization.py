@@ -0,0 +1,179 @@
+# /app/backend/benchmarks/bench_serialization.py
+
+# Microbenchmark of the serialization paths: trade records as stdlib JSON,
+# orjson and msgpack (encode, decode, size), a ledger rebuilt and re-indexed in
+# each RECORD_FORMAT, and the response encodings of the polled endpoints
+# (FastAPI's jsonable_encoder + stdlib json, the orjson default response class,
+# and a typed response model serialized by pydantic-core).
+#
+#   python benchmarks/bench_serialization.py --records 10000 --history 1000
+
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import statistics
+import timeit
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import serialization
+from serialization import FastJSONResponse, decode_record, encode_record
+from ledger import TradeLedger
+from schemas import TradeHistoryResponse, TradeStatsResponse
+from trade_stats import columns_from_records, summarize
+from report import compare_results, git_revision, save_results
+
+
+def make_records(count: int, users: int = 200) -> List[Dict]:
+    """Trade records shaped like the ones /api/log_trade journals."""
+    rng = random.Random(7)
+    records = []
+    for i in range(count):
+        if rng.random() < 0.9:
+            response = f"Trade successful! Hash: {rng.getrandbits(256):064X}"
+        else:
+            response = f"On-chain error (code {rng.choice([5, 11, 13])}): out of gas in location: WriteFlat"
+        records.append({
+            "id": f"{rng.getrandbits(128):032x}",
+            "user_id": f"secret1{rng.randrange(users):038d}",
+            "timestamp": 1_760_000_000 + i * 60,
+            "message": "TRADE_EXECUTION",
+            "response": response,
+        })
+    return records
+
+
+def measure(fn: Callable[[], object], rounds: int) -> float:
+    """Median seconds per call over `rounds` timed calls (after one warm-up call)."""
+    fn()
+    return statistics.median(timeit.repeat(fn, number=1, repeat=rounds))
+
+
+def bench_records(records: List[Dict], rounds: int) -> Dict[str, Dict]:
+    codecs = {
+        "stdlib_json": (lambda r: json.dumps(r).encode("utf-8"), json.loads),
+        "orjson": (lambda r: encode_record(r, "json"), decode_record),
+    }
+    if serialization.msgpack is not None:
+        codecs["msgpack"] = (lambda r: encode_record(r, "msgpack"), decode_record)
+
+    results = {}
+    for name, (encode, decode) in codecs.items():
+        encoded = [encode(r) for r in records]
+        results[f"records_{name}"] = {
+            "encode_ms": round(measure(lambda: [encode(r) for r in records], rounds) * 1e3, 3),
+            "decode_ms": round(measure(lambda: [decode(e) for e in encoded], rounds) * 1e3, 3),
+            "bytes_per_record": round(sum(map(len, encoded)) / len(encoded), 1),
+        }
+    return results
+
+
+def bench_ledger(records: List[Dict], rounds: int) -> Dict[str, Dict]:
+    """Rebuilds a ledger in each format, then times opening (index scan) and reading every user."""
+    formats = ["json"] + (["msgpack"] if serialization.msgpack is not None else [])
+    users = sorted({r["user_id"] for r in records})
+    results = {}
+    default_format = serialization.RECORD_FORMAT
+    with tempfile.TemporaryDirectory(prefix="bench-serialization-") as data_dir:
+        for record_format in formats:
+            serialization.RECORD_FORMAT = record_format
+            ledger = TradeLedger(os.path.join(data_dir, f"ledger-{record_format}.bin"))
+            ledger.open()
+            ledger.rewrite(records)
+
+            def reopen():
+                ledger.close()
+                ledger.open()
+
+            results[f"ledger_{record_format}"] = {
+                "open_ms": round(measure(reopen, rounds) * 1e3, 3),
+                "read_all_users_ms": round(measure(lambda: [ledger.read_user(u) for u in users], rounds) * 1e3, 3),
+                "file_bytes": os.path.getsize(ledger.path),
+            }
+            ledger.close()
+    serialization.RECORD_FORMAT = default_format
+    return results
+
+
+def bench_responses(history: List[Dict], rounds: int) -> Dict[str, Dict]:
+    """One trade_history and one trade_stats response body, encoded the ways a route can produce it."""
+    columns = columns_from_records(history)
+    stats = {"user": summarize(*columns, trade_volume=0.3), "global": summarize(*columns, trade_volume=0.3)}
+    payloads = {
+        "trade_history": ({"data": history}, TypeAdapter(TradeHistoryResponse)),
+        "trade_stats": ({"data": stats}, TypeAdapter(TradeStatsResponse)),
+    }
+    results = {}
+    for name, (payload, adapter) in payloads.items():
+        def typed():
+            # What FastAPI does for a route with a response_model: validate, then dump JSON in pydantic-core.
+            return adapter.dump_json(adapter.validate_python(payload), by_alias=True)
+
+        results[f"response_{name}"] = {
+            "stdlib_encoder_ms": round(measure(lambda: JSONResponse(jsonable_encoder(payload)).body, rounds) * 1e3, 3),
+            "orjson_encoder_ms": round(measure(lambda: FastJSONResponse(jsonable_encoder(payload)).body, rounds) * 1e3, 3),
+            "typed_model_ms": round(measure(typed, rounds) * 1e3, 3),
+            "bytes": len(typed()),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serialization microbenchmark")
+    parser.add_argument("--records", type=int, default=10_000, help="records encoded and stored in the ledger")
+    parser.add_argument("--history", type=int, default=1_000, help="records in one trade_history response")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regression threshold for --compare")
+    args = parser.parse_args()
+
+    if serialization.orjson is None:
+        print("orjson is not installed; the 'orjson' rows measure the stdlib fallback.")
+    if serialization.msgpack is None:
+        print("msgpack is not installed; skipping the msgpack rows.")
+
+    records = make_records(args.records)
+    commit, dirty = git_revision()
+    results = {
+        "benchmark": "serialization",
+        "started_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "commit": commit,
+        "dirty": dirty,
+        "config": vars(args),
+        # Named like bench_api's sections so compare_results can diff them.
+        "endpoints": {
+            **bench_records(records, args.rounds),
+            **bench_ledger(records, args.rounds),
+            **bench_responses(make_records(args.history, users=1), args.rounds),
+        },
+    }
+
+    print(f"\n{args.records} records, {args.history}-record history response, median of {args.rounds} rounds "
+          f"(commit {commit}{' (dirty)' if dirty else ''})")
+    for case, stats in results["endpoints"].items():
+        print(f"{case:<26}" + "  ".join(f"{key}={value}" for key, value in stats.items()))
+
+    path = save_results(results, args.output, name="bench_serialization")
+    print(f"\nResults written to {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressed = compare_results(baseline, results, args.threshold)
+        print("\n" + "\n".join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
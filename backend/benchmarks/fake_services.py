@@ -0,0 +1,378 @@
+# /app/backend/benchmarks/fake_services.py
+
+# Local stand-ins for the remote services the backend talks to, so load tests
+# never touch the network:
+#
+#   - Ollama:  POST /api/chat (NDJSON streaming), GET /api/tags, POST /api/embed
+#   - Apillon: the bucket upload session (/upload, PUT file, /upload/<id>/end),
+#              GET /content listings and file downloads
+#   - LCD:     /registration/v1beta1/tx-key and encrypted /compute/v1beta1/query
+#              answering SNIP-20 balance/allowance and Shade get_pair_info
+#
+# Every service takes a Latency (base + uniform jitter, in seconds) applied per request;
+# the Ollama stand-in also paces tokens. Run standalone to point a dev server at them:
+#
+#   python benchmarks/fake_services.py --llm-ttft 0.3 --apillon-latency 0.05
+
+import os
+import sys
+import json
+import base64
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+import itertools
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from miscreant.aes.siv import SIV
+
+import shade
+
+
+class Latency(NamedTuple):
+    base: float = 0.0
+    jitter: float = 0.0
+
+    def sample(self) -> float:
+        return self.base + random.uniform(0.0, self.jitter)
+
+    async def wait(self) -> None:
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# --- Ollama ---
+
+def ollama_app(model: str = "bench-model", ttft: Latency = Latency(), token_latency: Latency = Latency(),
+               tokens: int = 40, embed_dim: int = 384) -> web.Application:
+    """Streams `tokens` words per chat, the first after `ttft` and each next one after `token_latency`."""
+    words = "the market looks steady today and a small position in sSCRT could make sense".split()
+
+    def message(content: str, done: bool) -> Dict:
+        body = {"model": model, "created_at": _now(), "message": {"role": "assistant", "content": content}, "done": done}
+        if done:
+            body.update(done_reason="stop", eval_count=tokens)
+        return body
+
+    async def chat(request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        reply = [f"{words[i % len(words)]} " for i in range(tokens)]
+        if not payload.get("stream", True):
+            await ttft.wait()
+            for _ in range(tokens - 1):
+                await token_latency.wait()
+            return web.json_response(message("".join(reply), True))
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        await ttft.wait()
+        for i, word in enumerate(reply):
+            if i:
+                await token_latency.wait()
+            await response.write((json.dumps(message(word, False)) + "\n").encode("utf-8"))
+        await response.write((json.dumps(message("", True)) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def tags(request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"model": model, "name": model, "modified_at": _now()}]})
+
+    async def embed(request: web.Request) -> web.Response:
+        payload = await request.json()
+        inputs = payload.get("input") or ""
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        await ttft.wait()
+        embeddings = []
+        for text in inputs:
+            # Deterministic per text, so identical prompts embed identically.
+            rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+            embeddings.append([rng.uniform(-1.0, 1.0) for _ in range(embed_dim)])
+        return web.json_response({"model": model, "embeddings": embeddings})
+
+    app = web.Application()
+    app.router.add_post("/api/chat", chat)
+    app.router.add_get("/api/tags", tags)
+    app.router.add_post("/api/embed", embed)
+    return app
+
+
+# --- Apillon ---
+
+class _ApillonBucket:
+    """An in-memory bucket: a directory tree of uploaded files, plus pending upload sessions."""
+    def __init__(self):
+        self.items: Dict[str, Dict] = {}  # uuid -> content item
+        self.bodies: Dict[str, bytes] = {}  # file uuid -> uploaded bytes
+        self.sessions: Dict[str, List[Dict]] = {}
+        self._ids = itertools.count(1)
+        self._clock = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def new_uuid(self, kind: str) -> str:
+        return f"{kind}-{next(self._ids):08d}"
+
+    def tick(self) -> str:
+        # Strictly increasing createTime, as the history cursor relies on ordering.
+        self._clock += timedelta(milliseconds=1)
+        return self._clock.isoformat()
+
+    def directory(self, path: str) -> Optional[str]:
+        """UUID of the directory at `path` ("a/b/"), creating missing levels."""
+        parent = None
+        for name in filter(None, path.split("/")):
+            found = next((uuid for uuid, item in self.items.items() if item["type"] == 1
+                          and item["name"] == name and item["directoryUuid"] == parent), None)
+            if found is None:
+                found = self.new_uuid("dir")
+                self.items[found] = {"uuid": found, "type": 1, "name": name, "directoryUuid": parent,
+                                     "createTime": self.tick()}
+            parent = found
+        return parent
+
+
+def apillon_app(latency: Latency = Latency()) -> web.Application:
+    bucket = _ApillonBucket()
+    prefix = "/storage/buckets/{bucket}"
+
+    async def upload_start(request: web.Request) -> web.Response:
+        await latency.wait()
+        files = (await request.json()).get("files", [])
+        session_uuid = bucket.new_uuid("session")
+        pending = []
+        for f in files:
+            file_uuid = bucket.new_uuid("file")
+            pending.append({"fileUuid": file_uuid, "fileName": f["fileName"], "path": f.get("path") or ""})
+        bucket.sessions[session_uuid] = pending
+        base = str(request.url.origin())
+        return web.json_response({"data": {
+            "sessionUuid": session_uuid,
+            "files": [{"fileName": p["fileName"], "fileUuid": p["fileUuid"], "url": f"{base}/files/{p['fileUuid']}"}
+                      for p in pending],
+        }})
+
+    async def put_file(request: web.Request) -> web.Response:
+        await latency.wait()
+        bucket.bodies[request.match_info["file"]] = await request.read()
+        return web.Response(status=200)
+
+    async def upload_end(request: web.Request) -> web.Response:
+        await latency.wait()
+        pending = bucket.sessions.pop(request.match_info["session"], None)
+        if pending is None:
+            return web.json_response({"message": "Upload session not found"}, status=404)
+        base = str(request.url.origin())
+        for p in pending:
+            uploaded = p["fileUuid"] in bucket.bodies
+            bucket.items[p["fileUuid"]] = {
+                "uuid": p["fileUuid"], "type": 2, "name": p["fileName"],
+                "directoryUuid": bucket.directory(p["path"]), "createTime": bucket.tick(),
+                "fileStatus": 4 if uploaded else 2,
+                **({"link": f"{base}/files/{p['fileUuid']}"} if uploaded else {}),
+            }
+        return web.json_response({"data": True})
+
+    async def content(request: web.Request) -> web.Response:
+        await latency.wait()
+        query = request.query
+        directory = query.get("directoryUuid")
+        search = query.get("search")
+        items = [item for item in bucket.items.values() if item["directoryUuid"] == directory
+                 and (not search or search in item["name"])]
+        if query.get("orderBy"):
+            items.sort(key=lambda item: item.get(query["orderBy"]) or "", reverse=query.get("desc") == "true")
+        page, limit = int(query.get("page", "1")), int(query.get("limit", "20"))
+        return web.json_response({"data": {"items": items[(page - 1) * limit:page * limit], "total": len(items)}})
+
+    async def get_file(request: web.Request) -> web.Response:
+        await latency.wait()
+        body = bucket.bodies.get(request.match_info["file"])
+        if body is None:
+            return web.Response(status=404)
+        return web.Response(body=body, content_type="application/json")
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_post(f"{prefix}/upload", upload_start)
+    app.router.add_post(f"{prefix}/upload/{{session}}/end", upload_end)
+    app.router.add_get(f"{prefix}/content", content)
+    app.router.add_put("/files/{file}", put_file)
+    app.router.add_get("/files/{file}", get_file)
+    return app
+
+
+# --- Secret LCD ---
+
+# Same HKDF salt as secret_sdk's EncryptionUtils.
+_HKDF_SALT = bytes.fromhex("000000000000000000024bead8df69990852c202db0e0097c1a12ea637d7e96d")
+
+
+def _pair_infos(reserve: int) -> Dict[str, Dict]:
+    """get_pair_info answers for the registered Shade routes, chained through stand-in tokens."""
+    infos = {}
+    for route in shade.ROUTES.values():
+        tokens = [shade.TOKENS[route.offer_token].address]
+        tokens += [f"bench-token-{pair.address[-6:]}" for pair in route.path[:-1]]
+        tokens.append(shade.TOKENS[route.ask_token].address)
+        for i, pair in enumerate(route.path):
+            infos[pair.address] = {"get_pair_info": {
+                "pair": [{"custom_token": {"contract_addr": tokens[i]}},
+                         {"custom_token": {"contract_addr": tokens[i + 1]}}],
+                "amount_0": str(reserve), "amount_1": str(reserve),
+                "fee_info": {"lp_fee": {"nom": 29, "denom": 10000}, "shade_dao_fee": {"nom": 1, "denom": 10000}},
+            }}
+    return infos
+
+
+def lcd_app(latency: Latency = Latency(), balance: int = 1_000_000_000, reserve: int = 10**12) -> web.Application:
+    """
+    Answers encrypted contract queries the way a Secret node does: the query is
+    decrypted with the consensus key, and the JSON answer is sealed back with
+    the same per-query key, so AsyncLCDClient.wasm.contract_query works unchanged.
+    """
+    consensus_key = X25519PrivateKey.generate()
+    consensus_pub = consensus_key.public_key().public_bytes(
+        encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+    )
+    pair_infos = _pair_infos(reserve)
+
+    def query_key(nonce: bytes, client_pub: bytes) -> bytes:
+        shared = consensus_key.exchange(X25519PublicKey.from_public_bytes(client_pub))
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=_HKDF_SALT, info=b"").derive(shared + nonce)
+
+    def answer(address: str, query: Dict) -> Optional[Dict]:
+        if "balance" in query:
+            return {"balance": {"amount": str(balance)}}
+        if "allowance" in query:
+            args = query["allowance"]
+            return {"allowance": {"owner": args.get("owner"), "spender": args.get("spender"),
+                                  "allowance": str(balance), "expiration": None}}
+        if "get_pair_info" in query and address in pair_infos:
+            return pair_infos[address]
+        return None
+
+    async def tx_key(request: web.Request) -> web.Response:
+        return web.json_response({"key": base64.b64encode(consensus_pub).decode("ascii")})
+
+    async def contract_query(request: web.Request) -> web.Response:
+        await latency.wait()
+        encrypted = base64.b64decode(request.query["query"])
+        nonce, client_pub, ciphertext = encrypted[:32], encrypted[32:64], encrypted[64:]
+        siv = SIV(query_key(nonce, client_pub))
+        plaintext = siv.open(ciphertext, [b""]).decode("utf-8")
+        result = answer(request.match_info["address"], json.loads(plaintext[64:]))  # strip the code hash
+        if result is None:
+            return web.json_response({"code": 3, "message": "query not supported by the stand-in LCD"}, status=400)
+        sealed = siv.seal(base64.b64encode(json.dumps(result).encode("utf-8")), [b""])
+        return web.json_response({"data": base64.b64encode(sealed).decode("ascii")})
+
+    app = web.Application()
+    app.router.add_get("/registration/v1beta1/tx-key", tx_key)
+    app.router.add_get("/compute/v1beta1/query/{address}", contract_query)
+    return app
+
+
+# --- Lifecycle ---
+
+class FakeServices:
+    """Runs the three stand-ins on local ports and knows the env vars that point the backend at them."""
+    def __init__(self, host: str = "127.0.0.1", llm_ttft: Latency = Latency(), llm_token_latency: Latency = Latency(),
+                 llm_tokens: int = 40, apillon_latency: Latency = Latency(), lcd_latency: Latency = Latency(),
+                 ports: Optional[Dict[str, int]] = None):
+        self.host = host
+        self.ports = ports or {}
+        self.apps = {
+            "ollama": ollama_app(ttft=llm_ttft, token_latency=llm_token_latency, tokens=llm_tokens),
+            "apillon": apillon_app(apillon_latency),
+            "lcd": lcd_app(lcd_latency),
+        }
+        self.urls: Dict[str, str] = {}
+        self._runners: List[web.AppRunner] = []
+
+    async def start(self) -> Dict[str, str]:
+        # The server under test drops in-flight streams when it shuts down; that is expected here.
+        logging.getLogger("aiohttp.server").setLevel(logging.CRITICAL)
+        for name, app in self.apps.items():
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, self.host, self.ports.get(name, 0)).start()
+            self._runners.append(runner)
+            host, port = runner.addresses[0][:2]
+            self.urls[name] = f"http://{host}:{port}"
+        return self.urls
+
+    async def stop(self) -> None:
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners.clear()
+
+    def env(self, model: str = "bench-model", llm_concurrency: int = 64) -> Dict[str, str]:
+        return {
+            "SECRET_AI_ENDPOINTS": f"{self.urls['ollama']}|{model}|{llm_concurrency}",
+            "SECRET_AI_API_KEY": "bench",
+            "LCD_URL": self.urls["lcd"],
+            "APILLON_API_URL": self.urls["apillon"],
+            "APILLON_API_KEY": "bench",
+            "APILLON_API_SECRET": "bench",
+            "APILLON_BUCKET_UUID": "bench-bucket",
+        }
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--llm-ttft", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--llm-token-latency", type=float, default=0.01, help="seconds between tokens")
+    parser.add_argument("--llm-tokens", type=int, default=40)
+    parser.add_argument("--apillon-latency", type=float, default=0.05)
+    parser.add_argument("--lcd-latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.25,
+                        help="uniform jitter added to every delay, as a fraction of it")
+
+
+def services_from_args(args: argparse.Namespace, ports: Optional[Dict[str, int]] = None) -> FakeServices:
+    def latency(base: float) -> Latency:
+        return Latency(base, base * args.jitter)
+
+    return FakeServices(
+        llm_ttft=latency(args.llm_ttft),
+        llm_token_latency=latency(args.llm_token_latency),
+        llm_tokens=args.llm_tokens,
+        apillon_latency=latency(args.apillon_latency),
+        lcd_latency=latency(args.lcd_latency),
+        ports=ports,
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Ollama, Apillon and LCD stand-ins")
+    add_latency_arguments(parser)
+    parser.add_argument("--ollama-port", type=int, default=11434)
+    parser.add_argument("--apillon-port", type=int, default=8701)
+    parser.add_argument("--lcd-port", type=int, default=1317)
+    args = parser.parse_args()
+
+    services = services_from_args(args, {"ollama": args.ollama_port, "apillon": args.apillon_port, "lcd": args.lcd_port})
+    await services.start()
+    for key, value in services.env().items():
+        print(f"export {key}='{value}'")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await services.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,89 @@
+# /app/backend/benchmarks/report.py
+
+# Shared helpers for the benchmarks: latency summaries, and JSON result files
+# tagged with the git revision so two runs can be compared across commits.
+
+import os
+import json
+import subprocess
+import statistics
+from typing import Dict, List, Optional, Sequence, Tuple
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(samples: Sequence[float], errors: int, elapsed: float, prefix: str = "") -> Dict[str, float]:
+    """p50/p95/p99/mean in milliseconds for `samples` (seconds), plus throughput over `elapsed`."""
+    if not samples:
+        return {"requests": errors, "errors": errors}
+    summary = {
+        "requests": len(samples) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    summary.update(latency_summary(samples, prefix))
+    return summary
+
+
+def latency_summary(samples: Sequence[float], prefix: str = "") -> Dict[str, float]:
+    return {
+        f"{prefix}p50_ms": round(percentile(samples, 0.50) * 1e3, 2),
+        f"{prefix}p95_ms": round(percentile(samples, 0.95) * 1e3, 2),
+        f"{prefix}p99_ms": round(percentile(samples, 0.99) * 1e3, 2),
+        f"{prefix}mean_ms": round(statistics.mean(samples) * 1e3, 2),
+    }
+
+
+def git_revision() -> Tuple[str, bool]:
+    """(short commit sha, whether the working tree has uncommitted changes)."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def save_results(results: Dict, path: Optional[str] = None, name: str = "bench") -> str:
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = results["started_at"].replace(":", "").replace("-", "")[:15]
+        path = os.path.join(RESULTS_DIR, f"{name}-{stamp}-{results['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = 0.10) -> Tuple[List[str], bool]:
+    """
+    Lines comparing every latency and throughput figure of two result files, and
+    whether any of them got worse by more than `threshold` (a fraction).
+    """
+    lines = [f"baseline {baseline.get('commit')} ({baseline.get('started_at')}) -> "
+             f"current {current.get('commit')} ({current.get('started_at')})"]
+    regressed = False
+    # Cold-start times (bench_api) are compared like one more endpoint.
+    sections = {**current.get("endpoints", {}), **({"startup": current["startup"]} if "startup" in current else {})}
+    baseline_sections = {**baseline.get("endpoints", {}), "startup": baseline.get("startup")}
+    for endpoint, stats in sections.items():
+        before = baseline_sections.get(endpoint)
+        if not before:
+            continue
+        for key, value in stats.items():
+            old = before.get(key)
+            if not (key.endswith("_ms") or key == "throughput_rps") or not old:
+                continue
+            change = (value - old) / old
+            # Latency regresses upwards, throughput downwards.
+            worse = change > threshold if key.endswith("_ms") else change < -threshold
+            regressed |= worse
+            lines.append(f"{endpoint:<14}{key:<18}{old:>10.2f}{value:>10.2f}{change:>+9.1%}{'  REGRESSION' if worse else ''}")
+    return lines, regressed
@@ -0,0 +1,293 @@
+# /app/backend/chat_transport.py
+
+# Structured chat streaming. A chat turn is a sequence of typed events produced
+# by TradingAgent.chat_events:
+#
+#   {"type": "token",  "content": "..."}
+#   {"type": "action", "action": "execute_trade", "message": "...", "trade_args": {...}}
+#   {"type": "error",  "message": "...", "code": "<optional: auth_expired, rate_limited>"}
+#   {"type": "done"}                          (added here, always last)
+#
+# They are delivered either as Server-Sent Events (POST /api/chat with
+# `Accept: text/event-stream`) or over a persistent WebSocket (/api/chat/ws)
+# that carries every turn of a chat session:
+#
+#   client -> server  {"type": "auth", "token": "<access token>"}   first, and again after a refresh
+#                     {"type": "message", "content": "...", "id": "<optional, echoed back>"}
+#                     {"type": "cancel"}                            stops the current turn
+#                     {"type": "ping"}
+#   server -> client  {"type": "ready", "user": "..."}, the turn events above, {"type": "pong"}
+#
+# If the client goes away (or cancels), the agent's event generator is closed,
+# which closes the upstream LLM stream and frees its slot.
+
+import os
+import math
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from auth import verify_token
+from logger import get_logger
+from metrics import chat_socket_connections, chat_streams
+from serialization import dumps
+
+log = get_logger(__name__)
+
+Event = Dict[str, Any]
+
+# Close code for sockets that fail to authenticate (4000-4999 are application-defined).
+WS_UNAUTHORIZED = 4401
+# Events buffered per turn before the agent is paused, and how long a client may
+# accept nothing before its stream is dropped.
+STREAM_BUFFER = int(os.getenv("CHAT_STREAM_BUFFER", "256"))
+STALL_TIMEOUT = float(os.getenv("CHAT_STREAM_STALL_TIMEOUT", "30"))
+
+
+def merge_tokens(events: List[Event]) -> List[Event]:
+    """Merges runs of adjacent token events into one, so a backlog goes out as a single frame."""
+    merged: List[Event] = []
+    for event in events:
+        if event["type"] == "token" and merged and merged[-1]["type"] == "token":
+            merged[-1] = {**merged[-1], "content": merged[-1]["content"] + event["content"]}
+        else:
+            merged.append(event)
+    return merged
+
+
+class StreamStalled(Exception):
+    """The client stopped accepting data for longer than the stall timeout."""
+
+
+class EventPump:
+    """
+    Moves one turn's events from the agent to a client with flow control.
+
+    The agent's generator runs in its own task and fills a bounded buffer while
+    the sender writes. Whatever accumulates during a slow write is sent next as
+    one merged frame, so a slow reader gets fewer, larger frames rather than
+    holding up generation. If the buffer fills anyway the producer waits
+    (backpressure), and a client that accepts nothing for `stall_timeout`
+    seconds is given up on. However the pump ends, the agent's generator is
+    closed, which cancels the upstream LLM request if it is still running.
+    """
+    def __init__(self, events: AsyncIterator[Event], max_buffer: int = STREAM_BUFFER,
+                 stall_timeout: float = STALL_TIMEOUT):
+        self.events = events
+        self.max_buffer = max_buffer
+        self.stall_timeout = stall_timeout
+
+    async def run(self, send: Callable[[Event], Awaitable[None]], tag: Optional[Dict[str, Any]] = None) -> None:
+        """Sends every event (with `tag`'s keys added) followed by `done`. Raises StreamStalled on a stuck client."""
+        queue: asyncio.Queue = asyncio.Queue(self.max_buffer)
+        end = object()
+
+        async def produce():
+            try:
+                async with aclosing(self.events) as events:
+                    async for event in events:
+                        await queue.put(event)
+            except Exception as e:
+                log.exception("Chat event producer failed")
+                await queue.put({"type": "error", "message": f"Sorry, I encountered an error: {e}"})
+            await queue.put(end)
+
+        async def deliver(event: Event) -> None:
+            try:
+                await asyncio.wait_for(send({**event, **tag} if tag else event), self.stall_timeout)
+            except asyncio.TimeoutError:
+                raise StreamStalled(f"Client accepted nothing for {self.stall_timeout:.0f}s.")
+
+        producer = asyncio.create_task(produce())
+        try:
+            finished = False
+            while not finished:
+                batch = [await queue.get()]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                finished = batch[-1] is end
+                for event in merge_tokens([e for e in batch if e is not end]):
+                    await deliver(event)
+            await deliver({"type": "done"})
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+
+def encode_sse(event: Event) -> bytes:
+    return b"event: " + event["type"].encode("utf-8") + b"\ndata: " + dumps(event) + b"\n\n"
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    Streams chat events as Server-Sent Events. Unlike a plain StreamingResponse
+    it watches for the client disconnecting and cancels the turn at once.
+    """
+    def __init__(self, events: AsyncIterator[Event], max_buffer: int = STREAM_BUFFER,
+                 stall_timeout: float = STALL_TIMEOUT):
+        super().__init__(events, media_type="text/event-stream",
+                         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        self.pump = EventPump(events, max_buffer=max_buffer, stall_timeout=stall_timeout)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        async def send_event(event: Event) -> None:
+            await send({"type": "http.response.body", "body": encode_sse(event), "more_body": True})
+
+        async def wait_for_disconnect() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        pumping = asyncio.create_task(self.pump.run(send_event))
+        watcher = asyncio.create_task(wait_for_disconnect())
+        await asyncio.wait({pumping, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        outcome = "completed"
+        if not pumping.done():
+            outcome = "disconnected"
+            pumping.cancel()
+        watcher.cancel()
+        try:
+            await pumping
+        except asyncio.CancelledError:
+            pass
+        except StreamStalled as e:
+            outcome = "stalled"
+            log.warning(str(e))
+        except OSError:
+            outcome = "disconnected"
+        chat_streams.inc(transport="sse", outcome=outcome)
+        if outcome == "completed":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class ChatSocketSession:
+    """
+    One chat WebSocket: authenticates once, then runs each incoming message as a
+    turn while still listening, so a `cancel` (or a disconnect) stops the turn
+    mid-stream. One turn runs at a time per socket.
+    """
+    def __init__(self, websocket: WebSocket, run_turn: Callable[[str, str], AsyncIterator[Event]],
+                 rate_limit: Optional[Callable[[str], Awaitable[float]]] = None, auth_timeout: float = 10.0,
+                 max_buffer: int = STREAM_BUFFER, stall_timeout: float = STALL_TIMEOUT):
+        self.websocket = websocket
+        self.run_turn = run_turn
+        # Returns 0 to admit a turn, or the seconds until the user's quota allows one.
+        self.rate_limit = rate_limit
+        self.auth_timeout = auth_timeout
+        self.max_buffer = max_buffer
+        self.stall_timeout = stall_timeout
+        self.token: Optional[str] = None
+        self.user_id: Optional[str] = None
+        self._turn: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, event: Event) -> None:
+        # The turn task and the receive loop (pongs, errors) both write to the socket.
+        async with self._send_lock:
+            await self.websocket.send_text(dumps(event).decode("utf-8"))
+
+    def _authenticate(self, message: Dict) -> bool:
+        user_id = verify_token(message.get("token") or "")
+        if user_id is None or (self.user_id is not None and user_id != self.user_id):
+            return False
+        self.token, self.user_id = message["token"], user_id
+        return True
+
+    async def serve(self) -> None:
+        await self.websocket.accept()
+        chat_socket_connections.inc()
+        try:
+            try:
+                first = await asyncio.wait_for(self.websocket.receive_json(), self.auth_timeout)
+            except (asyncio.TimeoutError, ValueError):
+                first = {}
+            if not isinstance(first, dict) or first.get("type") != "auth" or not self._authenticate(first):
+                await self.websocket.close(code=WS_UNAUTHORIZED, reason="Invalid or expired token")
+                return
+            await self.send({"type": "ready", "user": self.user_id})
+            await self._receive_loop()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            chat_socket_connections.dec()
+            await self._cancel_turn()
+
+    async def _receive_loop(self) -> None:
+        while True:
+            try:
+                message = await self.websocket.receive_json()
+            except ValueError:
+                await self.send({"type": "error", "message": "Messages must be JSON objects."})
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "message":
+                await self._start_turn(message)
+            elif kind == "cancel":
+                await self._cancel_turn()
+            elif kind == "auth":
+                # Clients re-authenticate on the same socket after refreshing their access token.
+                if not self._authenticate(message):
+                    await self.websocket.close(code=WS_UNAUTHORIZED, reason="Invalid or expired token")
+                    return
+                await self.send({"type": "ready", "user": self.user_id})
+            elif kind == "ping":
+                await self.send({"type": "pong"})
+            else:
+                await self.send({"type": "error", "message": f"Unknown message type: {kind}"})
+
+    async def _start_turn(self, message: Dict) -> None:
+        tag = {"id": message["id"]} if message.get("id") is not None else {}
+        content = message.get("content")
+
+        async def reject(error: Event) -> None:
+            # A turn that never starts still ends with `done`, so clients can wait on it.
+            await self.send({"type": "error", **error, **tag})
+            await self.send({"type": "done", **tag})
+
+        if self._turn is not None and not self._turn.done():
+            return await reject({"message": "A response is already streaming."})
+        if not isinstance(content, str) or not content.strip():
+            return await reject({"message": "A message is required."})
+        # The access token may have expired since the socket authenticated.
+        if verify_token(self.token) is None:
+            return await reject({"code": "auth_expired", "message": "Access token expired."})
+        if self.rate_limit is not None:
+            retry_after = await self.rate_limit(self.user_id)
+            if retry_after > 0:
+                return await reject({"code": "rate_limited", "retry_after": math.ceil(retry_after),
+                                     "message": "Too many requests. Please slow down."})
+        pump = EventPump(self.run_turn(self.user_id, content), self.max_buffer, self.stall_timeout)
+        self._turn = asyncio.create_task(self._run(pump, tag or None))
+
+    async def _run(self, pump: EventPump, tag: Optional[Dict]) -> None:
+        outcome = "completed"
+        try:
+            await pump.run(self.send, tag)
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except StreamStalled as e:
+            outcome = "stalled"
+            log.warning(str(e))
+            await self.websocket.close(code=1013, reason="Client is not reading")
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            outcome = "disconnected"
+        finally:
+            chat_streams.inc(transport="websocket", outcome=outcome)
+
+    async def _cancel_turn(self) -> None:
+        turn, self._turn = self._turn, None
+        if turn is None or turn.done():
+            return
+        turn.cancel()
+        await asyncio.gather(turn, return_exceptions=True)
+        try:
+            await self.send({"type": "done", "cancelled": True})
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            pass
+
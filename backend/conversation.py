@@ -0,0 +1,123 @@
+# /app/backend/conversation.py
+
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import shared_state
+from prompts import SYSTEM_PROMPT
+from logger import get_logger
+
+log = get_logger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """A cheap token estimate (~4 characters per token) used for context budgeting."""
+    return len(text) // 4 + 1
+
+
+class ConversationStore:
+    """
+    Server-side chat history per user, kept in the shared state store.
+
+    The context sent to the LLM is: the fixed system prompt, a rolling summary of
+    older turns, and the most recent turns verbatim, trimmed to a token budget.
+    Older turns are folded into the summary in chunks, after a response has been
+    streamed, so the summary (and therefore the prompt prefix the upstream can
+    cache) only changes every few turns. Updates take a short store-level lock,
+    so concurrent turns on any worker do not overwrite each other.
+    """
+    def __init__(self, recent_messages: int = 8, fold_chunk: int = 4,
+                 token_budget: int = 3000, ttl_seconds: float = 24 * 3600):
+        self.recent_messages = recent_messages
+        self.fold_chunk = fold_chunk
+        self.token_budget = token_budget
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"conversation:{user_id}"
+
+    async def load(self, user_id: str) -> Dict:
+        conversation = await shared_state.store.get(self._key(user_id))
+        return conversation or {"summary": "", "turns": []}
+
+    async def _save(self, user_id: str, conversation: Dict) -> None:
+        await shared_state.store.set(self._key(user_id), conversation, ttl=self.ttl_seconds)
+
+    async def reset(self, user_id: str) -> None:
+        await shared_state.store.delete(self._key(user_id))
+
+    async def seed(self, user_id: str, messages: List[Dict]) -> None:
+        """Adopts a client-sent transcript when the server has no history for the user yet."""
+        conversation = await self.load(user_id)
+        if conversation["turns"] or conversation["summary"] or not messages:
+            return
+        conversation["turns"] = [
+            {"role": m["role"], "content": m["content"]}
+            for m in messages if m.get("role") in ("user", "assistant")
+        ]
+        await self._save(user_id, conversation)
+
+    def build_context(self, conversation: Dict, new_message: Dict) -> List[Dict]:
+        """Returns the message list for the LLM, within the token budget."""
+        prefix = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if conversation["summary"]:
+            prefix.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{conversation['summary']}",
+            })
+
+        budget = self.token_budget - sum(estimate_tokens(m["content"]) for m in prefix)
+        budget -= estimate_tokens(new_message["content"])
+        recent: List[Dict] = []
+        for turn in reversed(conversation["turns"][-self.recent_messages:]):
+            cost = estimate_tokens(turn["content"])
+            if cost > budget:
+                break
+            recent.insert(0, turn)
+            budget -= cost
+        return [*prefix, *recent, new_message]
+
+    async def record(self, user_id: str, turns: List[Dict],
+                     summarize: Optional[Callable[[str, List[Dict]], Awaitable[str]]] = None) -> None:
+        """
+        Appends finished turns and, once enough turns have fallen out of the recent
+        window, folds them into the summary with `summarize(previous_summary, turns)`.
+        The turns are saved before the summary is generated, so the next message
+        already sees them; the lock is not held while the LLM summarizes.
+        """
+        key = self._key(user_id)
+        async with shared_state.store.lock(key):
+            conversation = await self.load(user_id)
+            conversation["turns"].extend(turns)
+            overflow = len(conversation["turns"]) - self.recent_messages
+            folded = conversation["turns"][:overflow] if overflow >= self.fold_chunk else []
+            if folded and summarize is None:
+                conversation["turns"] = conversation["turns"][overflow:]
+            await self._save(user_id, conversation)
+        if not folded or summarize is None:
+            return
+
+        try:
+            summary = await summarize(conversation["summary"], folded)
+        except Exception as e:
+            # Without a fresh summary the folded turns are simply dropped.
+            log.warning(f"Failed to summarize history for {user_id}: {e}")
+            summary = conversation["summary"]
+
+        async with shared_state.store.lock(key):
+            conversation = await self.load(user_id)
+            # Skip if another turn already folded these (or the history was reset meanwhile).
+            if conversation["turns"][:len(folded)] != folded:
+                return
+            conversation["summary"] = summary
+            conversation["turns"] = conversation["turns"][len(folded):]
+            await self._save(user_id, conversation)
+
+
+conversation_store = ConversationStore(
+    recent_messages=int(os.getenv("CHAT_RECENT_MESSAGES", "8")),
+    fold_chunk=int(os.getenv("CHAT_SUMMARY_FOLD_CHUNK", "4")),
+    token_budget=int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "3000")),
+    ttl_seconds=float(os.getenv("CHAT_HISTORY_TTL", str(24 * 3600))),
+)
@@ -9,7 +9,16 @@ echo "Starting Next.js server on port 3000..."
 node server.js &
 
 # Start the Python backend in the foreground
-echo "Starting Python backend on port 8000..."
+# WEB_CONCURRENCY sets the number of uvicorn worker processes (default: 1).
+# More than one worker requires SHARED_STATE_URL (Redis): refresh tokens,
+# conversations, wallet login nonces, caches and rate limits all live in the
+# shared state store, and a per-process store would split them between workers.
+WORKERS="${WEB_CONCURRENCY:-1}"
+if [ "${WORKERS}" -gt 1 ] && [ -z "${SHARED_STATE_URL}" ]; then
+    echo "WEB_CONCURRENCY=${WORKERS} requires SHARED_STATE_URL (Redis); refusing to start." >&2
+    exit 1
+fi
+echo "Starting Python backend on port 8000 with ${WORKERS} worker(s)..."
 # The 'exec' command here is important. It replaces the shell process with the uvicorn process,
 # which allows Docker to correctly handle signals like stopping the container.
-exec uvicorn main:app --host 0.0.0.0 --port 8000 --app-dir /app/backend
\ No newline at end of file
+exec uvicorn main:app --host 0.0.0.0 --port 8000 --app-dir /app/backend --workers "${WORKERS}"
\ No newline at end of file
@@ -0,0 +1,191 @@
+# /app/backend/history_cache.py
+
+import os
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+from logger import get_logger
+from serialization import dumps, loads
+
+log = get_logger(__name__)
+
+
+class TradeHistoryCache:
+    """
+    An in-process index of trade history records, keyed by user.
+
+    Each user entry maps a bucket file key to its parsed record, so a refresh
+    only has to download files that have not been seen before. Entries expire
+    after a TTL (forcing an incremental re-list of the bucket) and the least
+    recently used users are evicted once `max_users` is reached.
+
+    Alongside the records, each entry keeps the listing state for the user: the
+    high-water mark (`cursor`) of the newest bucket item already indexed, the
+    UUID of the user's directory and whether the legacy flat files were scanned.
+    Each user's entry is persisted to its own file under `state_dir`, rewritten
+    only when that entry changed, and read back the first time the user is seen
+    after a restart or an eviction. So the cursor stays valid across both, and
+    nothing is read at startup.
+    """
+    def __init__(self, ttl_seconds: float = 60.0, max_users: int = 1024, state_dir: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.state_dir = state_dir
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+
+    @staticmethod
+    def _new_entry() -> Dict:
+        # A new entry has never been refreshed from the bucket, so it is
+        # not considered fresh until `merge` has been called for it.
+        return {
+            "records": {},
+            "refreshed_at": 0.0,
+            "cursor": None,
+            "directory_uuid": None,
+            "legacy_scanned": False,
+            # Changed since it was last persisted.
+            "dirty": False,
+        }
+
+    def _insert(self, user_id: str, entry: Dict) -> None:
+        self._entries[user_id] = entry
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def _lookup(self, user_id: str) -> Optional[Dict]:
+        """The user's entry, restored from their state file if it is not in memory."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._load(user_id)
+            if entry is not None:
+                self._insert(user_id, entry)
+        return entry
+
+    def _entry(self, user_id: str) -> Dict:
+        entry = self._lookup(user_id)
+        if entry is None:
+            entry = self._new_entry()
+            self._insert(user_id, entry)
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def get(self, user_id: str) -> Optional[List[Dict]]:
+        """Returns the user's records if the entry is fresh, otherwise None."""
+        entry = self._entries.get(user_id)
+        if entry is None or time.monotonic() - entry["refreshed_at"] > self.ttl_seconds:
+            return None
+        self._entries.move_to_end(user_id)
+        return self.records(user_id)
+
+    def records(self, user_id: str) -> List[Dict]:
+        """Returns all known records for a user in chronological order."""
+        entry = self._lookup(user_id)
+        if entry is None:
+            return []
+        items = list(entry["records"].values())
+        items.sort(key=lambda x: x.get('timestamp', 0))
+        return items
+
+    def known_files(self, user_id: str) -> Set[str]:
+        entry = self._lookup(user_id)
+        return set(entry["records"]) if entry else set()
+
+    def listing_state(self, user_id: str) -> Dict[str, Any]:
+        """Returns the cursor, directory UUID and legacy scan flag for a user."""
+        entry = self._lookup(user_id) or self._new_entry()
+        return {
+            "cursor": entry["cursor"],
+            "directory_uuid": entry["directory_uuid"],
+            "legacy_scanned": entry["legacy_scanned"],
+        }
+
+    def add(self, user_id: str, file_key: str, record: Dict) -> None:
+        """Indexes a single record, e.g. one that was just written by `store_memory`."""
+        entry = self._entry(user_id)
+        entry["records"][file_key] = record
+        entry["dirty"] = True
+
+    def merge(self, user_id: str, records: Dict[str, Dict], **listing_state) -> None:
+        """
+        Indexes records fetched from the bucket, updates the listing state
+        (`cursor`, `directory_uuid`, `legacy_scanned`) and marks the entry as fresh.
+        """
+        entry = self._entry(user_id)
+        if records:
+            entry["records"].update(records)
+            entry["dirty"] = True
+        for key, value in listing_state.items():
+            if key in ("cursor", "directory_uuid", "legacy_scanned") and value is not None and entry[key] != value:
+                entry[key] = value
+                entry["dirty"] = True
+        entry["refreshed_at"] = time.monotonic()
+
+    def invalidate(self, user_id: str) -> None:
+        self._entries.pop(user_id, None)
+
+    def _user_path(self, user_id: str) -> str:
+        # Hashed, so any user id makes a safe file name; the id itself is stored inside.
+        return os.path.join(self.state_dir, f"{hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:32]}.json")
+
+    def _load(self, user_id: str) -> Optional[Dict]:
+        """Reads one user's persisted entry, if there is one. A restored entry starts out stale."""
+        if not self.state_dir:
+            return None
+        path = self._user_path(user_id)
+        try:
+            with open(path, "rb") as f:
+                saved = loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log.warning(f"Ignoring unreadable state file {path}: {e}")
+            return None
+        if saved.get("user_id") != user_id:
+            return None
+        entry = self._new_entry()
+        entry["records"] = saved.get("records", {})
+        entry["cursor"] = saved.get("cursor")
+        entry["directory_uuid"] = saved.get("directory_uuid")
+        entry["legacy_scanned"] = saved.get("legacy_scanned", False)
+        return entry
+
+    def _snapshot(self, user_id: str, entry: Dict) -> Dict:
+        return {
+            "user_id": user_id,
+            "records": dict(entry["records"]),
+            "cursor": entry["cursor"],
+            "directory_uuid": entry["directory_uuid"],
+            "legacy_scanned": entry["legacy_scanned"],
+        }
+
+    def _write(self, path: str, snapshot: Dict) -> None:
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(dumps(snapshot))
+        os.replace(tmp_path, path)
+
+    async def save(self, user_id: str) -> None:
+        """
+        Atomically persists one user's entry, if it changed since the last save.
+        The snapshot is taken on the event loop; the file is written in a thread.
+        """
+        entry = self._entries.get(user_id)
+        if not self.state_dir or entry is None or not entry["dirty"]:
+            return
+        entry["dirty"] = False
+        try:
+            await asyncio.to_thread(self._write, self._user_path(user_id), self._snapshot(user_id, entry))
+        except OSError:
+            entry["dirty"] = True
+            raise
+
+
+history_cache = TradeHistoryCache(
+    ttl_seconds=float(os.getenv("TRADE_HISTORY_CACHE_TTL", "60")),
+    max_users=int(os.getenv("TRADE_HISTORY_CACHE_MAX_USERS", "1024")),
+    state_dir=os.getenv("TRADE_HISTORY_STATE_DIR", os.path.join(os.path.dirname(__file__), "data", "history_state")),
+)
@@ -0,0 +1,314 @@
+# /app/backend/ledger.py
+
+import os
+import sys
+import mmap
+import fcntl
+import struct
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from logger import get_logger
+from serialization import decode_record, encode_record
+
+log = get_logger(__name__)
+
+# Every record is framed as a 4-byte big-endian payload length followed by the
+# encoded record (JSON, or msgpack with RECORD_FORMAT=msgpack; see serialization).
+# The file is only ever appended to (or rebuilt whole by `reconcile`), so an
+# offset into it identifies a record forever.
+_HEADER = struct.Struct(">I")
+
+
+class TradeLedger:
+    """
+    An append-only, length-prefixed trade record file that is the primary store for
+    trade history. A per-user offset index is built when the file is opened, and
+    reads slice records straight out of a read-only memory map of the file.
+
+    Several worker processes may share one ledger file: appends and rebuilds hold an
+    exclusive `flock` on the current file (re-opening it first if another process
+    replaced it), and every process indexes records appended by the others (or a
+    file rebuilt by `reconcile`) before it serves a read.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._index: Dict[str, List[Tuple[int, int]]] = {}
+        self._size = 0
+        self._fd: Optional[int] = None
+        self._mmap: Optional[mmap.mmap] = None
+        # Bumped whenever the file is (re)opened, e.g. after `reconcile` rebuilt it, so
+        # readers that follow the ledger by offset know to start over.
+        self.generation = 0
+        # Guards the index and the map against the worker threads that append.
+        self._lock = threading.RLock()
+
+    @property
+    def size(self) -> int:
+        """The offset just past the last complete record."""
+        return self._size
+
+    def open(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            self._index = {}
+            self._size = 0
+            self.generation += 1
+            with self._file_lock():
+                self._catch_up()
+                file_size = os.fstat(self._fd).st_size
+                if file_size > self._size:
+                    # No other process is mid-append while we hold the file lock, so this
+                    # is a torn record from a crash; it was never acknowledged, so drop it.
+                    log.warning(f"Truncating {file_size - self._size} trailing byte(s) of a partial record.")
+                    self._close_mmap()
+                    os.ftruncate(self._fd, self._size)
+                    self._remap()
+            log.info(f"Opened {self.path} with {sum(len(v) for v in self._index.values())} record(s).")
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_mmap()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    @contextmanager
+    def _file_lock(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _replaced(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._fd).st_ino
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def _current_file_lock(self):
+        """
+        Holds the file lock on the ledger file currently at `path`. A process that
+        rebuilt the ledger swapped in a new file while we waited for the lock on the
+        old one, so the lock is re-taken on the new file until they agree.
+        Call with `_lock` held.
+        """
+        if self._fd is None:
+            self.open()
+        while True:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            if not self._replaced():
+                break
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self.close()
+            self.open()
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _close_mmap(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _remap(self) -> None:
+        self._close_mmap()
+        if os.fstat(self._fd).st_size > 0:
+            self._mmap = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+
+    def _view(self, end: int) -> mmap.mmap:
+        # The map is only re-created when a read reaches past its current length.
+        if self._mmap is None or len(self._mmap) < end:
+            self._remap()
+        return self._mmap
+
+    def _scan(self, offset: int):
+        """Yields (offset, framed_length, record) for every complete record from `offset`."""
+        if self._mmap is None:
+            return
+        # Exhaust the generator: the map cannot be closed while the view is alive.
+        with memoryview(self._mmap) as view:
+            end = len(view)
+            while offset + _HEADER.size <= end:
+                (length,) = _HEADER.unpack_from(view, offset)
+                start = offset + _HEADER.size
+                if start + length > end:
+                    return
+                try:
+                    record = decode_record(view[start:start + length])
+                except ValueError:
+                    return
+                yield offset, _HEADER.size + length, record
+                offset = start + length
+
+    def _catch_up(self) -> None:
+        """Indexes complete records that were appended past `size`, e.g. by another worker."""
+        if os.fstat(self._fd).st_size <= self._size:
+            return
+        self._remap()
+        for offset, length, record in self._scan(self._size):
+            self._index.setdefault(record["user_id"], []).append((offset, length))
+            self._size = offset + length
+
+    def refresh(self) -> None:
+        """Picks up records appended by other processes, or a ledger rebuilt by `reconcile`."""
+        with self._lock:
+            if self._replaced():
+                self.close()
+                self.open()
+            else:
+                self._catch_up()
+
+    def append(self, record: Dict) -> int:
+        """
+        Durably appends a record and indexes it. Returns the offset just past it.
+        Blocking; call it from a worker thread on the event loop.
+        """
+        payload = encode_record(record)
+        frame = _HEADER.pack(len(payload)) + payload
+        with self._lock, self._current_file_lock():
+            self._catch_up()
+            offset = self._size
+            os.write(self._fd, frame)
+            os.fsync(self._fd)
+            self._size = offset + len(frame)
+            self._index.setdefault(record["user_id"], []).append((offset, len(frame)))
+            return self._size
+
+    def read_user(self, user_id: str) -> List[Dict]:
+        """
+        Returns all of a user's records in append order: one index lookup, then each
+        record is decoded straight from a memoryview slice of the map, without copying.
+        """
+        with self._lock:
+            self.refresh()
+            entries = self._index.get(user_id)
+            if not entries:
+                return []
+            last_offset, last_length = entries[-1]
+            # Released before the lock is, so a later remap can close the map.
+            with memoryview(self._view(last_offset + last_length)) as view:
+                return [
+                    decode_record(view[offset + _HEADER.size:offset + length])
+                    for offset, length in entries
+                ]
+
+    def read_from(self, offset: int) -> List[Tuple[int, Dict]]:
+        """Returns (end_offset, record) for every record appended at or after `offset`."""
+        with self._lock:
+            self.refresh()
+            self._view(self._size)
+            return [(start + length, record) for start, length, record in self._scan(offset)]
+
+    def rebuild(self, build: Callable[[List[Dict]], List[Dict]]) -> List[int]:
+        """
+        Atomically replaces the ledger with `build(current records)` and re-opens it.
+        The file lock is held from reading the current records until the new file is
+        in place, so no append (from any process) can fall in between and be lost.
+        Returns the end offset of each new record.
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        end_offsets = []
+        offset = 0
+        with self._lock:
+            with self._current_file_lock():
+                self._catch_up()
+                self._view(self._size)
+                records = build([record for _, _, record in self._scan(0)])
+                with open(tmp_path, "wb") as f:
+                    for record in records:
+                        payload = encode_record(record)
+                        f.write(_HEADER.pack(len(payload)) + payload)
+                        offset += _HEADER.size + len(payload)
+                        end_offsets.append(offset)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            self.close()
+            self.open()
+        return end_offsets
+
+    def rewrite(self, records: List[Dict]) -> List[int]:
+        """Atomically replaces the ledger with `records`, in order. See `rebuild`."""
+        return self.rebuild(lambda _: records)
+
+ledger = TradeLedger(
+    os.getenv("LEDGER_PATH", os.path.join(os.path.dirname(__file__), "data", "trade_ledger.bin"))
+)
+
+
+async def reconcile() -> None:
+    """
+    Rebuilds the ledger from the Apillon bucket. Every trade file in the bucket ends
+    up in the ledger, marked as replicated; local records that never reached the
+    bucket are kept after them and left for the replication queue to upload.
+    The caller must hold the replication lock (see TradeLogQueue), so the flusher
+    is not uploading meanwhile. Records appended while the bucket is listed are kept.
+    """
+    from arweave_storage import storage_client
+    from trade_journal import trade_log_queue
+
+    await asyncio.to_thread(ledger.open)
+    bucket_records, bucket_keys = await storage_client.get_all_trade_records()
+    counts = {}
+
+    def merge(local_records: List[Dict]) -> List[Dict]:
+        # Runs under the ledger's file lock, on the records present at the swap.
+        merged = dict(bucket_records)
+        local_unreplicated = []
+        for record in local_records:
+            key = storage_client.record_key(record)
+            if key in bucket_keys:
+                # Uploaded but not yet downloadable (still pending in Apillon).
+                merged.setdefault(key, record)
+            else:
+                local_unreplicated.append(record)
+        replicated = sorted(merged.values(), key=lambda x: x.get('timestamp', 0))
+        counts.update(replicated=len(replicated), pending=len(local_unreplicated))
+        return replicated + local_unreplicated
+
+    end_offsets = await asyncio.to_thread(ledger.rebuild, merge)
+    checkpoint = end_offsets[counts["replicated"] - 1] if counts["replicated"] else 0
+    await asyncio.to_thread(trade_log_queue.write_checkpoint, checkpoint)
+    log.info(f"Reconciled {counts['replicated']} record(s) from the bucket; "
+          f"{counts['pending']} local record(s) pending replication.")
+
+
+if __name__ == "__main__":
+    # Usage: python ledger.py reconcile
+    if sys.argv[1:] != ["reconcile"]:
+        print("Usage: python ledger.py reconcile")
+        sys.exit(2)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    # Import through the module name so the command shares the same ledger
+    # instance as `trade_journal` instead of the one defined in `__main__`.
+    import ledger as ledger_module
+    from arweave_storage import storage_client
+    from trade_journal import trade_log_queue
+
+    # The same lock the workers' flusher holds, so the rebuild never races an upload.
+    if not trade_log_queue.try_acquire_leadership():
+        print(f"A running worker holds the replication lock ({trade_log_queue.lock_path}); "
+              "stop the backend first, or restart it with LEDGER_RECONCILE_ON_STARTUP=true.")
+        sys.exit(1)
+
+    async def _main():
+        try:
+            await ledger_module.reconcile()
+        finally:
+            await storage_client.close()
+            ledger_module.ledger.close()
+            trade_log_queue._release_leadership()
+
+    asyncio.run(_main())
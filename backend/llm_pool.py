@@ -0,0 +1,314 @@
+# /app/backend/llm_pool.py
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict, List, Optional
+
+from logger import get_logger
+from metrics import llm_in_flight, llm_queue_wait
+from startup_profile import lazy_import
+
+log = get_logger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when no healthy endpoint can take a request before its queue deadline."""
+
+
+class LLMEndpoint:
+    """One Ollama-compatible host/model pair with its own concurrency limit and health state."""
+    def __init__(self, host: str, model: str, api_key: Optional[str], max_concurrency: int = 4):
+        self.host = host
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else None
+        self._client = None
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.healthy = True
+        # Exponentially weighted time-to-first-token, in seconds.
+        self.latency = None
+
+    @property
+    def client(self):
+        # The ollama SDK (and httpx under it) is imported on first use, off the import path of the app.
+        if self._client is None:
+            self._client = lazy_import("ollama").AsyncClient(host=self.host, headers=self.headers)
+        return self._client
+
+    @property
+    def load(self) -> float:
+        return (self.in_flight + self.waiting) / self.max_concurrency
+
+    def observe_latency(self, seconds: float) -> None:
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+
+    def __repr__(self) -> str:
+        return f"<LLMEndpoint {self.host} model={self.model}>"
+
+
+class _SharedStream:
+    """
+    The output of one in-flight generation, fanned out to every identical request.
+    Subscribers that join late replay the chunks produced so far. The producer is
+    cancelled when the last subscriber goes away.
+    """
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk: str) -> None:
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: index < len(self.chunks) or self.done)
+                    pending = self.chunks[index:]
+                    finished, error = self.done, self.error
+                for chunk in pending:
+                    yield chunk
+                index += len(pending)
+                if finished and index >= len(self.chunks):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self.task is not None:
+                self.task.cancel()
+
+
+class LLMPool:
+    """
+    Dispatches chat and embedding requests across several LLM endpoints.
+
+    - Each endpoint has a concurrency semaphore; requests queue for a slot for at
+      most `queue_timeout` seconds before failing with LLMUnavailableError. A request
+      waits on each candidate for its share of the remaining time, then moves on.
+    - Requests are routed to the healthy endpoint with the lowest load, ties broken
+      by observed time-to-first-token. A background task re-checks endpoint health.
+    - A request that fails before its first token fails over to the next endpoint.
+    - Identical streaming requests that are in flight at the same time share one
+      upstream generation.
+    """
+    def __init__(self, endpoints: List[LLMEndpoint], queue_timeout: float = 30.0,
+                 health_interval: float = 30.0, coalesce: bool = True):
+        if not endpoints:
+            raise ValueError("LLMPool needs at least one endpoint.")
+        self.endpoints = endpoints
+        self.queue_timeout = queue_timeout
+        self.health_interval = health_interval
+        self.coalesce = coalesce
+        self._in_flight: Dict[str, _SharedStream] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "LLMPool":
+        """
+        Builds the pool from SECRET_AI_ENDPOINTS, a comma-separated list of
+        `url[|model[|max_concurrency]]` entries. Falls back to SECRET_AI_URL and OLLAMA_MODEL.
+        """
+        api_key = os.getenv("SECRET_AI_API_KEY")
+        default_model = os.getenv("OLLAMA_MODEL", "llama3")
+        default_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        spec = os.getenv("SECRET_AI_ENDPOINTS") or os.getenv("SECRET_AI_URL") or ""
+        endpoints = []
+        for entry in filter(None, (e.strip() for e in spec.split(","))):
+            host, model, concurrency = (entry.split("|") + [None, None])[:3]
+            endpoints.append(LLMEndpoint(
+                host=host,
+                model=model or default_model,
+                api_key=api_key,
+                max_concurrency=int(concurrency or default_concurrency),
+            ))
+        return cls(
+            endpoints,
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+            health_interval=float(os.getenv("LLM_HEALTH_INTERVAL", "30")),
+            coalesce=os.getenv("LLM_COALESCE", "true").lower() == "true",
+        )
+
+    # --- Health checking ---
+    async def _check(self, endpoint: LLMEndpoint) -> None:
+        try:
+            await asyncio.wait_for(endpoint.client.list(), timeout=5.0)
+            if not endpoint.healthy:
+                log.info(f"{endpoint} is healthy again.")
+            endpoint.healthy = True
+        except Exception as e:
+            if endpoint.healthy:
+                log.warning(f"{endpoint} failed its health check: {e}")
+            endpoint.healthy = False
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self._check(endpoint) for endpoint in self.endpoints))
+            await asyncio.sleep(self.health_interval)
+
+    async def start(self) -> None:
+        if self._health_task is None and len(self.endpoints) > 1:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def warmup(self, load_models: bool = False) -> None:
+        """
+        Checks every endpoint, which also opens its connection. With `load_models`,
+        each endpoint is asked to load its model so the first chat skips that too.
+        """
+        await asyncio.to_thread(lazy_import, "ollama")
+        await asyncio.gather(*(self._check(endpoint) for endpoint in self.endpoints))
+        if load_models:
+            await asyncio.gather(*(self._load_model(endpoint) for endpoint in self.endpoints if endpoint.healthy))
+
+    async def _load_model(self, endpoint: LLMEndpoint) -> None:
+        try:
+            # Ollama loads the model for a chat request without messages and returns at once.
+            await asyncio.wait_for(endpoint.client.chat(model=endpoint.model, messages=[]), timeout=self.queue_timeout)
+        except Exception as e:
+            log.warning(f"Could not preload {endpoint.model} on {endpoint}: {e}")
+
+    async def stop(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+
+    # --- Routing ---
+    def _candidates(self, model: Optional[str]) -> List[LLMEndpoint]:
+        endpoints = [e for e in self.endpoints if model is None or e.model == model] or self.endpoints
+        healthy = [e for e in endpoints if e.healthy]
+        # If every endpoint looks down, still try them: the health state may be stale.
+        return sorted(healthy or endpoints, key=lambda e: (e.load, e.latency or 0.0))
+
+    async def _acquire(self, endpoint: LLMEndpoint, deadline: float) -> None:
+        endpoint.waiting += 1
+        started = time.monotonic()
+        try:
+            if endpoint.semaphore.locked():
+                await asyncio.wait_for(endpoint.semaphore.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+            else:
+                # A free slot is taken even when the deadline has already passed.
+                await endpoint.semaphore.acquire()
+        except asyncio.TimeoutError:
+            raise LLMUnavailableError(f"Timed out waiting for a free slot on {endpoint}.")
+        finally:
+            endpoint.waiting -= 1
+            llm_queue_wait.observe(time.monotonic() - started, endpoint=endpoint.host)
+        endpoint.in_flight += 1
+        llm_in_flight.set(endpoint.in_flight, endpoint=endpoint.host)
+
+    @staticmethod
+    def _release(endpoint: LLMEndpoint) -> None:
+        endpoint.in_flight -= 1
+        endpoint.semaphore.release()
+        llm_in_flight.set(endpoint.in_flight, endpoint=endpoint.host)
+
+    async def _generate(self, messages: List[Dict], model: Optional[str], **options) -> AsyncGenerator[str, None]:
+        deadline = time.monotonic() + self.queue_timeout
+        last_error: Optional[BaseException] = None
+        candidates = self._candidates(model)
+        for i, endpoint in enumerate(candidates):
+            # A saturated endpoint gets its share of the remaining queue time; the
+            # last candidate gets all of it.
+            now = time.monotonic()
+            try:
+                await self._acquire(endpoint, now + (deadline - now) / (len(candidates) - i))
+            except LLMUnavailableError as e:
+                log.warning(f"{e} Trying the next endpoint.")
+                last_error = e
+                continue
+            started = time.monotonic()
+            first_token = True
+            try:
+                stream = await endpoint.client.chat(model=endpoint.model, messages=messages, stream=True, **options)
+                # Closing the stream closes the HTTP response, which stops generation upstream
+                # as soon as the consumer goes away instead of when the answer is complete.
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        if first_token:
+                            endpoint.observe_latency(time.monotonic() - started)
+                            first_token = False
+                        yield chunk['message']['content']
+                return
+            except (asyncio.CancelledError, GeneratorExit):
+                raise
+            except Exception as e:
+                if not first_token:
+                    # Tokens were already sent to the client; the answer cannot be retried.
+                    raise
+                log.warning(f"{endpoint} failed before the first token, failing over: {e}")
+                endpoint.healthy = False
+                last_error = e
+            finally:
+                self._release(endpoint)
+        raise LLMUnavailableError(f"All LLM endpoints failed: {last_error}")
+
+    # --- Public API ---
+    async def chat_stream(self, messages: List[Dict], model: Optional[str] = None, **options) -> AsyncGenerator[str, None]:
+        """Streams the content of a chat completion, sharing identical in-flight generations."""
+        if not self.coalesce:
+            async with aclosing(self._generate(messages, model, **options)) as stream:
+                async for content in stream:
+                    yield content
+            return
+
+        key = hashlib.sha256(
+            json.dumps([model, messages, options], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        shared = self._in_flight.get(key)
+        if shared is None:
+            shared = _SharedStream()
+            self._in_flight[key] = shared
+
+            async def produce():
+                try:
+                    async for content in self._generate(messages, model, **options):
+                        await shared.publish(content)
+                    await shared.finish()
+                except asyncio.CancelledError:
+                    await shared.finish(LLMUnavailableError("Generation was cancelled."))
+                except Exception as e:
+                    await shared.finish(e)
+                finally:
+                    self._in_flight.pop(key, None)
+
+            shared.task = asyncio.create_task(produce())
+
+        # Closed explicitly so an abandoned request unsubscribes (and, if it was the
+        # last subscriber, cancels the generation) right away rather than at GC time.
+        async with aclosing(shared.subscribe()) as stream:
+            async for content in stream:
+                yield content
+
+    async def chat(self, messages: List[Dict], model: Optional[str] = None, **options) -> str:
+        """Returns a complete (non-streamed) chat completion."""
+        return "".join([content async for content in self._generate(messages, model, **options)])
+
+    async def embed(self, text: str, model: str) -> List[float]:
+        deadline = time.monotonic() + self.queue_timeout
+        endpoint = self._candidates(None)[0]
+        await self._acquire(endpoint, deadline)
+        try:
+            response = await endpoint.client.embed(model=model, input=text)
+        finally:
+            self._release(endpoint)
+        return response['embeddings'][0]
@@ -0,0 +1,51 @@
+# /app/backend/logger.py
+
+# Leveled logging for the backend. Records are handed to a background thread
+# through a queue, so a slow stdout never blocks the event loop.
+
+import os
+import sys
+import queue
+import atexit
+import logging
+import contextvars
+import logging.handlers
+
+# The id of the request being served, attached to every log line (and span).
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+_listener = None
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+def _configure() -> None:
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(levelname)s [%(process)d] %(name)s [%(request_id)s] %(message)s"
+    ))
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(_RequestIdFilter())
+
+    root = logging.getLogger("backend")
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(queue_handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Returns a logger under the `backend` hierarchy, e.g. get_logger(__name__)."""
+    _configure()
+    return logging.getLogger(f"backend.{name}")
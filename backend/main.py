@@ -1,20 +1,56 @@
 # /app/backend/main.py
 
+import os
+import math
 import time
 import re
-from fastapi import FastAPI, Request, HTTPException, Depends
+import asyncio
+# Imported first, so the startup profile's clock covers the imports below.
+from startup_profile import profile
+from fastapi import FastAPI, Request, HTTPException, Depends, WebSocket
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional
 
 from agent import TradingAgent
 import db
-from auth import create_access_token, verify_token
+import shared_state
+from arweave_storage import storage_client
+from trade_journal import trade_log_queue
+from trade_stats import trade_analytics
+from conversation import conversation_store
+from auth import (
+    ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, create_refresh_token,
+    revoke_refresh_token, rotate_refresh_token, verify_token,
+)
+from wallet_auth import login_verifier
+from rate_limit import rate_limiter
+from chat_transport import ChatSocketSession, EventStreamResponse
+from serialization import FastJSONResponse
+from schemas import (
+    AgentAddressResponse, AllowanceResponse, BalancesResponse, TradeHistoryResponse, TradeStatsResponse,
+)
+from logger import get_logger, request_id_var
+from metrics import registry, http_request_duration, new_request_id, span
+
+log = get_logger(__name__)
 
-app = FastAPI()
+# Routes without a response_model render with orjson; typed routes are serialized by pydantic-core.
+app = FastAPI(default_response_class=FastJSONResponse)
+# Each uvicorn worker builds its own agent; it connects to the Secret Network
+# lazily (see `get_agent`) and in the background right after startup.
 agent = TradingAgent()
+startup_state = {"ready": False, "error": None}
+# By default a worker starts serving before its warmup (SDK imports, Secret Network,
+# LLM and Apillon connections) is done, and /api/ready reports 503 until it is.
+# STARTUP_PRELOAD=true finishes the warmup first, e.g. for pre-warmed standby containers.
+STARTUP_PRELOAD = os.getenv("STARTUP_PRELOAD", "false").lower() == "true"
+LLM_PRELOAD_MODELS = os.getenv("LLM_PRELOAD_MODELS", "false").lower() == "true"
+# uvicorn's --workers defaults to WEB_CONCURRENCY as well.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+profile.since_start("import_app")
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,29 +60,157 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Tags the request with an id (echoed as X-Request-ID) and times it per route template."""
+    request_id = request.headers.get("x-request-id") or new_request_id()
+    token = request_id_var.set(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        route = request.scope.get("route")
+        http_request_duration.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=status,
+        )
+        request_id_var.reset(token)
+
 auth_scheme = HTTPBearer()
 
 # --- CHANGE 2: Replace your get_current_user_id function with this one ---
 async def get_current_user_id(request: Request, credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
 
     if not credentials:
-        print("AUTH FAILED: No credentials were found in the header.")
+        log.warning("No credentials were found in the header.")
         raise HTTPException(status_code=401, detail="No credentials provided")
 
     token = credentials.credentials
-    user_id = verify_token(token)
+    with span("auth"):
+        user_id = verify_token(token)
     
     if user_id is None:
-        print("AUTH FAILED: The token is invalid or expired.")
+        log.warning("The token is invalid or expired.")
         raise HTTPException(status_code=401, detail="Invalid or expired token")
         
-    print(f"AUTH SUCCESS: Token is valid for user_id: {user_id}")
+    log.debug(f"Token is valid for user_id: {user_id}")
     return user_id
 
 
+def rate_limited(scope: str):
+    """Dependency factory: the authenticated user, after spending one request of their `scope` quota."""
+    async def check(user_id: str = Depends(get_current_user_id)) -> str:
+        retry_after = await rate_limiter.take(scope, user_id)
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests. Please slow down.",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+        return user_id
+    return check
+
+
+async def get_agent() -> TradingAgent:
+    """Dependency for routes that need the Secret Network connection; connects on first use."""
+    try:
+        await agent.connect()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Agent is not ready: {e}")
+    return agent
+
+
+async def _connect_agent():
+    try:
+        await profile.timed("connect_lcd", agent.connect())
+        startup_state["ready"] = True
+        profile.since_start("ready")
+        log.info(f"Worker pid {os.getpid()} is ready.")
+    except Exception as e:
+        startup_state["error"] = str(e)
+        log.error(f"Worker pid {os.getpid()} failed to connect the agent: {e}")
+
+
+async def _warm(step: str, awaitable) -> None:
+    # Only the agent connection gates readiness; anything else connects again on first use.
+    try:
+        await profile.timed(step, awaitable)
+    except Exception as e:
+        log.warning(f"Startup step {step} failed: {e}")
+
+
+async def _warm_up():
+    """Connects to the Secret Network while warming the LLM, Apillon and trade stats paths."""
+    await asyncio.gather(
+        _connect_agent(),
+        _warm("warmup_llm", agent.llm_pool.warmup(load_models=LLM_PRELOAD_MODELS)),
+        _warm("warmup_storage", storage_client.warmup()),
+        _warm("warmup_trade_stats", asyncio.to_thread(trade_analytics.warmup)),
+    )
+    profile.log_report()
+
+
 @app.on_event("startup")
 async def startup_event():
-    await agent.connect()
+    if WEB_CONCURRENCY > 1 and not shared_state.is_shared:
+        # Refresh tokens, conversations, login nonces and rate limits live in
+        # shared_state.store; per-process stores would split them between workers.
+        raise RuntimeError(f"WEB_CONCURRENCY={WEB_CONCURRENCY} requires SHARED_STATE_URL (Redis).")
+    with profile.step("startup"):
+        await asyncio.gather(
+            profile.timed("connect_db", db.connect()),
+            agent.llm_pool.start(),
+            # With several workers, only the one holding the replication lock reconciles.
+            profile.timed("start_trade_journal", trade_log_queue.start(
+                reconcile=os.getenv("LEDGER_RECONCILE_ON_STARTUP", "false").lower() == "true"
+            )),
+        )
+    # The Apillon session is opened by the warmup (or on first use).
+    startup_state["task"] = asyncio.create_task(_warm_up())
+    if STARTUP_PRELOAD:
+        await startup_state["task"]
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await trade_log_queue.stop()
+    await agent.llm_pool.stop()
+    login_verifier.close()
+    await storage_client.close()
+    if agent.secret_client is not None:
+        # The LCD client's session is created on this loop by agent.connect.
+        await agent.secret_client.session.close()
+    await db.close()
+    await shared_state.store.close()
+
+
+@app.get("/api/health")
+async def health():
+    """Liveness: the worker process is up and serving requests."""
+    return {"status": "ok", "worker": os.getpid()}
+
+
+@app.get("/api/ready")
+async def ready():
+    """Readiness: this worker has finished initialization and can take traffic."""
+    if not startup_state["ready"]:
+        detail = startup_state["error"] or "Worker is still initializing."
+        return FastJSONResponse(status_code=503, content={"status": "starting", "detail": detail, "worker": os.getpid()})
+    return {"status": "ready", "worker": os.getpid()}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 
 class LoginRequest(BaseModel):
@@ -70,37 +234,76 @@ async def login(req: LoginRequest):
     # This is a key security step. The backend must verify the signature against
     # the exact same message string the user saw in their wallet.
     message_to_verify = f"Login to Secret Trading App\nTimestamp: {req.timestamp}\nWallet: {req.walletAddress}"
-    
-    # In a production system, you would add full cryptographic verification here
-    # using `message_to_verify`, `req.signature`, and `req.walletAddress`.
-    # For now, we proceed as before.
-    print(f"Server-side message to verify: '{message_to_verify}'")
-        
+    with span("login_signature"):
+        verified = await login_verifier.verify(req.walletAddress, message_to_verify, req.signature)
+    if not verified:
+        log.warning(f"Login signature rejected for {req.walletAddress}.")
+        raise HTTPException(status_code=401, detail="Invalid signature.")
+    # A signed message can only be used once within its validity window.
+    if not await login_verifier.nonces.claim(f"{req.walletAddress}:{req.timestamp}", req.timestamp / 1000):
+        raise HTTPException(status_code=401, detail="This login message was already used.")
+
     # 3. The rest of the function remains the same.
     user = await agent.create_user(req.walletAddress)
     token = create_access_token(data={"sub": req.walletAddress})
-    return {"data": {"user": user, "token": token}}
+    refresh_token = await create_refresh_token(req.walletAddress)
+    return {"data": {
+        "user": user,
+        "token": token,
+        "refreshToken": refresh_token,
+        "expiresIn": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }}
+
+class RefreshRequest(BaseModel):
+    refreshToken: str
+
+@app.post("/api/token/refresh")
+async def refresh_token(req: RefreshRequest):
+    """Exchanges a refresh token for a new access token (and a new refresh token)."""
+    rotated = await rotate_refresh_token(req.refreshToken)
+    if rotated is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+    _, token, new_refresh_token = rotated
+    return {"data": {"token": token, "refreshToken": new_refresh_token, "expiresIn": ACCESS_TOKEN_EXPIRE_MINUTES * 60}}
 
-@app.get("/api/agent/address")
-async def get_agent_address(user_id: str = Depends(get_current_user_id)):
+@app.post("/api/logout")
+async def logout(req: RefreshRequest):
+    await revoke_refresh_token(req.refreshToken)
+    return {"status": "ok"}
+
+@app.get("/api/agent/address", response_model=AgentAddressResponse)
+async def get_agent_address(user_id: str = Depends(get_current_user_id), agent: TradingAgent = Depends(get_agent)):
     return {"data": agent.get_agent_secret_address()}
 
-@app.get("/api/user/trade_history")
-async def get_user_trade_history(user_id: str = Depends(get_current_user_id)):
+@app.get("/api/user/trade_history", response_model=TradeHistoryResponse)
+async def get_user_trade_history(user_id: str = Depends(rate_limited("trade_history"))):
     history = await agent.get_trade_history(user_id)
     return {"data": history}
 
+@app.get("/api/user/trade_stats", response_model=TradeStatsResponse)
+async def get_user_trade_stats(
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    bucket: Literal["hour", "day", "week"] = "day",
+    user_id: str = Depends(rate_limited("trade_history")),
+):
+    """Aggregated trade stats for dashboards. `start`/`end` are Unix seconds; `end` is exclusive."""
+    if start is not None and end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start.")
+    return {"data": await agent.get_trade_stats(user_id, start=start, end=end, bucket=bucket)}
+
 class LogTradeRequest(BaseModel):
     trade_result: str
 
 @app.post("/api/log_trade")
 async def log_trade(
     req: LogTradeRequest,
-    user_id: str = Depends(get_current_user_id) # Protect the endpoint
+    user_id: str = Depends(rate_limited("log_trade")) # Protect the endpoint
 ):
     """
     Receives a trade result (success or fail) from the frontend AFTER the 
     transaction has been attempted, and securely logs it to Arweave.
+    Returns once the record is journaled; the upload happens in the background.
     """
     if not req.trade_result:
         raise HTTPException(status_code=400, detail="trade_result cannot be empty.")
@@ -110,7 +313,7 @@ async def log_trade(
         await agent._save_trade_history(user_id, req.trade_result)
         return {"status": "ok", "message": "Trade result logged successfully."}
     except Exception as e:
-        print(f"ERROR: Failed to log trade for user {user_id}. Error: {e}")
+        log.error(f"Failed to log trade for user {user_id}. Error: {e}")
         raise HTTPException(status_code=500, detail="Failed to log trade result.")
 
 class KeysRequest(BaseModel): sscrtKey: str; susdcKey: str
@@ -130,7 +333,7 @@ async def get_user_info(user_id: str = Depends(get_current_user_id)):
     # If the user is None, it means they have a valid token but no DB entry.
     # We create one for them, making the system self-healing.
     if not user:
-        print(f"User for token not found in DB. Creating new entry for {user_id}...")
+        log.info(f"User for token not found in DB. Creating new entry for {user_id}...")
         user = await agent.create_user(user_id)
 
     if not user:
@@ -139,33 +342,82 @@ async def get_user_info(user_id: str = Depends(get_current_user_id)):
         
     return {"data": user}
 
-@app.get("/api/user/authorize_spend")
-async def authorize_spend(user_id: str = Depends(get_current_user_id)):
+@app.get("/api/user/balances", response_model=BalancesResponse)
+async def get_user_balances(user_id: str = Depends(get_current_user_id), agent: TradingAgent = Depends(get_agent)):
+    """sSCRT/sUSDC balances queried with the user's registered viewing keys (cached briefly)."""
+    return {"data": await agent.get_balances(user_id)}
+
+@app.get("/api/user/authorize_spend", response_model=AllowanceResponse)
+async def authorize_spend(user_id: str = Depends(get_current_user_id), agent: TradingAgent = Depends(get_agent)):
     try:
         return {"data": await agent.check_allowed_to_spend(user_id)}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 class ChatMsg(BaseModel): role: str; content: str
-class ChatReq(BaseModel): messages: List[ChatMsg]
+class ChatReq(BaseModel):
+    # History is kept server-side, so clients only need to send `message`.
+    # A full `messages` transcript is still accepted; its last entry is the new message.
+    messages: List[ChatMsg] = []
+    message: Optional[str] = None
 @app.post("/api/chat")
-async def chat_endpoint(req: ChatReq, user_id: str = Depends(get_current_user_id)):
-    messages = [msg.model_dump() for msg in req.messages]
+async def chat_endpoint(req: ChatReq, request: Request, user_id: str = Depends(rate_limited("chat")), agent: TradingAgent = Depends(get_agent)):
+    if req.message is not None:
+        messages = [{"role": "user", "content": req.message}]
+    else:
+        messages = [msg.model_dump() for msg in req.messages]
+    if not messages:
+        raise HTTPException(status_code=400, detail="A message is required.")
+
+    # Clients that accept Server-Sent Events get typed events (tokens, actions, errors);
+    # the trade action then arrives as an event instead of a separate JSON response.
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return EventStreamResponse(agent.chat_events(user_id, messages))
     user_message = messages[-1].get('content', '').lower()
 
     if user_message == "you have convinced me":
         try:
             # 1. Prepare the transaction details using the new agent method.
-            trade_args = agent.prepare_trade_transaction(user_id)
+            trade_args = await agent.prepare_trade_transaction(user_id)
+            message = "Excellent! Please approve the transaction in your wallet to execute the trade."
+            await conversation_store.record(user_id, [
+                {"role": "user", "content": messages[-1]["content"]},
+                {"role": "assistant", "content": message},
+            ])
             
             # 2. Return a structured JSON object with instructions for the frontend.
             return {
                 "action": "execute_trade",
                 "trade_args": trade_args,
-                "message": "Excellent! Please approve the transaction in your wallet to execute the trade."
+                "message": message
             }
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
     else:
         # Normal chat logic for all other messages.
-        return StreamingResponse(agent.chat_stream(user_id, messages), media_type="text/plain")
\ No newline at end of file
+        return StreamingResponse(agent.chat_stream(user_id, messages), media_type="text/plain")
+
+@app.websocket("/api/chat/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    A persistent chat session: the client authenticates once with its access token,
+    then every turn streams typed events over the same socket (see chat_transport).
+    """
+    try:
+        await agent.connect()
+    except Exception as e:
+        log.error(f"Refusing chat socket, agent is not ready: {e}")
+        await websocket.close(code=1013, reason="Agent is not ready")
+        return
+    session = ChatSocketSession(
+        websocket,
+        lambda user_id, content: agent.chat_events(user_id, [{"role": "user", "content": content}]),
+        rate_limit=lambda user_id: rate_limiter.take("chat", user_id),
+    )
+    await session.serve()
+
+@app.delete("/api/chat/history")
+async def clear_chat_history(user_id: str = Depends(get_current_user_id)):
+    """Forgets the server-side conversation, e.g. when the user starts a new chat."""
+    await conversation_store.reset(user_id)
+    return {"status": "ok"}
@@ -0,0 +1,217 @@
+# /app/backend/metrics.py
+
+# A small, dependency-free metrics registry rendered in the Prometheus text
+# exposition format at /metrics, plus `span()` for timing request stages.
+# Metrics are per worker process; with several workers each one is scraped
+# (or sampled) separately.
+
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from logger import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in self._series.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- HTTP ---
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time to produce response headers, by route.", ("method", "route", "status"))
+
+# --- Spans ---
+stage_duration = registry.histogram(
+    "stage_duration_seconds", "Duration of named request stages (spans).", ("stage", "outcome"))
+
+# --- Chat / LLM ---
+chat_ttft = registry.histogram(
+    "chat_time_to_first_token_seconds",
+    "Time from the start of a chat turn (after authentication) to the first streamed chunk.", ("source",))
+chat_inter_chunk = registry.histogram(
+    "chat_inter_chunk_seconds", "Gap between consecutive streamed chunks.", ("source",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+chat_tokens_per_second = registry.histogram(
+    "chat_tokens_per_second", "Streamed chunks (~tokens) per second after the first chunk.", ("source",),
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 200, 500, 1000))
+llm_queue_wait = registry.histogram(
+    "llm_queue_wait_seconds", "Time spent waiting for a free upstream LLM slot.", ("endpoint",))
+llm_in_flight = registry.gauge(
+    "llm_in_flight_requests", "Generations currently running on each LLM endpoint.", ("endpoint",))
+chat_streams = registry.counter(
+    "chat_streams_total", "Chat turns streamed, by transport and how they ended.", ("transport", "outcome"))
+chat_socket_connections = registry.gauge(
+    "chat_socket_connections", "Open chat WebSocket sessions.")
+
+# --- Rate limiting / fair scheduling ---
+rate_limit_rejections = registry.counter(
+    "rate_limit_rejections_total", "Requests rejected with 429, by quota scope.", ("scope",))
+fair_queue_wait = registry.histogram(
+    "fair_queue_wait_seconds", "Time spent queued in a fair scheduler before getting a slot.", ("queue",))
+fair_queue_depth = registry.gauge(
+    "fair_queue_depth", "Requests currently waiting in a fair scheduler.", ("queue",))
+
+# --- Startup ---
+startup_step_duration = registry.gauge(
+    "startup_step_seconds", "Duration of each worker startup step, including deferred imports.", ("step",))
+
+# --- Apillon ---
+apillon_request_duration = registry.histogram(
+    "apillon_request_duration_seconds", "Latency of Apillon API calls, by step.", ("step", "outcome"))
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def span(stage: str, histogram: Optional[Histogram] = None, **labels):
+    """
+    Times a block and records it as `stage_duration_seconds{stage=...}` (or into
+    `histogram`, if given). The outcome label is "error" when the block raises.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if histogram is not None:
+            histogram.observe(elapsed, outcome=outcome, **labels)
+        else:
+            stage_duration.observe(elapsed, stage=stage, outcome=outcome)
+        log.debug("span %s %s %.1fms %s", stage, outcome, elapsed * 1000, labels or "")
+
+
+class StreamTimer:
+    """Collects time-to-first-token, inter-chunk gaps and throughput for one streamed response."""
+    def __init__(self, source: str, started: Optional[float] = None):
+        self.source = source
+        # perf_counter() at the start of the chat turn, so context loading and cache lookups count.
+        self.started = started if started is not None else time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+        self.last_chunk_at: Optional[float] = None
+        self.chunks = 0
+
+    def chunk(self) -> None:
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+            chat_ttft.observe(now - self.started, source=self.source)
+        else:
+            chat_inter_chunk.observe(now - self.last_chunk_at, source=self.source)
+        self.last_chunk_at = now
+        self.chunks += 1
+
+    def finish(self) -> None:
+        if self.first_chunk_at is None or self.chunks < 2:
+            return
+        duration = self.last_chunk_at - self.first_chunk_at
+        if duration > 0:
+            chat_tokens_per_second.observe((self.chunks - 1) / duration, source=self.source)
+        log.info("chat stream (%s): ttft=%.0fms chunks=%d duration=%.0fms", self.source,
+                 (self.first_chunk_at - self.started) * 1000, self.chunks, (self.last_chunk_at - self.started) * 1000)
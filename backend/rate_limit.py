@@ -0,0 +1,65 @@
+# /app/backend/rate_limit.py
+
+# Per-user request quotas. Each scope (chat, log_trade, ...) has a token bucket
+# per wallet, keyed on the JWT `sub`, kept in shared_state so the limit holds
+# across workers when SHARED_STATE_URL points at Redis.
+#
+# Quotas are `<requests>/<seconds>`, e.g. RATE_LIMIT_CHAT=20/60 allows bursts of
+# 20 chat turns and refills one every 3 seconds. An empty value or 0 disables it.
+
+import os
+from typing import Dict, NamedTuple, Optional
+
+import shared_state
+from logger import get_logger
+from metrics import rate_limit_rejections
+
+log = get_logger(__name__)
+
+
+class Quota(NamedTuple):
+    capacity: float
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, spec: Optional[str]) -> Optional["Quota"]:
+        if not spec or spec.strip() in ("0", "off", "none"):
+            return None
+        requests, _, seconds = spec.partition("/")
+        quota = cls(float(requests), float(seconds or 1))
+        if quota.capacity <= 0 or quota.period <= 0:
+            raise ValueError(f"Invalid rate limit quota: {spec!r}")
+        return quota
+
+
+class RateLimiter:
+    def __init__(self, quotas: Dict[str, Optional[Quota]]):
+        self.quotas = quotas
+
+    async def take(self, scope: str, user_id: str, cost: float = 1.0) -> float:
+        """Spends `cost` from the user's quota for `scope`. Returns 0 if allowed, else the seconds to wait."""
+        quota = self.quotas.get(scope)
+        if quota is None:
+            return 0.0
+        try:
+            wait = await shared_state.store.take_tokens(
+                f"ratelimit:{scope}:{user_id}", quota.capacity, quota.rate, cost
+            )
+        except Exception as e:
+            # Limiting is a safeguard; an unreachable store must not take the API down with it.
+            log.warning(f"Rate limit check for {scope} failed, allowing the request: {e}")
+            return 0.0
+        if wait > 0:
+            rate_limit_rejections.inc(scope=scope)
+        return wait
+
+
+rate_limiter = RateLimiter({
+    "chat": Quota.parse(os.getenv("RATE_LIMIT_CHAT", "20/60")),
+    "log_trade": Quota.parse(os.getenv("RATE_LIMIT_LOG_TRADE", "30/60")),
+    "trade_history": Quota.parse(os.getenv("RATE_LIMIT_TRADE_HISTORY", "60/60")),
+})
@@ -0,0 +1,138 @@
+# /app/backend/response_cache.py
+
+import os
+import re
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prompts import SYSTEM_PROMPT
+from serialization import dumps
+from logger import get_logger
+
+log = get_logger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # Semantic (near-duplicate) lookup is disabled without numpy.
+    np = None
+
+_SYSTEM_PROMPT_HASH = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()
+
+EmbedFn = Callable[[str], Awaitable[List[float]]]
+
+
+def normalize_message(text: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation: 'What is SCRT?? ' -> 'what is scrt'."""
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.rstrip("?!.,;: ")
+
+
+class ResponseCache:
+    """
+    An LRU/TTL cache of complete chat answers for repeated questions.
+
+    Entries are keyed by the system prompt hash, a hash of the conversation the
+    message follows (summary and recent turns; empty for a first message) and the
+    normalized user message, so a follow-up like "tell me more" only hits an answer
+    given after the same conversation. When an `embed` function is supplied (and
+    numpy is available), a miss on a first message falls back to a cosine-similarity
+    search over the embeddings of cached first messages. Hits are replayed as a
+    chunked stream, so callers can treat them exactly like a live LLM stream.
+    """
+    def __init__(self, ttl_seconds: float = 3600.0, max_entries: int = 512, chunk_size: int = 24,
+                 similarity_threshold: float = 0.92):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.chunk_size = chunk_size
+        self.similarity_threshold = similarity_threshold
+        # key -> (expires_at, response, unit-length embedding or None)
+        self._entries: "OrderedDict[str, Tuple[float, str, Optional[object]]]" = OrderedDict()
+        self._matrix = None
+        self._matrix_keys: List[str] = []
+
+    @staticmethod
+    def context_hash(history: List[Dict]) -> str:
+        """Hash of the messages preceding the new one ("" when there are none)."""
+        if not history:
+            return ""
+        return hashlib.sha256(dumps([[m["role"], m["content"]] for m in history])).hexdigest()
+
+    @staticmethod
+    def key(message: str, context: str = "") -> str:
+        return hashlib.sha256(
+            f"{_SYSTEM_PROMPT_HASH}:{context}:{normalize_message(message)}".encode("utf-8")
+        ).hexdigest()
+
+    def _get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() > entry[0]:
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _evict(self, key: str) -> None:
+        if self._entries.pop(key, None) is not None:
+            self._matrix = None
+
+    def _nearest(self, vector) -> Optional[str]:
+        if self._matrix is None:
+            self._matrix_keys = [k for k, entry in self._entries.items() if entry[2] is not None]
+            if not self._matrix_keys:
+                return None
+            self._matrix = np.stack([self._entries[k][2] for k in self._matrix_keys])
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        return self._get(self._matrix_keys[best])
+
+    async def lookup(self, message: str, embed: Optional[EmbedFn] = None,
+                     context: str = "") -> Tuple[Optional[str], Optional[object]]:
+        """
+        Returns (cached response or None, embedding of the message or None).
+        The embedding is handed back so a miss can be stored without embedding twice.
+        Near-duplicate matching only applies to first messages (empty `context`).
+        """
+        response = self._get(self.key(message, context))
+        if response is not None or context or embed is None or np is None:
+            return response, None
+        try:
+            vector = np.asarray(await embed(normalize_message(message)), dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+        except Exception as e:
+            log.warning(f"Embedding failed, using exact-match only: {e}")
+            return None, None
+        return self._nearest(vector), vector
+
+    def store(self, message: str, response: str, embedding: Optional[object] = None, context: str = "") -> None:
+        if not response:
+            return
+        if context:
+            embedding = None
+        key = self.key(message, context)
+        self._evict(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, response, embedding)
+        if embedding is not None:
+            self._matrix = None
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    async def replay(self, response: str) -> AsyncGenerator[str, None]:
+        """Yields a cached response in small chunks, like a live stream."""
+        for start in range(0, len(response), self.chunk_size):
+            yield response[start:start + self.chunk_size]
+            await asyncio.sleep(0)
+
+
+response_cache = ResponseCache(
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+    chunk_size=int(os.getenv("RESPONSE_CACHE_CHUNK_SIZE", "24")),
+    similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92")),
+)
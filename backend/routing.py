@@ -0,0 +1,295 @@
+# /app/backend/routing.py
+
+# Best-execution routing over the Shade pool graph. Pool reserves are loaded
+# through the agent's AsyncLCDClient (or from a snapshot file) and cached for
+# SHADE_POOL_REFRESH_INTERVAL seconds; quotes are cached until the next refresh.
+#
+# Snapshot files (SHADE_POOL_SNAPSHOT) are JSON lists of
+#   {"address", "code_hash", "token_0", "token_1", "reserve_0", "reserve_1", "fee": [nom, denom]}
+# and can be written from live data with `python routing.py snapshot <path>`.
+
+import os
+import json
+import time
+import asyncio
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import shade
+from shade import Contract
+from logger import get_logger
+from metrics import span
+
+log = get_logger(__name__)
+
+
+class Pool(NamedTuple):
+    contract: Contract
+    token_0: str
+    token_1: str
+    reserve_0: int
+    reserve_1: int
+    # Total swap fee (LP + DAO) as a fraction nom/denom of the input amount.
+    fee_nom: int
+    fee_denom: int
+
+    def swap_out(self, token_in: str, amount_in: int) -> int:
+        """Exact integer constant-product output for `amount_in` of `token_in`."""
+        r_in, r_out = (self.reserve_0, self.reserve_1) if token_in == self.token_0 else (self.reserve_1, self.reserve_0)
+        amount_in = amount_in * (self.fee_denom - self.fee_nom) // self.fee_denom
+        return r_out * amount_in // (r_in + amount_in) if r_in + amount_in > 0 else 0
+
+
+class Quote(NamedTuple):
+    path: Tuple[Contract, ...]
+    amount_in: int
+    amount_out: int
+    # amount_out less the slippage tolerance; sent as the swap's expected_return.
+    min_out: int
+
+
+def _token_address(token: Dict) -> Optional[str]:
+    custom = token.get("custom_token") if isinstance(token, dict) else None
+    return custom.get("contract_addr") if custom else None
+
+
+def _parse_pair_info(contract: Contract, info: Dict) -> Optional[Pool]:
+    """Builds a Pool from a Shade pair's `get_pair_info` response; None for unsupported pairs."""
+    info = info.get("get_pair_info", info)
+    token_0, token_1 = (_token_address(t) for t in info["pair"][:2])
+    if not token_0 or not token_1:
+        return None  # Native-denom pairs cannot be routed through the SNIP-20 router.
+    fee_info = info.get("fee_info") or {}
+    fees = [fee_info.get("lp_fee") or {}, fee_info.get("shade_dao_fee") or {}]
+    denom = 1
+    for fee in fees:
+        denom *= int(fee.get("denom") or 1)
+    nom = sum(int(fee.get("nom") or 0) * denom // int(fee.get("denom") or 1) for fee in fees)
+    return Pool(contract, token_0, token_1, int(info["amount_0"]), int(info["amount_1"]), nom, denom)
+
+
+def best_routes(pools: Sequence[Pool], offer: str, ask: str, amounts: Sequence[int],
+                max_hops: int = 3) -> Tuple[np.ndarray, List[Optional[Tuple[Pool, ...]]]]:
+    """
+    Max-output path search from `offer` to `ask` for every amount in `amounts` at once.
+
+    A layered relaxation over the pool graph: after k rounds, each token holds the
+    best output reachable in exactly k hops, per candidate amount (a numpy vector),
+    and the best arrival at `ask` across all rounds is kept. A pool is used at most
+    once per path. Outputs are float estimates; use Pool.swap_out for exact amounts.
+    """
+    n = len(amounts)
+    frontier: Dict[str, np.ndarray] = {offer: np.asarray(amounts, dtype=np.float64)}
+    frontier_paths: Dict[str, List[Tuple[Pool, ...]]] = {offer: [()] * n}
+    best_out = np.zeros(n)
+    best_path: List[Optional[Tuple[Pool, ...]]] = [None] * n
+
+    for _ in range(max_hops):
+        reached: Dict[str, np.ndarray] = {}
+        reached_paths: Dict[str, List[Tuple[Pool, ...]]] = {}
+        for pool in pools:
+            for token_in, token_out, r_in, r_out in (
+                (pool.token_0, pool.token_1, pool.reserve_0, pool.reserve_1),
+                (pool.token_1, pool.token_0, pool.reserve_1, pool.reserve_0),
+            ):
+                amount_in = frontier.get(token_in)
+                if amount_in is None or r_in <= 0 or r_out <= 0:
+                    continue
+                x = amount_in * (1.0 - pool.fee_nom / pool.fee_denom)
+                out = r_out * x / (r_in + x)
+                paths_in = frontier_paths[token_in]
+                reused = np.fromiter((pool in path for path in paths_in), dtype=bool, count=n)
+                out[reused] = 0.0
+                current = reached.get(token_out)
+                better = out > (current if current is not None else 0.0)
+                if not better.any():
+                    continue
+                reached[token_out] = out if current is None else np.where(better, out, current)
+                previous = reached_paths.get(token_out, [()] * n)
+                reached_paths[token_out] = [
+                    paths_in[i] + (pool,) if better[i] else previous[i] for i in range(n)
+                ]
+        if not reached:
+            break
+        frontier, frontier_paths = reached, reached_paths
+        arrived = frontier.get(ask)
+        if arrived is not None:
+            better = arrived > best_out
+            best_out = np.where(better, arrived, best_out)
+            best_path = [frontier_paths[ask][i] if better[i] else best_path[i] for i in range(n)]
+    return best_out, best_path
+
+
+class RouteEngine:
+    """
+    Discovers Shade pools, caches their reserves and quotes swaps along the best path.
+
+    Pools come from the factory's pair list when SHADE_FACTORY_ADDRESS is set, and
+    otherwise from the pairs of the routes registered in `shade.ROUTES`.
+    """
+    def __init__(self, factory: Optional[Contract] = None, refresh_interval: float = 30.0,
+                 max_hops: int = 3, slippage_bps: int = 50, snapshot_path: Optional[str] = None,
+                 max_concurrency: int = 8):
+        self.factory = factory
+        self.refresh_interval = refresh_interval
+        self.max_hops = max_hops
+        self.slippage_bps = slippage_bps
+        self.snapshot_path = snapshot_path
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pools: List[Pool] = []
+        self._loaded_at: Optional[float] = None
+        self._refresh_lock = asyncio.Lock()
+        # (offer, ask, amount) -> Quote; cleared whenever the pools are reloaded.
+        self._quotes: Dict[Tuple[str, str, int], Optional[Quote]] = {}
+
+    # --- Pool discovery ---
+    async def _list_pairs(self, client) -> List[Contract]:
+        if self.factory is None:
+            pairs = {pair for route in shade.ROUTES.values() for pair in route.path}
+            return sorted(pairs)
+        pairs, start, limit = [], 0, 30
+        while True:
+            result = await client.wasm.contract_query(
+                self.factory.address,
+                {"list_a_m_m_pairs": {"pagination": {"start": start, "limit": limit}}},
+                contract_code_hash=self.factory.code_hash,
+            )
+            page = (result.get("list_a_m_m_pairs") or result).get("amm_pairs", [])
+            pairs += [Contract(p["address"], p["code_hash"]) for p in page if p.get("enabled", True)]
+            if len(page) < limit:
+                return pairs
+            start += limit
+
+    async def _pair_info(self, client, contract: Contract) -> Optional[Pool]:
+        try:
+            async with self._semaphore:
+                info = await client.wasm.contract_query(
+                    contract.address, {"get_pair_info": {}}, contract_code_hash=contract.code_hash
+                )
+            return _parse_pair_info(contract, info)
+        except Exception as e:
+            log.warning(f"Skipping pool {contract.address}: {e}")
+            return None
+
+    async def load_pools(self, client) -> List[Pool]:
+        if self.snapshot_path:
+            return await asyncio.to_thread(load_snapshot, self.snapshot_path)
+        with span("pool_discovery"):
+            pairs = await self._list_pairs(client)
+            pools = await asyncio.gather(*(self._pair_info(client, pair) for pair in pairs))
+        return [pool for pool in pools if pool is not None]
+
+    async def pools(self, client) -> List[Pool]:
+        """Returns the cached pool snapshot, reloading it once it is older than `refresh_interval`."""
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return self._pools
+        async with self._refresh_lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+                return self._pools
+            pools = await self.load_pools(client)
+            if not pools and self._pools:
+                log.warning("Pool refresh returned nothing; keeping the previous snapshot.")
+            else:
+                self._pools = pools
+                self._quotes.clear()
+                log.info(f"Loaded {len(pools)} Shade pool(s).")
+            self._loaded_at = time.monotonic()
+        return self._pools
+
+    # --- Quoting ---
+    def _min_out(self, amount_out: int) -> int:
+        return amount_out * (10_000 - self.slippage_bps) // 10_000
+
+    async def quote_many(self, client, offer: str, ask: str, amounts: Sequence[int]) -> List[Optional[Quote]]:
+        """Best-path quotes for several input amounts, searched in one vectorized pass."""
+        pools = await self.pools(client)
+        missing = [a for a in dict.fromkeys(amounts) if (offer, ask, a) not in self._quotes]
+        if missing:
+            _, paths = best_routes(pools, offer, ask, missing, self.max_hops)
+            for amount, path in zip(missing, paths):
+                quote = None
+                if path:
+                    amount_out, token = amount, offer
+                    for pool in path:
+                        amount_out = pool.swap_out(token, amount_out)
+                        token = pool.token_1 if token == pool.token_0 else pool.token_0
+                    quote = Quote(tuple(pool.contract for pool in path), amount, amount_out, self._min_out(amount_out))
+                self._quotes[(offer, ask, amount)] = quote
+        return [self._quotes[(offer, ask, a)] for a in amounts]
+
+    async def quote(self, client, offer: str, ask: str, amount: int) -> Quote:
+        quote = (await self.quote_many(client, offer, ask, [amount]))[0]
+        if quote is None or quote.amount_out <= 0:
+            raise ValueError("No Shade route with liquidity was found for this swap.")
+        return quote
+
+
+def load_snapshot(path: str) -> List[Pool]:
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    return [
+        Pool(Contract(e["address"], e["code_hash"]), e["token_0"], e["token_1"],
+             int(e["reserve_0"]), int(e["reserve_1"]), int(e["fee"][0]), int(e["fee"][1]))
+        for e in entries
+    ]
+
+
+def save_snapshot(path: str, pools: Sequence[Pool]) -> None:
+    entries = [
+        {"address": p.contract.address, "code_hash": p.contract.code_hash, "token_0": p.token_0,
+         "token_1": p.token_1, "reserve_0": str(p.reserve_0), "reserve_1": str(p.reserve_1),
+         "fee": [p.fee_nom, p.fee_denom]}
+        for p in pools
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2)
+
+
+def _factory_from_env() -> Optional[Contract]:
+    address = os.getenv("SHADE_FACTORY_ADDRESS")
+    return Contract(address, os.getenv("SHADE_FACTORY_CODE_HASH", "")) if address else None
+
+
+async def write_snapshot(path: str, lcd_url: str, chain_id: str) -> int:
+    """Loads the live pools and writes them to a snapshot file. Returns the pool count."""
+    import aiohttp
+    from agent import _build_lcd_client
+
+    # Built on a private loop in a thread, then given a session on this loop, as in agent.connect.
+    client = await asyncio.to_thread(_build_lcd_client, lcd_url, chain_id)
+    client.loop = asyncio.get_running_loop()
+    client.session = aiohttp.ClientSession(headers={"Accept": "application/json"})
+    try:
+        pools = await RouteEngine(factory=_factory_from_env()).load_pools(client)
+    finally:
+        await client.session.close()
+    await asyncio.to_thread(save_snapshot, path, pools)
+    return len(pools)
+
+
+route_engine = RouteEngine(
+    factory=_factory_from_env(),
+    refresh_interval=float(os.getenv("SHADE_POOL_REFRESH_INTERVAL", "30")),
+    max_hops=int(os.getenv("SHADE_MAX_HOPS", "3")),
+    slippage_bps=int(os.getenv("SWAP_SLIPPAGE_BPS", "50")),
+    snapshot_path=os.getenv("SHADE_POOL_SNAPSHOT") or None,
+)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3 or sys.argv[1] != "snapshot":
+        print("Usage: python routing.py snapshot <path>")
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    count = asyncio.run(write_snapshot(
+        sys.argv[2],
+        os.getenv("LCD_URL", "https://rpc.ankr.com/http/scrt_cosmos"),
+        os.getenv("CHAIN_ID", "secret-4"),
+    ))
+    log.info(f"Wrote {count} pool(s) to {sys.argv[2]}.")
@@ -0,0 +1,113 @@
+# /app/backend/scheduler.py
+
+# Weighted fair queuing for shared upstream capacity (LLM generations, Apillon
+# reads and uploads). Work is admitted per user in start-time fair order: every request is
+# tagged with the virtual time at which its user's previous work "finishes",
+# so a user with many queued requests waits behind everyone else's first one
+# instead of taking every free slot. Weights scale a user's share, e.g.
+#
+#   FAIR_SHARE_WEIGHTS=secret1abc...=2,secret1def...=0.5
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from logger import get_logger
+from metrics import fair_queue_depth, fair_queue_wait
+
+log = get_logger(__name__)
+
+
+class FairScheduler:
+    """
+    At most `concurrency` slots are held at once; waiting requests get the next
+    free slot in order of their start tag (start-time fair queuing). Per-user
+    state is dropped once it no longer affects ordering.
+    """
+    def __init__(self, name: str, concurrency: int, weights: Optional[Dict[str, float]] = None,
+                 max_tracked_users: int = 10_000):
+        if concurrency < 1:
+            raise ValueError("FairScheduler needs at least one slot.")
+        self.name = name
+        self.concurrency = concurrency
+        self.weights = weights or {}
+        self.max_tracked_users = max_tracked_users
+        self._available = concurrency
+        self._virtual_time = 0.0
+        # user -> virtual finish time of that user's latest admitted or queued request.
+        self._finish: Dict[str, float] = {}
+        self._waiting: List[Tuple[float, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, waiter in self._waiting if not waiter.done())
+
+    def _start_tag(self, user_id: str, cost: float) -> float:
+        if len(self._finish) > self.max_tracked_users:
+            # Users whose work finished before the current virtual time start fresh anyway.
+            self._finish = {u: f for u, f in self._finish.items() if f > self._virtual_time}
+        start = max(self._virtual_time, self._finish.get(user_id, 0.0))
+        self._finish[user_id] = start + cost / self.weights.get(user_id, 1.0)
+        return start
+
+    def _refund(self, user_id: str, cost: float) -> None:
+        """Gives back the share charged by `_start_tag` for a request that left the queue unserved."""
+        if user_id in self._finish:
+            self._finish[user_id] -= cost / self.weights.get(user_id, 1.0)
+
+    def _release(self) -> None:
+        while self._waiting:
+            tag, _, waiter = heapq.heappop(self._waiting)
+            if not waiter.done():
+                self._virtual_time = max(self._virtual_time, tag)
+                waiter.set_result(None)
+                fair_queue_depth.set(self.queued, queue=self.name)
+                return
+        self._available += 1
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, cost: float = 1.0) -> AsyncIterator[None]:
+        """Holds one slot for the duration of the block, queueing fairly if none is free."""
+        tag = self._start_tag(user_id, cost)
+        started = time.monotonic()
+        if self._available > 0 and not self._waiting:
+            self._available -= 1
+            self._virtual_time = max(self._virtual_time, tag)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiting, (tag, next(self._order), waiter))
+            fair_queue_depth.set(self.queued, queue=self.name)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release()  # The slot was granted just as the request went away.
+                else:
+                    self._refund(user_id, cost)
+                fair_queue_depth.set(self.queued, queue=self.name)
+                raise
+        fair_queue_wait.observe(time.monotonic() - started, queue=self.name)
+        try:
+            yield
+        finally:
+            self._release()
+
+
+def weights_from_env() -> Dict[str, float]:
+    weights = {}
+    for entry in filter(None, (e.strip() for e in os.getenv("FAIR_SHARE_WEIGHTS", "").split(","))):
+        user_id, _, weight = entry.partition("=")
+        weights[user_id.strip()] = float(weight)
+    return weights
+
+
+storage_scheduler = FairScheduler(
+    "storage",
+    concurrency=int(os.getenv("STORAGE_FAIR_CONCURRENCY", "8")),
+    weights=weights_from_env(),
+)
@@ -0,0 +1,78 @@
+# /app/backend/schemas.py
+
+# Response models for the polled endpoints. A route declared with one of these
+# as its `response_model` is validated and serialized by pydantic-core straight
+# to JSON bytes, skipping FastAPI's generic `jsonable_encoder` pass.
+
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class TradeRecord(BaseModel):
+    # Older bucket records may carry extra fields; they are passed through.
+    model_config = ConfigDict(extra="allow")
+
+    id: Optional[str] = None
+    user_id: str
+    timestamp: int
+    message: str
+    response: str
+
+
+class TradeHistoryResponse(BaseModel):
+    data: List[TradeRecord]
+
+
+class TradeSeries(BaseModel):
+    start: List[int]
+    trades: List[int]
+    successful: List[int]
+    volume_usdc: List[float]
+
+
+class TradeSummary(BaseModel):
+    trades: int
+    successful: int
+    failed: int
+    success_rate: Optional[float]
+    volume_usdc: float
+    first_trade: Optional[int]
+    last_trade: Optional[int]
+    failures_by_code: Dict[str, int]
+    series: Optional[TradeSeries] = None
+    # Distinct wallets; global stats only.
+    traders: Optional[int] = None
+
+
+class TradeStats(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    user: TradeSummary
+    global_stats: Optional[TradeSummary] = Field(alias="global")
+
+
+class TradeStatsResponse(BaseModel):
+    data: TradeStats
+
+
+class BalancesResponse(BaseModel):
+    # Token symbol -> amount, or None without a usable viewing key.
+    data: Dict[str, Optional[str]]
+
+
+class Allowance(BaseModel):
+    token: str
+    spender: str
+    allowance: str
+    required: str
+    expiration: Optional[int] = None
+    allowed: bool
+
+
+class AllowanceResponse(BaseModel):
+    data: Allowance
+
+
+class AgentAddressResponse(BaseModel):
+    data: str
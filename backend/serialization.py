@@ -0,0 +1,81 @@
+# /app/backend/serialization.py
+
+# Serialization for API responses, chat events and trade records. orjson is
+# used when it is installed: it encodes straight to compact UTF-8 bytes several
+# times faster than the stdlib json module, which remains the fallback with the
+# same compact output.
+#
+# Ledger records can be stored as msgpack instead of JSON (RECORD_FORMAT=msgpack,
+# needs the msgpack package). Records are decoded by sniffing their first byte,
+# so a ledger can hold both formats and the setting can be changed at any time.
+# Compare the options with `python benchmarks/bench_serialization.py`.
+
+import os
+import json
+from typing import Any, Dict, Optional
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Falls back to the stdlib json module.
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # RECORD_FORMAT=msgpack is unavailable without msgpack.
+    msgpack = None
+
+RECORD_FORMATS = ("json", "msgpack")
+RECORD_FORMAT = os.getenv("RECORD_FORMAT", "json").lower()
+if RECORD_FORMAT not in RECORD_FORMATS:
+    raise ValueError(f"Unknown RECORD_FORMAT {RECORD_FORMAT!r}; expected one of {RECORD_FORMATS}.")
+if RECORD_FORMAT == "msgpack" and msgpack is None:
+    raise ValueError("RECORD_FORMAT=msgpack needs the 'msgpack' package.")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    # The stdlib parser takes str/bytes only, not a memoryview.
+    return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+
+def encode_record(record: Dict, record_format: Optional[str] = None) -> bytes:
+    """Encodes a record as `record_format` (default: RECORD_FORMAT)."""
+    record_format = record_format or RECORD_FORMAT
+    if record_format == "msgpack":
+        if msgpack is None:
+            raise ValueError("RECORD_FORMAT=msgpack needs the 'msgpack' package.")
+        return msgpack.packb(record, use_bin_type=True)
+    if record_format != "json":
+        raise ValueError(f"Unknown record format {record_format!r}; expected one of {RECORD_FORMATS}.")
+    return dumps(record)
+
+
+def decode_record(data) -> Dict:
+    """
+    Decodes a record in either format from bytes or a memoryview (e.g. a slice of
+    the ledger's map). Raises ValueError on a malformed record.
+    """
+    # Records are objects: JSON ones start with "{", msgpack maps with 0x80-0x8f, 0xde or 0xdf.
+    if data[:1] == b"{":
+        return loads(data)
+    if msgpack is None:
+        raise ValueError("Found a msgpack record, but the 'msgpack' package is not installed.")
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        raise ValueError(f"Malformed msgpack record: {e}") from e
+
+
+class FastJSONResponse(JSONResponse):
+    """The app's default response class: renders with `dumps` instead of the stdlib encoder."""
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
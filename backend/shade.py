@@ -1,38 +1,170 @@
 # /app/backend/shade.py
 
+# Shade swap routes. Every route is registered once at import time; its router
+# message is serialized to canonical JSON and base64 a single time and checked
+# for consistency, so building a transaction only splices in owner and amount.
+
 import base64
 import json
-from typing import Tuple, Dict
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Tuple
 
-def create_buy_scrt_msg_data(usdc_amount: str, owner: str) -> Tuple[str, str, Dict]:
+SHADE_ROUTER_ADDRESS = "secret1pjhdug87nxzv0esxasmeyfsucaj98pw4334wyc"
+SEND_PADDING = "Iq7w0EzEpkt"
+
+
+class Contract(NamedTuple):
+    address: str
+    code_hash: str
+
+
+# SNIP-20 tokens that routes can start from.
+TOKENS: Dict[str, Contract] = {
+    "sUSDC": Contract("secret1vkq022x4q8t8kx9de3r84u669l65xnwf2lg3e6",
+                      "638a3e1d50175fbcb8373cf801565283e3eb23d88a9b7b7f99fcc5eb1e6b561e"),
+    "sSCRT": Contract("secret1k0jntykt7e4g3y88ltc60czgjuqdy4c9e8fzek",
+                      "af74387e276be8874f07bec3a87023ee49b0e7ebe08178c49d0a49c3c98ed60e"),
+}
+
+# Code hash shared by the Shade pair contracts used as hops.
+SHADE_PAIR_CODE_HASH = "e88165353d5d7e7847f2c84134c3f7871b2eee684ffac9fcf8d99a4da39dc2f2"
+
+
+class SwapRoute(NamedTuple):
+    """A path through Shade pair contracts from `offer_token` to `ask_token`."""
+    offer_token: str
+    ask_token: str
+    path: Tuple[Contract, ...]
+
+    @property
+    def name(self) -> str:
+        return f"{self.offer_token}->{self.ask_token}"
+
+    def swap_msg(self, expected_return: str) -> Dict:
+        return {
+            "swap_tokens_for_exact": {
+                "expected_return": expected_return,
+                "path": [{"addr": pair.address, "code_hash": pair.code_hash} for pair in self.path],
+            }
+        }
+
+
+ROUTES: Dict[str, SwapRoute] = {}
+
+
+def _canonical_json(msg: Dict) -> str:
+    return json.dumps(msg, sort_keys=True, separators=(",", ":"))
+
+
+@lru_cache(maxsize=1024)
+def _path_json(path: Tuple[Contract, ...]) -> str:
+    return _canonical_json([{"addr": pair.address, "code_hash": pair.code_hash} for pair in path])
+
+
+def encode_swap_msg(path: Tuple[Contract, ...], expected_return: str) -> str:
     """
-    Prepares the data needed to construct the buy sSCRT message.
-    Returns a tuple of: (contract_address, code_hash, message_dict)
+    Base64 router message for `path`. The serialized path is memoized, so a quoted
+    trade (whose expected_return changes every time) only formats one number.
+    Matches _canonical_json of SwapRoute.swap_msg, which verify_routes checks.
     """
-    s_usdc_address = "secret1vkq022x4q8t8kx9de3r84u669l65xnwf2lg3e6"
-    s_usdc_code_hash = "638a3e1d50175fbcb8373cf801565283e3eb23d88a9b7b7f99fcc5eb1e6b561e"
-    shade_router_address = "secret1pjhdug87nxzv0esxasmeyfsucaj98pw4334wyc"
-
-    swap_msg = {
-        "swap_tokens_for_exact": {
-            "expected_return": "1",
-            "path": [
-                {"addr": "secret1qz57pea4k3ndmjpyn6tdjcuq4tzrvjn0aphca0k", "code_hash": "e88165353d5d7e7847f2c84134c3f7871b2eee684ffac9fcf8d99a4da39dc2f2"},
-                {"addr": "secret1a6efnz9y702pctmnzejzkjdyq0m62jypwsfk92", "code_hash": "e88165353d5d7e7847f2c84134c3f7871b2eee684ffac9fcf8d99a4da39dc2f2"},
-                {"addr": "secret1y6w45fwg9l9pxd6qys8ltjlnu9xa4f2de7sp", "code_hash": "e88165353d5d7e7847f2c84134c3f7871b2eee684ffac9fcf8d99a4da39dc2f2"}
-            ]
-        }
-    }
-    swap_msg_base64 = "eyJzd2FwX3Rva2Vuc19mb3JfZXhhY3QiOnsiZXhwZWN0ZWRfcmV0dXJuIjoiMSIsInBhdGgiOlt7ImFkZHIiOiJzZWNyZXQxcXo1N3BlYTRrM25kbWpweTZ0ZGpjdXE0dHpydmpuMGFwaGNhMGsiLCJjb2RlX2hhc2giOiJlODgxNjUzNTNkNWQ3ZTc4NDdmMmM4NDEzNGMzZjc4NzFiMmVlZTY4NGZmYWM5ZmNmOGQ5OWE0ZGEzOWRjMmYyIn0seyJhZGRyIjoic2VjcmV0MWE2ZWZuejl5NzAycGN0bW56ZWp6a2pkeXEwbTYyanlwd3NmazkyIiwiY29kZV9oYXNoIjoiZTg4MTY1MzUzZDVkN2U3ODQ3ZjJjODQxMzRjM2Y3ODcxYjJlZWU2ODRmZmFjOWZjZjhkOTlhNGRhMzlkYzJmMiJ9LHsiYWRkciI6InNlY3JldDF5Nnc0NWZ3ZzlsbjlweGQ2cXlzOGx0amxudHU5eGE0ZjJkZTdzcCIsImNvZGVfaGFzaCI6ImU4ODE2NTM1M2Q1ZDdlNzg0N2YyYzg0MTM0YzNmNzg3MWIyZWVlNjg0ZmZhYzlmY2Y4ZDk5YTRkYTM5ZGMyZjIifV19fQ=="
+    msg = f'{{"swap_tokens_for_exact":{{"expected_return":{json.dumps(expected_return)},"path":{_path_json(path)}}}}}'
+    return base64.b64encode(msg.encode("utf-8")).decode("ascii")
+
 
+@lru_cache(maxsize=256)
+def encoded_swap_msg(route_name: str, expected_return: str = "1") -> str:
+    """The base64 router message for a registered route, encoded once per (route, expected_return)."""
+    return encode_swap_msg(ROUTES[route_name].path, expected_return)
+
+
+# --- Consistency checks ---
+_BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+_CODE_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _bech32_valid(address: str, hrp: str = "secret") -> bool:
+    prefix, sep, data = address.rpartition("1")
+    if prefix != hrp or not sep or len(data) < 7 or any(c not in _BECH32_CHARSET for c in data):
+        return False
+    generator = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+    checksum = 1
+    values = [ord(c) >> 5 for c in prefix] + [0] + [ord(c) & 31 for c in prefix]
+    values += [_BECH32_CHARSET.index(c) for c in data]
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            checksum ^= generator[i] if (top >> i) & 1 else 0
+    return checksum == 1
+
+
+def verify_routes() -> None:
+    """
+    Checks every contract address (bech32 checksum) and code hash, and that each
+    route's encoded message decodes back to its dict. Raises ValueError on drift.
+    """
+    if not _bech32_valid(SHADE_ROUTER_ADDRESS):
+        raise ValueError(f"Invalid router address: {SHADE_ROUTER_ADDRESS}")
+    contracts = [(f"token {name}", contract) for name, contract in TOKENS.items()]
+    contracts += [(f"route {name}", pair) for name, route in ROUTES.items() for pair in route.path]
+    for label, contract in contracts:
+        if not _bech32_valid(contract.address):
+            raise ValueError(f"Invalid contract address in {label}: {contract.address}")
+        if not _CODE_HASH_RE.match(contract.code_hash):
+            raise ValueError(f"Invalid code hash in {label}: {contract.code_hash}")
+    for name, route in ROUTES.items():
+        if route.offer_token not in TOKENS:
+            raise ValueError(f"Route {name} starts from unknown token {route.offer_token}.")
+        encoded = base64.b64decode(encoded_swap_msg(name)).decode("utf-8")
+        if encoded != _canonical_json(route.swap_msg("1")):
+            raise ValueError(f"Encoded message for route {name} does not match its path.")
+
+
+def register_route(offer_token: str, ask_token: str, pair_addresses: List[str],
+                   code_hash: str = SHADE_PAIR_CODE_HASH) -> SwapRoute:
+    route = SwapRoute(offer_token, ask_token, tuple(Contract(addr, code_hash) for addr in pair_addresses))
+    ROUTES[route.name] = route
+    encoded_swap_msg.cache_clear()
+    return route
+
+
+register_route("sUSDC", "sSCRT", [
+    "secret1qz57pea4k3ndmjpy6tdjcuq4tzrvjn0aphca0k",
+    "secret1a6efnz9y702pctmnzejzkjdyq0m62jypwsfk92",
+    "secret1y6w45fwg9ln9pxd6qys8ltjlntu9xa4f2de7sp",
+])
+verify_routes()
+
+
+def create_send_msg_data(offer_token: Contract, amount: str, owner: str, swap_msg: str) -> Tuple[str, str, Dict]:
+    """
+    Prepares a SNIP-20 `send` of `amount` (base units) of `offer_token` to the
+    Shade router. Returns a tuple of: (contract_address, code_hash, message_dict)
+    """
     msg_dict = {
         "send": {
             "owner": owner,
-            "recipient": shade_router_address,
-            "amount": usdc_amount,
-            "msg": swap_msg_base64,
-            "padding": "Iq7w0EzEpkt",
+            "recipient": SHADE_ROUTER_ADDRESS,
+            "amount": amount,
+            "msg": swap_msg,
+            "padding": SEND_PADDING,
         }
     }
+    return (offer_token.address, offer_token.code_hash, msg_dict)
+
+
+def create_swap_msg_data(route_name: str, amount: str, owner: str,
+                         expected_return: str = "1") -> Tuple[str, str, Dict]:
+    """Prepares a swap along a registered route. See `create_send_msg_data`."""
+    route = ROUTES[route_name]
+    return create_send_msg_data(TOKENS[route.offer_token], amount, owner,
+                                encoded_swap_msg(route_name, expected_return))
 
-    return (s_usdc_address, s_usdc_code_hash, msg_dict)
\ No newline at end of file
+
+def create_buy_scrt_msg_data(usdc_amount: str, owner: str) -> Tuple[str, str, Dict]:
+    """
+    Prepares the data needed to construct the buy sSCRT message.
+    Returns a tuple of: (contract_address, code_hash, message_dict)
+    """
+    return create_swap_msg_data("sUSDC->sSCRT", usdc_amount, owner)
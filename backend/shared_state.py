@@ -0,0 +1,183 @@
+# /app/backend/shared_state.py
+
+# A small key/value store for state that has to be consistent across uvicorn
+# workers or containers (user cache entries, rate-limit counters, ...).
+# Selected by SHARED_STATE_URL:
+#   unset                   in-process dict; correct for a single worker only
+#   redis://host:6379/0     Redis via `redis.asyncio` (optional dependency)
+
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from serialization import dumps, loads
+
+
+class InProcessStore:
+    """A dict with per-key expiry. State is private to the current worker process."""
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._data: Dict[str, Tuple[Optional[float], Any]] = {}
+        # key -> [lock, holders and waiters]; an entry is dropped when nobody uses it.
+        self._locks: Dict[str, List] = {}
+
+    def _make_room(self, key: str) -> None:
+        if len(self._data) < self.max_entries or key in self._data:
+            return
+        now = time.monotonic()
+        for expired in [k for k, (expires_at, _) in self._data.items() if expires_at is not None and now > expires_at]:
+            del self._data[expired]
+        while len(self._data) >= self.max_entries:
+            # Drop the oldest insertion; dicts preserve insertion order.
+            self._data.pop(next(iter(self._data)))
+
+    def _live(self, key: str) -> Optional[Tuple[Optional[float], Any]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] is not None and time.monotonic() > entry[0]:
+            self._data.pop(key, None)
+            return None
+        return entry
+
+    async def get(self, key: str) -> Any:
+        entry = self._live(key)
+        return entry[1] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._make_room(key)
+        self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically increments a counter; `ttl` applies when the counter is created."""
+        entry = self._live(key)
+        if entry is None:
+            self._make_room(key)
+            self._data[key] = (time.monotonic() + ttl if ttl else None, amount)
+            return amount
+        value = entry[1] + amount
+        self._data[key] = (entry[0], value)
+        return value
+
+    async def take_tokens(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> float:
+        """
+        Token bucket: takes `cost` tokens from the bucket at `key` (holding at most
+        `capacity`, refilled at `rate` per second). Returns 0 if they were taken,
+        otherwise the seconds until enough tokens will be available.
+        """
+        now = time.monotonic()
+        entry = self._live(key)
+        tokens, updated = entry[1] if entry else (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._make_room(key)
+        # A bucket left alone until it is full again is the same as no bucket.
+        self._data[key] = (now + (capacity - tokens) / rate + 1.0, (tokens, now))
+        return wait
+
+    @asynccontextmanager
+    async def lock(self, key: str, ttl: float = 10.0) -> AsyncIterator[None]:
+        """Serializes short read-modify-write sections on `key`. `ttl` only matters for Redis."""
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def close(self) -> None:
+        pass
+
+
+# Token bucket as one atomic step, timed by the Redis server's clock so every
+# worker sees the same refill. Returns the wait in seconds as a string (Lua
+# numbers would be truncated to integers in the reply).
+_TAKE_TOKENS_SCRIPT = """
+local capacity, rate, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(((capacity - tokens) / rate + 1) * 1000))
+return tostring(wait)
+"""
+
+
+class RedisStore:
+    """Redis-backed store shared by every worker and container. Values are stored as JSON."""
+    def __init__(self, url: str, prefix: str = "sta:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ValueError("SHARED_STATE_URL points to Redis, but the 'redis' package is not installed.")
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+        self._take_tokens = self._redis.register_script(_TAKE_TOKENS_SCRIPT)
+
+    async def get(self, key: str) -> Any:
+        raw = await self._redis.get(self.prefix + key)
+        return loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._redis.set(self.prefix + key, dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self.prefix + key)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically increments a counter; `ttl` applies when the counter is created."""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.incrby(self.prefix + key, amount)
+            if ttl:
+                pipe.pexpire(self.prefix + key, int(ttl * 1000), nx=True)
+            value, *_ = await pipe.execute()
+        return value
+
+    async def take_tokens(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> float:
+        """See InProcessStore.take_tokens."""
+        wait = await self._take_tokens(keys=[self.prefix + key], args=[capacity, rate, cost])
+        return float(wait)
+
+    @asynccontextmanager
+    async def lock(self, key: str, ttl: float = 10.0) -> AsyncIterator[None]:
+        """
+        A lock shared by every worker, held at most `ttl` seconds (so a crashed
+        holder cannot block the key for good). Waits up to `ttl` to acquire it.
+        """
+        async with self._redis.lock(f"{self.prefix}lock:{key}", timeout=ttl, blocking_timeout=ttl):
+            yield
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def _create_store():
+    url = os.getenv("SHARED_STATE_URL")
+    if not url:
+        return InProcessStore()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisStore(url, prefix=os.getenv("SHARED_STATE_PREFIX", "sta:"))
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme: {url.split(':', 1)[0]}")
+
+
+store = _create_store()
+is_shared = not isinstance(store, InProcessStore)
@@ -0,0 +1,163 @@
+# /app/backend/startup_profile.py
+
+# Cold-start accounting for a worker. `main` imports this module first, so the
+# profile's clock starts before the rest of the app is imported; each startup
+# step (and each deferred SDK import) is then timed, exported as
+# `startup_step_seconds{step=...}` and logged as one line once the worker is ready.
+#
+# Run as a script for a per-module import-time breakdown (python -X importtime),
+# optionally followed by the app's own startup steps:
+#
+#   python startup_profile.py --top 20
+#   python startup_profile.py --startup      # needs the usual .env / service URLs
+
+import os
+import re
+import sys
+import time
+import asyncio
+import argparse
+import importlib
+import threading
+import subprocess
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Any, Awaitable, Dict, List, Tuple
+
+from logger import get_logger
+from metrics import startup_step_duration
+
+log = get_logger(__name__)
+
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps: Dict[str, float] = {}
+
+    def record(self, step: str, seconds: float) -> None:
+        self.steps[step] = seconds
+        startup_step_duration.set(seconds, step=step)
+
+    def since_start(self, step: str) -> None:
+        """Records the time from this module's import until now as `step`."""
+        self.record(step, time.perf_counter() - self.started)
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    async def timed(self, name: str, awaitable: Awaitable) -> Any:
+        with self.step(name):
+            return await awaitable
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "steps": {step: round(seconds, 4) for step, seconds in self.steps.items()},
+        }
+
+    def log_report(self) -> None:
+        report = self.report()
+        steps = ", ".join(f"{step}={seconds * 1000:.0f}ms" for step, seconds in report["steps"].items())
+        log.info(f"Startup profile (pid {os.getpid()}): ready after {report['total_seconds']:.2f}s; {steps}")
+
+
+profile = StartupProfile()
+
+
+_loaded: Dict[str, ModuleType] = {}
+# Deferred imports run in worker threads; concurrent imports of packages that share
+# dependencies (secret_sdk and the Apillon client both pull in aiohttp) can observe
+# half-initialized modules, so they are serialized.
+_import_lock = threading.Lock()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Imports a heavy SDK module on first use instead of at app import time, and
+    records how long that took. The first call may block; make it from a worker
+    thread (asyncio.to_thread) when it can happen on the event loop.
+    """
+    module = _loaded.get(name)
+    if module is None:
+        with _import_lock:
+            if name not in _loaded:
+                if name in sys.modules:
+                    _loaded[name] = importlib.import_module(name)
+                else:
+                    with profile.step(f"import {name}"):
+                        _loaded[name] = importlib.import_module(name)
+            module = _loaded[name]
+    return module
+
+
+# --- Import-time report ---
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(module: str = "main") -> List[Tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) for every module imported by `import <module>`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        errors = "\n".join(line for line in result.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"import {module} failed:\n{errors[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def print_import_report(rows: List[Tuple[str, int, int, int]], top: int) -> None:
+    total = sum(self_us for _, self_us, _, _ in rows)
+    by_package: Dict[str, int] = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    print(f"{len(rows)} modules imported in {total / 1000:.0f} ms\n")
+    print(f"{'package':<32} {'self ms':>9} {'share':>7}")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"{package:<32} {self_us / 1000:>9.1f} {self_us / total:>7.1%}")
+    print(f"\n{'module (cumulative)':<48} {'ms':>9}")
+    for name, _, cumulative_us, _ in sorted(rows, key=lambda row: -row[2])[:top]:
+        print(f"{name:<48} {cumulative_us / 1000:>9.1f}")
+
+
+async def profile_startup() -> Dict[str, Any]:
+    """Imports the app and runs its startup (waiting for the warmup) and shutdown handlers."""
+    # Run as a script, this file is `__main__`; the app records into the `startup_profile` module's profile.
+    import main
+    from startup_profile import profile as app_profile
+    await main.startup_event()
+    await asyncio.gather(main.startup_state["task"], return_exceptions=True)
+    report = app_profile.report()
+    await main.shutdown_event()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend cold-start profile")
+    parser.add_argument("--module", default="main", help="module whose import is profiled")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--startup", action="store_true",
+                        help="also run the app's startup steps in-process (connects to the configured services)")
+    args = parser.parse_args()
+
+    print_import_report(import_times(args.module), args.top)
+    if args.startup:
+        report = asyncio.run(profile_startup())
+        print(f"\n{'startup step':<48} {'ms':>9}")
+        for step, seconds in report["steps"].items():
+            print(f"{step:<48} {seconds * 1000:>9.1f}")
+        print(f"{'all warmups done':<48} {report['total_seconds'] * 1000:>9.1f}")
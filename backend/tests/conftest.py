@@ -0,0 +1,25 @@
+# /app/backend/tests/conftest.py
+
+# Backend modules import each other as top-level modules (as under uvicorn), so
+# the backend directory goes on sys.path. Run from backend/: python -m pytest tests
+
+import os
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# Module-level singletons (storage client, agent) check their settings at import
+# or construction; tests never reach these services, so placeholders do.
+for name, value in {
+    "MNEMONIC": "test test test test test test test test test test test junk",
+    "SECRET_AI_URL": "http://127.0.0.1:9",
+    "SECRET_AI_API_KEY": "test",
+    "APILLON_API_KEY": "test",
+    "APILLON_API_SECRET": "test",
+    "APILLON_BUCKET_UUID": "test",
+    "JWT_SECRET_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
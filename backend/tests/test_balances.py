@@ -0,0 +1,239 @@
+# /app/backend/tests/test_balances.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import balances
+import shared_state
+from balances import TOKENS, BalanceService
+
+USER = "secret1user"
+SPENDER = "secret1agent"
+KEYS = {"sscrt_key": "scrt-key", "susdc_key": "usdc-key"}
+
+
+class FakeWasm:
+    """Stands in for AsyncLCDClient.wasm: answers SNIP-20 queries from `balances`/`allowance`."""
+    def __init__(self, balances=None, allowance=None, delay=0.0, bad_keys=()):
+        self.balances = balances or {}
+        self.allowance = allowance or {"allowance": "0", "expiration": None}
+        self.delay = delay
+        self.bad_keys = set(bad_keys)
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def contract_query(self, contract_address, query, contract_code_hash=None):
+        self.calls.append((contract_address, query, contract_code_hash))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        (kind, args), = query.items()
+        if args["key"] in self.bad_keys:
+            raise RuntimeError("Wrong viewing key for this address or viewing key not set")
+        if kind == "balance":
+            return {"balance": {"amount": self.balances[contract_address]}}
+        return {"allowance": self.allowance}
+
+
+class FakeClient:
+    def __init__(self, **kwargs):
+        self.wasm = FakeWasm(**kwargs)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(shared_state, "store", shared_state.InProcessStore())
+    # Only the store's clock; asyncio keeps the real one.
+    monkeypatch.setattr(shared_state, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def users(monkeypatch):
+    users = {}
+
+    async def get_user(user_id):
+        return users.get(user_id)
+
+    monkeypatch.setattr(balances.db, "get_user", get_user)
+    return users
+
+
+def token_address(token):
+    return TOKENS[token][0]
+
+
+def chain_balances(sscrt="1500000", susdc="250000"):
+    return {token_address("sSCRT"): sscrt, token_address("sUSDC"): susdc}
+
+
+def test_balances_are_queried_together(clock, users):
+    users[USER] = dict(KEYS)
+    client = FakeClient(balances=chain_balances(), delay=0.01)
+    service = BalanceService()
+
+    result = asyncio.run(service.get_balances(client, USER))
+
+    assert result == {"sSCRT": "1.5", "sUSDC": "0.25"}
+    queries = {address: (query, code_hash) for address, query, code_hash in client.wasm.calls}
+    assert queries == {
+        token_address("sSCRT"): ({"balance": {"address": USER, "key": "scrt-key"}}, TOKENS["sSCRT"][1]),
+        token_address("sUSDC"): ({"balance": {"address": USER, "key": "usdc-key"}}, TOKENS["sUSDC"][1]),
+    }
+    # Both tokens were in flight at once.
+    assert client.wasm.max_in_flight == 2
+
+
+def test_concurrent_requests_share_one_round(clock, users):
+    users[USER] = dict(KEYS)
+    client = FakeClient(balances=chain_balances(), delay=0.01)
+    service = BalanceService()
+
+    async def burst():
+        return await asyncio.gather(*(service.get_balances(client, USER) for _ in range(5)))
+
+    results = asyncio.run(burst())
+
+    assert all(result == results[0] for result in results)
+    assert len(client.wasm.calls) == 2
+
+
+def test_concurrency_is_bounded(clock, users):
+    for i in range(6):
+        users[f"secret1user{i}"] = dict(KEYS)
+    client = FakeClient(balances=chain_balances(), delay=0.01)
+    service = BalanceService(max_concurrency=3)
+
+    async def burst():
+        return await asyncio.gather(*(service.get_balances(client, f"secret1user{i}") for i in range(6)))
+
+    asyncio.run(burst())
+
+    assert len(client.wasm.calls) == 12
+    assert client.wasm.max_in_flight == 3
+
+
+def test_cache_expires_after_ttl(clock, users):
+    users[USER] = dict(KEYS)
+    client = FakeClient(balances=chain_balances())
+    service = BalanceService(ttl_seconds=15)
+
+    asyncio.run(service.get_balances(client, USER))
+    client.wasm.balances = chain_balances(sscrt="2000000")
+    clock.now += 14
+    assert asyncio.run(service.get_balances(client, USER))["sSCRT"] == "1.5"
+    assert len(client.wasm.calls) == 2
+
+    clock.now += 2
+    assert asyncio.run(service.get_balances(client, USER))["sSCRT"] == "2"
+    assert len(client.wasm.calls) == 4
+
+
+def test_invalidate_forces_a_fresh_read(clock, users):
+    users[USER] = dict(KEYS)
+    client = FakeClient(balances=chain_balances())
+    service = BalanceService()
+
+    asyncio.run(service.get_balances(client, USER))
+    client.wasm.balances = chain_balances(susdc="0")
+    asyncio.run(service.invalidate(USER))
+
+    assert asyncio.run(service.get_balances(client, USER))["sUSDC"] == "0"
+    assert len(client.wasm.calls) == 4
+
+
+def test_log_trade_invalidates_balances(clock, users, monkeypatch):
+    import agent
+
+    invalidated = []
+
+    async def enqueue(**record):
+        pass
+
+    async def invalidate(user_id, spender=None):
+        invalidated.append((user_id, spender))
+
+    monkeypatch.setattr(agent.trade_log_queue, "enqueue", enqueue)
+    monkeypatch.setattr(agent.balance_service, "invalidate", invalidate)
+
+    trading_agent = agent.TradingAgent()
+    asyncio.run(trading_agent._save_trade_history(USER, "Trade successful! Hash: ABC"))
+
+    assert invalidated == [(USER, trading_agent.get_agent_secret_address())]
+
+
+def test_missing_viewing_key_is_none_and_not_queried(clock, users):
+    users[USER] = {"sscrt_key": "scrt-key", "susdc_key": None}
+    client = FakeClient(balances=chain_balances())
+    service = BalanceService()
+
+    assert asyncio.run(service.get_balances(client, USER)) == {"sSCRT": "1.5", "sUSDC": None}
+    assert [address for address, _, _ in client.wasm.calls] == [token_address("sSCRT")]
+
+
+def test_invalid_viewing_key_is_none_and_not_cached(clock, users):
+    users[USER] = dict(KEYS)
+    client = FakeClient(balances=chain_balances(), bad_keys={"usdc-key"})
+    service = BalanceService()
+
+    assert asyncio.run(service.get_balances(client, USER)) == {"sSCRT": "1.5", "sUSDC": None}
+
+    # Fixing the key shows up right away: partial results are not cached.
+    client.wasm.bad_keys.clear()
+    assert asyncio.run(service.get_balances(client, USER)) == {"sSCRT": "1.5", "sUSDC": "0.25"}
+
+
+def test_unknown_user_has_no_balances(clock, users):
+    client = FakeClient(balances=chain_balances())
+
+    assert asyncio.run(BalanceService().get_balances(client, USER)) == {"sSCRT": None, "sUSDC": None}
+    assert client.wasm.calls == []
+
+
+@pytest.mark.parametrize("granted, allowed", [("300000", True), ("1000000", True), ("299999", False), ("0", False)])
+def test_check_allowed_to_spend(clock, users, granted, allowed):
+    users[USER] = dict(KEYS)
+    client = FakeClient(allowance={"allowance": granted, "expiration": 1_900_000_000})
+
+    result = asyncio.run(BalanceService().check_allowed_to_spend(client, USER, SPENDER, "300000"))
+
+    assert result["allowed"] is allowed
+    assert result["required"] == "0.3"
+    assert result["expiration"] == 1_900_000_000
+    (address, query, _), = client.wasm.calls
+    assert address == token_address("sUSDC")
+    assert query == {"allowance": {"owner": USER, "spender": SPENDER, "key": "usdc-key"}}
+
+
+def test_check_allowed_to_spend_needs_a_viewing_key(clock, users):
+    users[USER] = {"sscrt_key": "scrt-key", "susdc_key": None}
+    with pytest.raises(ValueError):
+        asyncio.run(BalanceService().check_allowed_to_spend(FakeClient(), USER, SPENDER, "300000"))
+
+
+def test_allowance_is_cached_until_invalidated(clock, users):
+    users[USER] = dict(KEYS)
+    client = FakeClient(allowance={"allowance": "0"})
+    service = BalanceService()
+
+    assert asyncio.run(service.check_allowed_to_spend(client, USER, SPENDER, "300000"))["allowed"] is False
+    client.wasm.allowance = {"allowance": "300000"}
+    assert asyncio.run(service.check_allowed_to_spend(client, USER, SPENDER, "300000"))["allowed"] is False
+
+    asyncio.run(service.invalidate(USER, SPENDER))
+    assert asyncio.run(service.check_allowed_to_spend(client, USER, SPENDER, "300000"))["allowed"] is True
@@ -0,0 +1,51 @@
+# /app/backend/tests/test_history_cache.py
+
+import os
+import asyncio
+
+from history_cache import TradeHistoryCache
+
+USER = "secret1user"
+
+
+def record(timestamp):
+    return {"user_id": USER, "timestamp": timestamp, "message": "TRADE_EXECUTION", "response": "ok"}
+
+
+def saved_cache(state_dir, **kwargs):
+    cache = TradeHistoryCache(state_dir=state_dir, **kwargs)
+    cache.merge(USER, {"a.json": record(1)}, cursor="2026-01-01T00:00:00Z", directory_uuid="dir-1")
+    asyncio.run(cache.save(USER))
+    return cache
+
+
+def test_nothing_is_read_until_a_user_is_seen(tmp_path):
+    saved_cache(str(tmp_path))
+
+    cache = TradeHistoryCache(state_dir=str(tmp_path))
+
+    assert cache._entries == {}
+    # Restored entries are stale, so the next lookup refreshes from the cursor.
+    assert cache.get(USER) is None
+    assert cache.listing_state(USER) == {
+        "cursor": "2026-01-01T00:00:00Z", "directory_uuid": "dir-1", "legacy_scanned": False,
+    }
+    assert cache.known_files(USER) == {"a.json"}
+    assert list(cache._entries) == [USER]
+
+
+def test_an_evicted_user_gets_the_persisted_cursor_back(tmp_path):
+    cache = saved_cache(str(tmp_path), max_users=1)
+    cache.merge("secret1other", {})
+
+    assert list(cache._entries) == ["secret1other"]
+    assert cache.listing_state(USER)["cursor"] == "2026-01-01T00:00:00Z"
+    assert cache.records(USER) == [record(1)]
+
+
+def test_a_user_without_a_state_file_starts_empty(tmp_path):
+    cache = TradeHistoryCache(state_dir=str(tmp_path))
+
+    assert cache.listing_state(USER) == {"cursor": None, "directory_uuid": None, "legacy_scanned": False}
+    assert cache.records(USER) == []
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,162 @@
+# /app/backend/tests/test_ledger.py
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import subprocess
+
+import pytest
+
+from conftest import BACKEND
+import ledger as ledger_module
+from arweave_storage import storage_client
+from ledger import TradeLedger
+from trade_journal import TradeLogQueue, trade_log_queue
+
+
+def trade(user_id, timestamp):
+    return {
+        "id": f"{timestamp:032x}",
+        "user_id": user_id,
+        "timestamp": timestamp,
+        "message": "TRADE_EXECUTION",
+        "response": "Trade successful! Hash: ABC",
+    }
+
+
+def timestamps(path, user_id="secret1user"):
+    fresh = TradeLedger(path)
+    fresh.open()
+    try:
+        return [record["timestamp"] for record in fresh.read_user(user_id)]
+    finally:
+        fresh.close()
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "trade_ledger.bin")
+
+
+@pytest.fixture
+def worker(path):
+    """A second process's handle on the same ledger file."""
+    other = TradeLedger(path)
+    other.open()
+    yield other
+    other.close()
+
+
+def test_append_after_another_instance_rewrote_the_file(path, worker):
+    ledger = TradeLedger(path)
+    ledger.open()
+    ledger.append(trade("secret1user", 1))
+
+    worker.rewrite([trade("secret1user", 0)])
+    # `ledger` still holds the replaced file open; the append must land in the new one.
+    ledger.append(trade("secret1user", 2))
+
+    assert timestamps(path) == [0, 2]
+    assert ledger.read_user("secret1user") == [trade("secret1user", 0), trade("secret1user", 2)]
+    ledger.close()
+
+
+def test_rebuild_keeps_an_append_that_waited_on_the_lock(path, worker):
+    ledger = TradeLedger(path)
+    ledger.open()
+    worker.append(trade("secret1user", 1))
+    seen = []
+
+    def build(local_records):
+        seen.extend(record["timestamp"] for record in local_records)
+        # The other instance appends mid-rebuild; it blocks on the file lock until the swap.
+        appender.start()
+        time.sleep(0.2)
+        assert appender.is_alive()
+        return [trade("secret1user", 0)] + local_records
+
+    appender = threading.Thread(target=worker.append, args=(trade("secret1user", 2),))
+    ledger.rebuild(build)
+    appender.join(5)
+
+    assert seen == [1]
+    assert timestamps(path) == [0, 1, 2]
+    ledger.close()
+
+
+def test_reconcile_keeps_records_appended_during_the_rebuild(path, worker, monkeypatch):
+    ledger = TradeLedger(path)
+    monkeypatch.setattr(ledger_module, "ledger", ledger)
+    uploaded = trade("secret1user", 1)
+    worker.append(trade("secret1user", 2))
+    checkpoints = []
+    record_key = storage_client.record_key
+
+    async def get_all_trade_records():
+        return {record_key(uploaded): uploaded}, {record_key(uploaded)}
+
+    def record_key_during_a_trade(record):
+        # Another worker journals a trade after reconcile has read the local records.
+        if not appender.is_alive():
+            appender.start()
+            time.sleep(0.2)
+        return record_key(record)
+
+    appender = threading.Thread(target=worker.append, args=(trade("secret1user", 3),))
+    monkeypatch.setattr(storage_client, "get_all_trade_records", get_all_trade_records)
+    monkeypatch.setattr(storage_client, "record_key", record_key_during_a_trade)
+    monkeypatch.setattr(trade_log_queue, "write_checkpoint", checkpoints.append)
+
+    asyncio.run(ledger_module.reconcile())
+    appender.join(5)
+
+    assert timestamps(path) == [1, 2, 3]
+    # Only the bucket's record counts as replicated; the others are left for the flusher.
+    assert checkpoints == [ledger.read_from(0)[0][0]]
+    ledger.close()
+
+
+def test_reconcile_cli_refuses_while_a_worker_holds_the_replication_lock(path, tmp_path):
+    checkpoint = str(tmp_path / "trade_ledger.replicated")
+    flusher = TradeLogQueue(checkpoint)
+    assert flusher.try_acquire_leadership()
+    worker = TradeLedger(path)
+    worker.open()
+    worker.append(trade("secret1user", 1))
+    try:
+        result = subprocess.run(
+            [sys.executable, "ledger.py", "reconcile"],
+            cwd=BACKEND,
+            env={**os.environ, "LEDGER_PATH": path, "LEDGER_REPLICATION_CHECKPOINT": checkpoint},
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+    finally:
+        worker.close()
+        flusher._release_leadership()
+
+    assert result.returncode == 1
+    assert "replication lock" in result.stdout
+    assert timestamps(path) == [1]
+    assert not os.path.exists(checkpoint)
+
+
+@pytest.mark.parametrize("record_format", ["json", "msgpack"])
+def test_reads_decode_from_the_map_and_release_it(path, worker, record_format, monkeypatch):
+    import serialization
+
+    monkeypatch.setattr(serialization, "RECORD_FORMAT", record_format)
+    ledger = TradeLedger(path)
+    ledger.open()
+    ledger.append(trade("secret1user", 1))
+    ledger.append(trade("secret1other", 2))
+    assert ledger.read_user("secret1user") == [trade("secret1user", 1)]
+
+    # Picking up another instance's append re-creates the map, which fails while a view is exported.
+    worker.append(trade("secret1user", 3))
+    assert [r["timestamp"] for r in ledger.read_user("secret1user")] == [1, 3]
+    assert [r["timestamp"] for _, r in ledger.read_from(0)] == [1, 2, 3]
+    ledger.close()
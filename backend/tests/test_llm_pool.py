@@ -0,0 +1,159 @@
+# /app/backend/tests/test_llm_pool.py
+
+import os
+import sys
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+from conftest import BACKEND
+from llm_pool import LLMEndpoint, LLMPool, LLMUnavailableError
+
+sys.path.insert(0, os.path.join(BACKEND, "benchmarks"))
+from fake_services import Latency, ollama_app  # noqa: E402
+
+MODEL = "bench-model"
+# Nothing listens here, so requests fail before their first token.
+DOWN = "http://127.0.0.1:9"
+MESSAGES = [{"role": "user", "content": "Should I buy sSCRT?"}]
+
+
+@asynccontextmanager
+async def fake_ollama(**kwargs):
+    """The benchmarks' Ollama stand-in on a local port. Yields its URL and the chat requests it served."""
+    app = ollama_app(model=MODEL, **kwargs)
+    chats = []
+
+    async def record(request, response):
+        if request.path == "/api/chat":
+            chats.append(request)
+
+    app.on_response_prepare.append(record)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    host, port = runner.addresses[0][:2]
+    try:
+        yield f"http://{host}:{port}", chats
+    finally:
+        await runner.cleanup()
+
+
+def endpoint(host, max_concurrency=4):
+    return LLMEndpoint(host, MODEL, api_key=None, max_concurrency=max_concurrency)
+
+
+async def collect(stream):
+    async with aclosing(stream):
+        return [content async for content in stream]
+
+
+def test_saturated_primary_fails_over_to_the_next_endpoint():
+    async def scenario():
+        async with fake_ollama(tokens=3) as (url, chats):
+            primary, secondary = endpoint(url, max_concurrency=1), endpoint(url, max_concurrency=2)
+            pool = LLMPool([primary, secondary], queue_timeout=1.0, coalesce=False)
+            # Both endpoints are full; the primary sorts first on latency and never frees up.
+            primary.latency, secondary.latency = 0.1, 0.5
+            await pool._acquire(primary, 0)
+            for _ in range(2):
+                await pool._acquire(secondary, 0)
+            asyncio.get_running_loop().call_later(0.1, pool._release, secondary)
+
+            answer = await pool.chat(MESSAGES)
+
+            assert answer == "the market looks "
+            assert len(chats) == 1
+            assert primary.healthy and primary.in_flight == 1
+            assert secondary.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_all_endpoints_down_raises_unavailable():
+    async def scenario():
+        pool = LLMPool([endpoint(DOWN), endpoint(DOWN)], queue_timeout=1.0, coalesce=False)
+        with pytest.raises(LLMUnavailableError):
+            await pool.chat(MESSAGES)
+        assert [e.healthy for e in pool.endpoints] == [False, False]
+        assert [e.in_flight for e in pool.endpoints] == [0, 0]
+
+    asyncio.run(scenario())
+
+
+def test_failed_endpoint_fails_over_before_the_first_token():
+    async def scenario():
+        async with fake_ollama(tokens=2) as (url, chats):
+            down, up = endpoint(DOWN), endpoint(url)
+            down.latency, up.latency = 0.1, 0.5
+            pool = LLMPool([down, up], queue_timeout=1.0, coalesce=False)
+
+            assert await pool.chat(MESSAGES) == "the market "
+            assert not down.healthy and up.healthy
+            assert len(chats) == 1
+
+    asyncio.run(scenario())
+
+
+def test_identical_streams_share_one_generation():
+    async def scenario():
+        async with fake_ollama(tokens=5, token_latency=Latency(0.02)) as (url, chats):
+            pool = LLMPool([endpoint(url)])
+
+            first, second = await asyncio.gather(
+                collect(pool.chat_stream(MESSAGES)), collect(pool.chat_stream(MESSAGES)),
+            )
+            other = await collect(pool.chat_stream([{"role": "user", "content": "And sUSDC?"}]))
+
+            assert first == second == ["the ", "market ", "looks ", "steady ", "today ", ""]
+            assert len(other) == 6
+            # One upstream request for the identical pair, one for the different prompt.
+            assert len(chats) == 2
+            assert pool._in_flight == {}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_subscriber_leaves_the_shared_stream_running():
+    async def scenario():
+        async with fake_ollama(tokens=5, token_latency=Latency(0.02)) as (url, chats):
+            pool = LLMPool([endpoint(url)])
+            first_chunk = asyncio.Event()
+
+            async def leaves_early():
+                async with aclosing(pool.chat_stream(MESSAGES)) as stream:
+                    async for _ in stream:
+                        first_chunk.set()
+                        await asyncio.sleep(3600)
+
+            quitter = asyncio.create_task(leaves_early())
+            stayer = asyncio.create_task(collect(pool.chat_stream(MESSAGES)))
+            await first_chunk.wait()
+            quitter.cancel()
+
+            assert len(await stayer) == 6
+            with pytest.raises(asyncio.CancelledError):
+                await quitter
+            assert len(chats) == 1
+            assert pool.endpoints[0].in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_last_subscriber_leaving_cancels_the_generation():
+    async def scenario():
+        async with fake_ollama(tokens=50, token_latency=Latency(0.05)) as (url, chats):
+            pool = LLMPool([endpoint(url)])
+
+            async with aclosing(pool.chat_stream(MESSAGES)) as stream:
+                assert await stream.__anext__() == "the "
+                (shared,) = pool._in_flight.values()
+
+            await asyncio.wait_for(asyncio.shield(shared.task), 1.0)
+            assert shared.done and isinstance(shared.error, LLMUnavailableError)
+            assert pool._in_flight == {}
+            assert pool.endpoints[0].in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,161 @@
+# /app/backend/tests/test_routing.py
+
+import os
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FIXTURES
+from routing import RouteEngine, best_routes, load_snapshot
+
+USDC, SCRT, SILK, ATOM = "secret1usdc", "secret1scrt", "secret1silk", "secret1atom"
+
+
+def snapshot(name):
+    return os.path.join(FIXTURES, name)
+
+
+def addresses(path):
+    return [pool.contract.address for pool in path]
+
+
+def chained_out(path, token, amount):
+    for pool in path:
+        amount = pool.swap_out(token, amount)
+        token = pool.token_1 if token == pool.token_0 else pool.token_0
+    return amount
+
+
+def quote_many(engine, offer, ask, amounts):
+    # Snapshot-backed engines never touch the LCD client.
+    return asyncio.run(engine.quote_many(None, offer, ask, amounts))
+
+
+def test_best_routes_prefers_direct_pool_for_small_amounts():
+    pools = load_snapshot(snapshot("pools_multihop.json"))
+    out, paths = best_routes(pools, USDC, SCRT, [1_000_000])
+    assert addresses(paths[0]) == ["secret1pairusdcscrt"]
+    assert out[0] == pytest.approx(chained_out(paths[0], USDC, 1_000_000), rel=1e-6)
+
+
+def test_best_routes_goes_multi_hop_when_the_direct_pool_is_thin():
+    pools = load_snapshot(snapshot("pools_multihop.json"))
+    # One vectorized pass: a small and a large amount end up on different paths.
+    out, paths = best_routes(pools, USDC, SCRT, [1_000_000, 2_000_000_000])
+    assert addresses(paths[0]) == ["secret1pairusdcscrt"]
+    assert addresses(paths[1]) == ["secret1pairusdcsilk", "secret1pairsilkscrt"]
+    direct = pools[0].swap_out(USDC, 2_000_000_000)
+    assert chained_out(paths[1], USDC, 2_000_000_000) > direct
+
+
+def test_best_routes_reaches_tokens_without_a_direct_pool():
+    pools = load_snapshot(snapshot("pools_multihop.json"))
+    _, paths = best_routes(pools, USDC, ATOM, [1_000_000], max_hops=2)
+    assert addresses(paths[0]) == ["secret1pairusdcsilk", "secret1pairsilkatom"]
+
+
+def test_best_routes_takes_a_longer_path_when_it_pays_more():
+    # SILK is cheaper bought with SCRT from the direct pool than with USDC.
+    pools = load_snapshot(snapshot("pools_multihop.json"))
+    _, paths = best_routes(pools, USDC, ATOM, [1_000_000], max_hops=3)
+    _, two_hop = best_routes(pools, USDC, ATOM, [1_000_000], max_hops=2)
+    assert addresses(paths[0]) == ["secret1pairusdcscrt", "secret1pairsilkscrt", "secret1pairsilkatom"]
+    assert chained_out(paths[0], USDC, 1_000_000) > chained_out(two_hop[0], USDC, 1_000_000)
+
+
+def test_best_routes_does_not_reuse_a_pool():
+    # cheap -> dear -> cheap again would beat the direct swap, but reuses a pool.
+    pools = load_snapshot(snapshot("pools_arbitrage.json"))
+    _, paths = best_routes(pools, USDC, SCRT, [1_000_000, 10_000_000_000], max_hops=3)
+    for path in paths:
+        assert addresses(path) == ["secret1paircheapscrt"]
+        assert len(set(path)) == len(path)
+
+
+def test_best_routes_without_a_route():
+    pools = load_snapshot(snapshot("pools_arbitrage.json"))
+    out, paths = best_routes(pools, USDC, ATOM, [1_000_000])
+    assert out[0] == 0
+    assert paths[0] is None
+
+
+def test_best_routes_respects_max_hops():
+    pools = load_snapshot(snapshot("pools_multihop.json"))
+    _, paths = best_routes(pools, USDC, ATOM, [1_000_000], max_hops=1)
+    assert paths[0] is None
+
+
+def test_quote_many_uses_exact_amounts_and_dedupes():
+    engine = RouteEngine(snapshot_path=snapshot("pools_multihop.json"), slippage_bps=50)
+    small, large, again = quote_many(engine, USDC, SCRT, [1_000_000, 2_000_000_000, 1_000_000])
+    pools = {pool.contract.address: pool for pool in load_snapshot(snapshot("pools_multihop.json"))}
+
+    assert small is again
+    assert [c.address for c in small.path] == ["secret1pairusdcscrt"]
+    assert small.amount_out == pools["secret1pairusdcscrt"].swap_out(USDC, 1_000_000)
+    assert [c.address for c in large.path] == ["secret1pairusdcsilk", "secret1pairsilkscrt"]
+    assert large.amount_out == chained_out(
+        [pools["secret1pairusdcsilk"], pools["secret1pairsilkscrt"]], USDC, 2_000_000_000
+    )
+    assert large.min_out == large.amount_out * 9950 // 10_000
+
+
+def test_quote_many_returns_none_without_a_route():
+    engine = RouteEngine(snapshot_path=snapshot("pools_arbitrage.json"))
+    assert quote_many(engine, USDC, ATOM, [1_000_000]) == [None]
+    with pytest.raises(ValueError):
+        asyncio.run(engine.quote(None, USDC, ATOM, 1_000_000))
+
+
+@pytest.mark.parametrize("slippage_bps, amount_out, expected", [
+    (50, 1_000_000, 995_000),
+    (50, 999, 994),
+    (0, 123_456, 123_456),
+    (10_000, 123_456, 0),
+])
+def test_min_out(slippage_bps, amount_out, expected):
+    assert RouteEngine(slippage_bps=slippage_bps)._min_out(amount_out) == expected
+
+
+class SnapshotWasm:
+    """Answers the factory's pair listing and each pair's `get_pair_info`."""
+    def __init__(self, pools):
+        self.pools = {pool.contract.address: pool for pool in pools}
+
+    async def contract_query(self, contract_address, query, contract_code_hash=None):
+        if "list_a_m_m_pairs" in query:
+            pairs = [{"address": p.contract.address, "code_hash": p.contract.code_hash} for p in self.pools.values()]
+            return {"list_a_m_m_pairs": {"amm_pairs": pairs}}
+        pool = self.pools[contract_address]
+        return {"get_pair_info": {
+            "pair": [{"custom_token": {"contract_addr": pool.token_0}}, {"custom_token": {"contract_addr": pool.token_1}}],
+            "amount_0": str(pool.reserve_0),
+            "amount_1": str(pool.reserve_1),
+            "fee_info": {"lp_fee": {"nom": pool.fee_nom, "denom": pool.fee_denom}},
+        }}
+
+
+def test_write_snapshot_builds_the_client_off_the_running_loop(tmp_path, monkeypatch):
+    import agent
+    import routing
+
+    pools = load_snapshot(snapshot("pools_multihop.json"))
+    built = []
+
+    def build_lcd_client(url, chain_id):
+        # AsyncLCDClient's constructor blocks on its own loop, so it must not run on the caller's.
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        built.append((url, chain_id))
+        return SimpleNamespace(wasm=SnapshotWasm(pools))
+
+    monkeypatch.setattr(agent, "_build_lcd_client", build_lcd_client)
+    monkeypatch.setenv("SHADE_FACTORY_ADDRESS", "secret1factory")
+    path = str(tmp_path / "pools.json")
+
+    count = asyncio.run(routing.write_snapshot(path, "http://lcd.test", "secret-4"))
+
+    assert built == [("http://lcd.test", "secret-4")]
+    assert count == len(pools)
+    assert load_snapshot(path) == pools
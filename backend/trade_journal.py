@@ -0,0 +1,190 @@
+# /app/backend/trade_journal.py
+
+import os
+import fcntl
+import random
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from arweave_storage import storage_client
+from ledger import ledger
+from scheduler import storage_scheduler
+from logger import get_logger
+
+log = get_logger(__name__)
+
+
+class TradeLogQueue:
+    """
+    A durable write-behind queue that replicates the local trade ledger to Arweave.
+
+    `enqueue` returns as soon as the record has been appended (and fsynced) to the
+    ledger, which is the primary store for trade history. A background flusher
+    groups records past the replication checkpoint into a single multi-file
+    Apillon upload session and retries failed batches with exponential backoff.
+    The checkpoint (a ledger offset) only moves forward after a successful upload,
+    so pending records are replayed from the ledger on the next startup after a crash.
+
+    When several workers share the ledger, only the one holding the replication
+    lock runs the flusher; the others keep trying to take it over, so replication
+    continues if that worker exits.
+    """
+    def __init__(self, checkpoint_path: str, batch_size: int = 50, flush_interval: float = 2.0,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.checkpoint_path = checkpoint_path
+        self.lock_path = f"{checkpoint_path}.lock"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock_fd: Optional[int] = None
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    # --- Checkpoint file operations (run in a worker thread) ---
+    def read_checkpoint(self) -> int:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def write_checkpoint(self, offset: int) -> None:
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def try_acquire_leadership(self) -> bool:
+        """Takes the cross-process replication lock without blocking. Returns True if held."""
+        if self._lock_fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _release_leadership(self) -> None:
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_fd is not None
+
+    # --- Public API ---
+    async def start(self, reconcile: bool = False) -> None:
+        """
+        Opens the ledger and starts the background flusher. If `reconcile` is set and
+        this worker wins the replication lock, the ledger is first rebuilt from the bucket.
+        """
+        if self._flusher is not None:
+            return
+        self._stopping = False
+        await asyncio.to_thread(ledger.open)
+        if await asyncio.to_thread(self.try_acquire_leadership):
+            log.info(f"This worker (pid {os.getpid()}) replicates the ledger to Arweave.")
+            if reconcile:
+                from ledger import reconcile as reconcile_ledger
+                await reconcile_ledger()
+            self._wakeup.set()
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Stops the flusher after one last attempt to upload what is pending."""
+        if self._flusher is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._flusher, timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning("Records not yet replicated are left in the ledger for the next startup.")
+        self._flusher = None
+        self._release_leadership()
+        await asyncio.to_thread(ledger.close)
+
+    async def enqueue(self, user_id: str, message: str, response: str) -> Dict:
+        """Durably appends a trade record to the ledger and schedules it for replication."""
+        record = storage_client.new_record(user_id, message, response)
+        await asyncio.to_thread(ledger.append, record)
+        self._wakeup.set()
+        return record
+
+    # --- Background flusher ---
+    async def _pending(self) -> List[Tuple[int, Dict]]:
+        checkpoint = await asyncio.to_thread(self.read_checkpoint)
+        return await asyncio.to_thread(ledger.read_from, checkpoint)
+
+    async def _flush_batch(self, batch: List[Tuple[int, Dict]]) -> None:
+        # Uploads share Apillon capacity with bucket reads, as one more tenant of the scheduler.
+        async with storage_scheduler.slot("trade_journal"):
+            await storage_client.store_memories([record for _, record in batch])
+        await asyncio.to_thread(self.write_checkpoint, batch[-1][0])
+        log.info(f"Replicated {len(batch)} trade record(s) to Arweave.")
+
+    async def _run(self) -> None:
+        failures = 0
+        while True:
+            if not self.is_leader:
+                # Another worker replicates; take over if it goes away.
+                if self._stopping:
+                    return
+                await asyncio.sleep(self.flush_interval * 5)
+                if await asyncio.to_thread(self.try_acquire_leadership):
+                    log.info(f"Worker pid {os.getpid()} took over ledger replication.")
+                continue
+
+            pending = await self._pending()
+            if not pending:
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                # Records appended by other workers only show up on the next poll.
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    continue
+                # Linger briefly so a burst of trades is grouped into one upload session.
+                if not self._stopping:
+                    await asyncio.sleep(self.flush_interval)
+                continue
+
+            try:
+                await self._flush_batch(pending[:self.batch_size])
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                if self._stopping:
+                    log.warning(f"Final flush failed, keeping records in the ledger. Error: {e}")
+                    return
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+                delay *= random.uniform(0.5, 1.0)
+                log.warning(f"Flush failed (attempt {failures}), retrying in {delay:.1f}s. Error: {e}")
+                await asyncio.sleep(delay)
+
+
+trade_log_queue = TradeLogQueue(
+    checkpoint_path=os.getenv(
+        "LEDGER_REPLICATION_CHECKPOINT",
+        os.path.join(os.path.dirname(__file__), "data", "trade_ledger.replicated"),
+    ),
+    batch_size=int(os.getenv("TRADE_LOG_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("TRADE_LOG_FLUSH_INTERVAL", "2")),
+    backoff_base=float(os.getenv("TRADE_LOG_BACKOFF_BASE", "1")),
+    backoff_max=float(os.getenv("TRADE_LOG_BACKOFF_MAX", "60")),
+)
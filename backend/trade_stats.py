@@ -0,0 +1,185 @@
+# /app/backend/trade_stats.py
+
+# Trade analytics for /api/user/trade_stats. Trade records are parsed once into
+# columnar numpy arrays (timestamp, user, success, on-chain error code) that
+# follow the ledger by offset, so each query only reads the trades logged since
+# the previous one (by any worker) and aggregates with array operations.
+#
+# Records carry the frontend's result text, not amounts, so a trade's outcome is
+# read from "Trade successful! Hash: ..." / "On-chain error (code N): ..." and
+# volume counts the fixed sUSDC amount of every successful trade.
+
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ledger import TradeLedger, ledger
+from logger import get_logger
+
+log = get_logger(__name__)
+
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+# Code column value for failures whose text has no on-chain error code.
+NO_CODE = -1
+
+_ERROR_CODE = re.compile(r"\(code (\d+)\)")
+
+Columns = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def parse_outcome(response: str) -> Tuple[bool, int]:
+    """(succeeded, on-chain error code) for a logged trade result."""
+    if response.startswith("Trade successful"):
+        return True, 0
+    match = _ERROR_CODE.search(response)
+    return False, int(match.group(1)) if match else NO_CODE
+
+
+def columns_from_records(records: Iterable[Dict]) -> Columns:
+    """Timestamp, success and error-code columns for the trade records in `records`."""
+    rows = [
+        (record.get("timestamp") or 0, *parse_outcome(record.get("response") or ""))
+        for record in records if record.get("message") == "TRADE_EXECUTION"
+    ]
+    timestamps, ok, codes = zip(*rows) if rows else ((), (), ())
+    return (np.array(timestamps, dtype=np.int64), np.array(ok, dtype=np.bool_),
+            np.array(codes, dtype=np.int32))
+
+
+def summarize(timestamps: np.ndarray, ok: np.ndarray, codes: np.ndarray, start: Optional[int] = None,
+              end: Optional[int] = None, bucket: Optional[str] = "day", trade_volume: float = 0.0) -> Dict:
+    """
+    Aggregates trades with `start <= timestamp < end`. The series is columnar and
+    sparse: one entry per `bucket` period that has at least one trade.
+    """
+    mask = np.ones(timestamps.size, dtype=np.bool_)
+    if start is not None:
+        mask &= timestamps >= start
+    if end is not None:
+        mask &= timestamps < end
+    timestamps, ok, codes = timestamps[mask], ok[mask], codes[mask]
+
+    trades = int(timestamps.size)
+    successful = int(np.count_nonzero(ok))
+    failure_codes, failure_counts = np.unique(codes[~ok], return_counts=True)
+    summary = {
+        "trades": trades,
+        "successful": successful,
+        "failed": trades - successful,
+        "success_rate": successful / trades if trades else None,
+        "volume_usdc": round(successful * trade_volume, 6),
+        "first_trade": int(timestamps.min()) if trades else None,
+        "last_trade": int(timestamps.max()) if trades else None,
+        "failures_by_code": {
+            ("unknown" if code == NO_CODE else str(code)): int(count)
+            for code, count in zip(failure_codes.tolist(), failure_counts.tolist())
+        },
+    }
+    if bucket:
+        width = BUCKETS[bucket]
+        periods, position = np.unique(timestamps // width, return_inverse=True)
+        per_period = np.bincount(position, minlength=periods.size)
+        ok_per_period = np.bincount(position, weights=ok, minlength=periods.size).astype(np.int64)
+        summary["series"] = {
+            "start": (periods * width).tolist(),
+            "trades": per_period.tolist(),
+            "successful": ok_per_period.tolist(),
+            "volume_usdc": np.round(ok_per_period * trade_volume, 6).tolist(),
+        }
+    return summary
+
+
+class TradeAnalytics:
+    """
+    Columnar copy of every trade in the ledger, for per-user and global stats.
+    Arrays grow by doubling; users are stored as small integer ids.
+    """
+    def __init__(self, source: TradeLedger, initial_capacity: int = 1024):
+        self.ledger = source
+        self.initial_capacity = initial_capacity
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._generation = self.ledger.generation
+        self._offset = 0
+        self._size = 0
+        self._user_ids: Dict[str, int] = {}
+        self._timestamps = np.empty(self.initial_capacity, dtype=np.int64)
+        self._users = np.empty(self.initial_capacity, dtype=np.int32)
+        self._ok = np.empty(self.initial_capacity, dtype=np.bool_)
+        self._codes = np.empty(self.initial_capacity, dtype=np.int32)
+
+    def _grow(self, needed: int) -> None:
+        capacity = max(needed, 2 * self._timestamps.size)
+        for name in ("_timestamps", "_users", "_ok", "_codes"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _append(self, records: List[Dict]) -> None:
+        trades = [r for r in records if r.get("message") == "TRADE_EXECUTION"]
+        if not trades:
+            return
+        timestamps, ok, codes = columns_from_records(trades)
+        users = np.array(
+            [self._user_ids.setdefault(r["user_id"], len(self._user_ids)) for r in trades], dtype=np.int32
+        )
+        end = self._size + len(trades)
+        if end > self._timestamps.size:
+            self._grow(end)
+        self._timestamps[self._size:end] = timestamps
+        self._users[self._size:end] = users
+        self._ok[self._size:end] = ok
+        self._codes[self._size:end] = codes
+        self._size = end
+
+    def refresh(self) -> None:
+        """Parses trades appended to the ledger since the last call. Blocking."""
+        entries = self.ledger.read_from(self._offset)
+        if self.ledger.generation != self._generation:
+            # The ledger was (re)opened, e.g. rebuilt by reconcile; old offsets mean nothing.
+            if self._offset:
+                log.info("Trade ledger was rebuilt; re-reading it for analytics.")
+            self._reset()
+            entries = self.ledger.read_from(0)
+        if entries:
+            self._append([record for _, record in entries])
+            self._offset = entries[-1][0]
+
+    def warmup(self) -> None:
+        """Parses the ledger up front, so the first stats request does not. Blocking."""
+        with self._lock:
+            self.refresh()
+
+    def query(self, user_id: str, start: Optional[int] = None, end: Optional[int] = None,
+              bucket: Optional[str] = "day", trade_volume: float = 0.0) -> Dict:
+        """
+        The user's stats and the global stats over all users for the same range.
+        Blocking; call it from a worker thread.
+        """
+        with self._lock:
+            self.refresh()
+            size = self._size
+            timestamps, users = self._timestamps[:size], self._users[:size]
+            ok, codes = self._ok[:size], self._codes[:size]
+            user = self._user_ids.get(user_id)
+            mine = users == user if user is not None else np.zeros(size, dtype=np.bool_)
+            options = dict(start=start, end=end, bucket=bucket, trade_volume=trade_volume)
+            in_range = np.ones(size, dtype=np.bool_)
+            if start is not None:
+                in_range &= timestamps >= start
+            if end is not None:
+                in_range &= timestamps < end
+            global_stats = summarize(timestamps, ok, codes, **options)
+            global_stats["traders"] = int(np.unique(users[in_range]).size)
+            return {
+                "user": summarize(timestamps[mine], ok[mine], codes[mine], **options),
+                "global": global_stats,
+            }
+
+
+trade_analytics = TradeAnalytics(ledger)
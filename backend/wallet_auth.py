@@ -0,0 +1,182 @@
+# /app/backend/wallet_auth.py
+
+# Verification of Keplr `signArbitrary` (ADR-036) login signatures.
+#
+# Keplr signs an amino "sign/MsgSignData" document wrapping the login message
+# with the wallet's secp256k1 key. We check that the presented public key hashes
+# to the wallet address and that the signature is valid for that document. The
+# curve math runs in an executor so it never blocks the event loop.
+
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional, Set
+
+import bech32
+from ecdsa import BadSignatureError, SECP256k1, VerifyingKey
+from ecdsa.util import sigdecode_string
+
+import shared_state
+from logger import get_logger
+
+log = get_logger(__name__)
+
+BECH32_PREFIX = "secret"
+_PUBKEY_TYPE = "tendermint/PubKeySecp256k1"
+_HALF_ORDER = SECP256k1.order // 2
+
+
+def _ripemd160(data: bytes) -> bytes:
+    try:
+        return hashlib.new("ripemd160", data).digest()
+    except ValueError:  # OpenSSL builds without the legacy provider.
+        from secret_sdk.key.bip32utils.ripemd160 import ripemd160
+        return ripemd160(data)
+
+
+def pubkey_to_address(pubkey: bytes, prefix: str = BECH32_PREFIX) -> str:
+    """Bech32 account address of a compressed secp256k1 public key."""
+    return bech32.bech32_encode(prefix, bech32.convertbits(_ripemd160(hashlib.sha256(pubkey).digest()), 8, 5))
+
+
+def adr036_sign_bytes(signer: str, message: str) -> bytes:
+    """The canonical (sorted, compact) amino JSON document Keplr signs for `signArbitrary`."""
+    doc = {
+        "account_number": "0",
+        "chain_id": "",
+        "fee": {"amount": [], "gas": "0"},
+        "memo": "",
+        "msgs": [{
+            "type": "sign/MsgSignData",
+            "value": {"data": base64.b64encode(message.encode("utf-8")).decode("ascii"), "signer": signer},
+        }],
+        "sequence": "0",
+    }
+    return json.dumps(doc, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+@lru_cache(maxsize=4096)
+def _verifying_key(pubkey: bytes) -> VerifyingKey:
+    # Decompressing the point is the expensive part of loading a key; keep it per process.
+    return VerifyingKey.from_string(pubkey, curve=SECP256k1)
+
+
+def verify_adr036(signer: str, message: str, pubkey: bytes, signature: bytes) -> bool:
+    """CPU-bound; run through LoginVerifier's executor rather than on the event loop."""
+    if len(signature) != 64 or int.from_bytes(signature[32:], "big") > _HALF_ORDER:
+        return False  # Cosmos only accepts low-s signatures.
+    digest = hashlib.sha256(adr036_sign_bytes(signer, message)).digest()
+    try:
+        return _verifying_key(pubkey).verify_digest(signature, digest, sigdecode=sigdecode_string)
+    except (BadSignatureError, ValueError, AssertionError):
+        return False
+
+
+class NonceStore:
+    """
+    Remembers used login nonces so a captured signature cannot be replayed.
+
+    Nonces are grouped into buckets of `window` seconds by their timestamp, and a
+    whole bucket is dropped once it falls out of the accepted window, so expiry is
+    O(1) per bucket. With a shared store (Redis) nonces are claimed there instead,
+    which also covers replays across workers.
+    """
+    def __init__(self, window: float = 300.0):
+        self.window = window
+        self._buckets: Dict[int, Set[str]] = {}
+
+    async def claim(self, nonce: str, timestamp: float) -> bool:
+        """Returns True the first time a nonce is seen, False on a replay."""
+        bucket = int(timestamp // self.window)
+        if shared_state.is_shared:
+            key = f"login-nonce:{bucket}:{nonce}"
+            return await shared_state.store.incr(key, ttl=self.window * 3) == 1
+        current = int(time.time() // self.window)
+        for old in [b for b in self._buckets if b < current - 2]:
+            del self._buckets[old]
+        seen = self._buckets.setdefault(bucket, set())
+        if nonce in seen:
+            return False
+        seen.add(nonce)
+        return True
+
+
+class LoginVerifier:
+    """
+    Verifies login signatures off the event loop, with an LRU of wallet address
+    to verified public key so repeated logins skip address derivation.
+    """
+    def __init__(self, max_workers: int = 4, use_processes: bool = False,
+                 pubkey_cache_size: int = 10_000, nonce_window: float = 300.0):
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.pubkey_cache_size = pubkey_cache_size
+        self.nonces = NonceStore(window=nonce_window)
+        self._pubkeys: "OrderedDict[str, bytes]" = OrderedDict()
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sigverify")
+        return self._executor
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _pubkey_matches(self, address: str, pubkey: bytes) -> bool:
+        cached = self._pubkeys.get(address)
+        if cached is not None:
+            self._pubkeys.move_to_end(address)
+            if cached == pubkey:
+                return True
+        return pubkey_to_address(pubkey) == address
+
+    def _remember(self, address: str, pubkey: bytes) -> None:
+        self._pubkeys[address] = pubkey
+        self._pubkeys.move_to_end(address)
+        while len(self._pubkeys) > self.pubkey_cache_size:
+            self._pubkeys.popitem(last=False)
+
+    async def verify(self, address: str, message: str, encoded_signature: str) -> bool:
+        """
+        Checks a Keplr StdSignature (base64 of its JSON, as the frontend sends it)
+        over `message` for `address`.
+        """
+        try:
+            std_signature = json.loads(base64.b64decode(encoded_signature))
+            pub_key = std_signature["pub_key"]
+            if pub_key.get("type") != _PUBKEY_TYPE:
+                return False
+            pubkey = base64.b64decode(pub_key["value"])
+            signature = base64.b64decode(std_signature["signature"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return False
+
+        if not self._pubkey_matches(address, pubkey):
+            log.warning(f"Public key does not belong to {address}.")
+            return False
+        valid = await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), verify_adr036, address, message, pubkey, signature
+        )
+        if valid:
+            self._remember(address, pubkey)
+        return valid
+
+
+login_verifier = LoginVerifier(
+    max_workers=int(os.getenv("LOGIN_VERIFY_WORKERS", "4")),
+    use_processes=os.getenv("LOGIN_VERIFY_EXECUTOR", "thread").lower() == "process",
+    pubkey_cache_size=int(os.getenv("LOGIN_PUBKEY_CACHE_SIZE", "10000")),
+    nonce_window=float(os.getenv("LOGIN_NONCE_WINDOW", "300")),
+)
@@ -4,6 +4,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { useAppStore } from '@/lib/store';
 import { cn } from '@/lib/utils';
 import { secretLCDClient } from '@/lib/utils';
+import { ChatSocket, ChatEvent, streamChatSSE } from '@/utils/chatSocket';
 
 import { AquaSprite } from '@/components/ui/aqua-sprite';
 
@@ -26,7 +27,7 @@ const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL;
 
 
 export function ChatInterface() {
-  const { token, wallet, setTradeStatus, setLastTradeResult, fetchBalances } = useAppStore();
+  const { token, wallet, setTradeStatus, setLastTradeResult, fetchBalances, refreshToken } = useAppStore();
 
   const [messages, setMessages] = useState<Message[]>([]);
   const [input, setInput] = useState("");
@@ -35,8 +36,18 @@ export function ChatInterface() {
   const [historicExpanded, setHistoricExpanded] = useState<{ [key: number]: boolean }>({});
 
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // One chat socket per wallet session, reused for every turn; it re-authenticates
+  // itself when the access token is refreshed.
+  const socketRef = useRef<ChatSocket | null>(null);
   const thinkingBoxRef = useRef<HTMLDivElement>(null);
 
+  useEffect(() => {
+    return () => {
+      socketRef.current?.close();
+      socketRef.current = null;
+    };
+  }, [wallet.secretAddress]);
+
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages]);
@@ -49,6 +60,8 @@ export function ChatInterface() {
 
 
   const logTradeResult = async (tradeResult: string) => {
+    // Read at call time: the token may have been refreshed during the chat turn.
+    const token = useAppStore.getState().token;
     if (!token) return;
     try {
       console.log("Logging trade result to backend...");
@@ -66,6 +79,36 @@ export function ChatInterface() {
   };
 
 
+  const executeTrade = async (trade_args: any) => {
+    setTradeStatus(true);
+    try {
+      if (!wallet.isConnected || !wallet.secretAddress || !wallet.secretSigner) {
+        throw new Error("Wallet is not ready for trading.");
+      }
+      const lcdClient = secretLCDClient(wallet.secretAddress, wallet.secretSigner, wallet.enigmaUtils);
+      const tx = await lcdClient.tx.compute.executeContract(trade_args, { gasLimit: 3_000_000 });
+
+      if (tx.code === 0) {
+        const successMessage = `Trade successful! Hash: ${tx.transactionHash}`;
+        setMessages(prev => [...prev, { role: "assistant", content: successMessage }]);
+        setLastTradeResult(successMessage);
+        await logTradeResult(successMessage);
+        fetchBalances();
+      } else {
+        const errorMessage = `On-chain error (code ${tx.code}): ${tx.rawLog}`;
+        setMessages(prev => [...prev, { role: "assistant", content: errorMessage }]);
+        setLastTradeResult(errorMessage);
+        await logTradeResult(errorMessage);
+      }
+    } catch (e: any) {
+      const errorMessage = `Failed to sign or broadcast trade: ${e.message}`;
+      setMessages(prev => [...prev, { role: "assistant", content: errorMessage }]);
+      setLastTradeResult(errorMessage);
+    } finally {
+      setTradeStatus(false);
+    }
+  };
+
   const handleSendMessage = async () => {
     if (!input.trim() || isLoading || !token) return;
 
@@ -73,98 +116,62 @@ export function ChatInterface() {
     setStreamingThinkingText("");
 
     const userMessage: Message = { role: "user", content: input };
-    const messagesToSend = [...messages, userMessage];
-    setMessages(prev => [...prev, userMessage]);
+    setMessages(prev => [...prev, userMessage, { role: "assistant", content: "" }]);
     setInput("");
 
-    try {
-      const response = await fetch(`${API_BASE_URL}/api/chat`, {
-        method: "POST",
-        headers: { "Authorization": `Bearer ${token}`, "Content-Type": "application/json" },
-        body: JSON.stringify({ messages: messagesToSend }),
-      });
-
-      if (!response.ok) throw new Error(`API Error: ${response.status} ${response.statusText}`);
+    let fullResponseText = "";
+    let tradeArgs: any = null;
 
-      const contentType = response.headers.get("content-type");
-
-      // Handle the JSON "action" response for trading
-      if (contentType && contentType.includes("application/json")) {
-        setMessages(prev => [...prev, { role: "assistant", content: "" }]);
-        const { action, trade_args, message } = await response.json();
-        
-        setMessages(prev => {
-            const newMessages = [...prev];
-            newMessages[newMessages.length - 1].content = message;
-            return newMessages;
-        });
+    const showResponse = () => {
+      const thinkRegex = /<think>([\s\S]*?)<\/think>/gs;
+      let liveThoughts = "";
+      const lastThinkStart = fullResponseText.lastIndexOf("<think>");
+      const lastThinkEnd = fullResponseText.lastIndexOf("</think>");
+      if (lastThinkStart > -1 && lastThinkStart > lastThinkEnd) {
+        liveThoughts = fullResponseText.substring(lastThinkStart + 7);
+      }
+      setStreamingThinkingText(liveThoughts);
 
-        if (action === "execute_trade") {
-          setTradeStatus(true);
-          try {
-            if (!wallet.isConnected || !wallet.secretAddress || !wallet.secretSigner) {
-              throw new Error("Wallet is not ready for trading.");
-            }
-            const lcdClient = secretLCDClient(wallet.secretAddress, wallet.secretSigner, wallet.enigmaUtils);
-            const tx = await lcdClient.tx.compute.executeContract(trade_args, { gasLimit: 3_000_000 });
+      const visibleContent = fullResponseText.replace(thinkRegex, "").replace(/<think>[\s\S]*/s, "").trim();
+      const completedMatch = fullResponseText.match(thinkRegex);
+      const thinking = completedMatch ? completedMatch.map(t => t.replace(/<\/?think>/g, "").trim()).join("\n\n---\n\n") : undefined;
 
-            if (tx.code === 0) {
-              const successMessage = `Trade successful! Hash: ${tx.transactionHash}`;
-              setMessages(prev => [...prev, { role: "assistant", content: successMessage }]);
-              setLastTradeResult(successMessage);
-              await logTradeResult(successMessage);
-              fetchBalances();
-            } else {
-              const errorMessage = `On-chain error (code ${tx.code}): ${tx.rawLog}`;
-              setMessages(prev => [...prev, { role: "assistant", content: errorMessage }]);
-              setLastTradeResult(errorMessage);
-              await logTradeResult(errorMessage);
-            }
-          } catch (e: any) {
-            const errorMessage = `Failed to sign or broadcast trade: ${e.message}`;
-            setMessages(prev => [...prev, { role: "assistant", content: errorMessage }]);
-            setLastTradeResult(errorMessage);
-          } finally {
-            setTradeStatus(false);
-          }
+      setMessages(prev => {
+        const newMessages = [...prev];
+        const lastMessage = newMessages[newMessages.length - 1];
+        if (lastMessage?.role === 'assistant') {
+          lastMessage.content = visibleContent;
+          lastMessage.thinking = thinking;
         }
-      } else {
-        if (!response.body) throw new Error("Response body is null");
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let fullResponseText = "";
-        
-        setMessages(prev => [...prev, { role: "assistant", content: "" }]);
-
-        while (true) {
-          const { done, value } = await reader.read();
-          if (done) break;
-          fullResponseText += decoder.decode(value, { stream: true });
-
-          const thinkRegex = /<think>([\s\S]*?)<\/think>/gs;
-          let liveThoughts = "";
-          const lastThinkStart = fullResponseText.lastIndexOf("<think>");
-          const lastThinkEnd = fullResponseText.lastIndexOf("</think>");
-          if (lastThinkStart > -1 && lastThinkStart > lastThinkEnd) {
-            liveThoughts = fullResponseText.substring(lastThinkStart + 7);
-          }
-          setStreamingThinkingText(liveThoughts);
+        return newMessages;
+      });
+    };
 
-          const visibleContent = fullResponseText.replace(thinkRegex, "").replace(/<think>[\s\S]*/s, "").trim();
-          const completedMatch = fullResponseText.match(thinkRegex);
-          const thinking = completedMatch ? completedMatch.map(t => t.replace(/<\/?think>/g, "").trim()).join("\n\n---\n\n") : undefined;
+    const onEvent = (event: ChatEvent) => {
+      if (event.type === "token") {
+        fullResponseText += event.content;
+        showResponse();
+      } else if (event.type === "action") {
+        // The trade is signed after the stream ends, so the socket is free for the next turn.
+        fullResponseText = event.message;
+        showResponse();
+        if (event.action === "execute_trade") tradeArgs = event.trade_args;
+      } else if (event.type === "error") {
+        setMessages(prev => [...prev, { role: "assistant", content: event.message }]);
+      }
+    };
 
-          setMessages(prev => {
-            const newMessages = [...prev];
-            const lastMessage = newMessages[newMessages.length - 1];
-            if (lastMessage?.role === 'assistant') {
-              lastMessage.content = visibleContent;
-              lastMessage.thinking = thinking;
-            }
-            return newMessages;
-          });
-        }
+    try {
+      try {
+        if (!socketRef.current) socketRef.current = new ChatSocket(token, refreshToken);
+        await socketRef.current.send(userMessage.content, onEvent);
+      } catch (socketError) {
+        // No WebSocket (e.g. a proxy that does not upgrade): stream the turn over SSE instead.
+        console.warn("Chat socket unavailable, falling back to SSE:", socketError);
+        socketRef.current = null;
+        await streamChatSSE(useAppStore.getState().token ?? token, userMessage.content, onEvent);
       }
+      if (tradeArgs) await executeTrade(tradeArgs);
     } catch (e: any) {
       const errorMessage = `An error occurred: ${e.message}`;
       setMessages(prev => [...prev, { role: 'assistant', content: errorMessage }]);
@@ -192,6 +199,12 @@ export function ChatInterface() {
             onClick={() => {
               if (messages.length > 0) {
                   setMessages([]);
+                  if (token) {
+                    fetch(`${API_BASE_URL}/api/chat/history`, {
+                      method: "DELETE",
+                      headers: { "Authorization": `Bearer ${token}` },
+                    }).catch(error => console.error("Failed to clear chat history:", error));
+                  }
               }
             }}
             className="absolute top-[-20px] right-0"
@@ -3,7 +3,7 @@
 import { create } from "zustand";
 import type { AppState, Balance, ViewingKeys } from "./types";
 import { setupKeplr, secretLCDClient, formatAmount, getSnip20Balance } from "./utils";
-import { getAuthToken, isTokenExpired, loginWithKeplr, logout } from "@/utils/auth";
+import { decodeJWT, getAuthToken, isTokenExpired, loginWithKeplr, logout, refreshAuthToken } from "@/utils/auth";
 import { SSCRT_ADDRESS, SSCRT_CODE_HASH, SUSDC_ADDRESS, SUSDC_CODE_HASH } from "./constants";
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL;
@@ -11,6 +11,7 @@ const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL;
 interface AppStore extends AppState {
   getAutoConnect: () => boolean;
   connectWallet: () => Promise<void>;
+  refreshToken: () => Promise<string | null>;
   disconnectWallet: () => void;
   updateBalances: (balances: Balance) => void;
   fetchBalances: () => Promise<void>;
@@ -58,6 +59,10 @@ export const useAppStore = create<AppStore>((set, get) => ({
       const { secretAddress, secretSigner, secretChain, enigmaUtils } = await setupKeplr();
       let token = getAuthToken();
       if (!token || isTokenExpired(token)) {
+        token = await get().refreshToken();
+      }
+      // A stored session may belong to a different Keplr account.
+      if (!token || decodeJWT(token).sub !== secretAddress) {
         logout();
         const loginData = await loginWithKeplr();
         token = loginData.data.token;
@@ -84,6 +89,13 @@ export const useAppStore = create<AppStore>((set, get) => ({
     }
   },
 
+  /** Rotates the access token with the stored refresh token and publishes it to the store. */
+  refreshToken: async () => {
+    const token = await refreshAuthToken();
+    if (token) set({ token });
+    return token;
+  },
+
   disconnectWallet: () => {
     set({
       user: null, token: null,
@@ -4,8 +4,9 @@ export interface LoginResult {
   data: {
     user: User;
     token: string;
+    refreshToken: string;
     walletAddress: string;
-    expiresIn: string;
+    expiresIn: number;
   };
 }
 
@@ -101,6 +102,7 @@ export async function loginWithKeplr(): Promise<LoginResult> {
       throw new Error("Login failed: No data returned from server");
     }
     localStorage.setItem("auth_token", loginData.data.token);
+    localStorage.setItem("refresh_token", loginData.data.refreshToken);
     return loginData;
   } catch (error) {
     console.error("Login error:", error);
@@ -116,11 +118,61 @@ export function getAuthToken(): string | null {
   return localStorage.getItem("auth_token");
 }
 
+// Refresh tokens are single-use, so concurrent callers share one in-flight refresh.
+let refreshing: Promise<string | null> | null = null;
+
 /**
- * Removes the stored authentication token
+ * Exchanges the stored refresh token for a new access token, without a wallet signature.
+ * Returns null if there is no refresh token or it was rejected.
+ */
+export function refreshAuthToken(): Promise<string | null> {
+  if (!refreshing) {
+    refreshing = exchangeRefreshToken().finally(() => {
+      refreshing = null;
+    });
+  }
+  return refreshing;
+}
+
+async function exchangeRefreshToken(): Promise<string | null> {
+  const refreshToken = localStorage.getItem("refresh_token");
+  if (!refreshToken) {
+    return null;
+  }
+  try {
+    const response = await fetch(`${API_BASE_URL}/api/token/refresh`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ refreshToken }),
+    });
+    if (!response.ok) {
+      localStorage.removeItem("refresh_token");
+      return null;
+    }
+    const { data } = await response.json();
+    localStorage.setItem("auth_token", data.token);
+    localStorage.setItem("refresh_token", data.refreshToken);
+    return data.token;
+  } catch (error) {
+    console.error("Token refresh error:", error);
+    return null;
+  }
+}
+
+/**
+ * Removes the stored authentication tokens and revokes the refresh token
  */
 export function logout(): void {
+  const refreshToken = localStorage.getItem("refresh_token");
+  if (refreshToken) {
+    fetch(`${API_BASE_URL}/api/logout`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ refreshToken }),
+    }).catch(() => {});
+  }
   localStorage.removeItem("auth_token");
+  localStorage.removeItem("refresh_token");
 }
 
 /**
@@ -0,0 +1,157 @@
+import { refreshAuthToken } from "./auth";
+
+// Get the backend URL from the environment variable.
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL;
+
+export type ChatEvent =
+  | { type: "ready"; user: string }
+  | { type: "token"; content: string; id?: number }
+  | { type: "action"; action: "execute_trade"; message: string; trade_args: any; id?: number }
+  | { type: "error"; message: string; code?: string; id?: number }
+  | { type: "done"; cancelled?: boolean; id?: number }
+  | { type: "pong" };
+
+/**
+ * A persistent chat WebSocket (`/api/chat/ws`). The socket authenticates once
+ * and carries every turn of the session, so a new message skips the HTTP and
+ * token verification setup. It reconnects lazily on the next message if it drops.
+ */
+export class ChatSocket {
+  private socket: WebSocket | null = null;
+  private opening: Promise<void> | null = null;
+  private onEvent: ((event: ChatEvent) => void) | null = null;
+  private nextId = 1;
+
+  /**
+   * `refresh` rotates the access token when the server reports it expired; pass
+   * the store's `refreshToken` so the rest of the app sees the new token too.
+   */
+  constructor(private token: string, private refresh: () => Promise<string | null> = refreshAuthToken) {}
+
+  private url(): string {
+    return `${(API_BASE_URL || "").replace(/^http/, "ws")}/api/chat/ws`;
+  }
+
+  private connect(): Promise<void> {
+    if (this.socket?.readyState === WebSocket.OPEN) return Promise.resolve();
+    if (this.opening) return this.opening;
+
+    this.opening = new Promise<void>((resolve, reject) => {
+      const socket = new WebSocket(this.url());
+      let ready = false;
+      socket.onopen = () => socket.send(JSON.stringify({ type: "auth", token: this.token }));
+      socket.onmessage = (message) => {
+        const event: ChatEvent = JSON.parse(message.data);
+        if (event.type === "ready") {
+          ready = true;
+          resolve();
+        } else {
+          this.onEvent?.(event);
+        }
+      };
+      socket.onclose = (close) => {
+        this.socket = null;
+        this.opening = null;
+        if (!ready) {
+          reject(new Error(close.reason || `Chat connection closed (${close.code})`));
+        } else {
+          this.onEvent?.({ type: "error", message: "Chat connection lost." });
+          this.onEvent?.({ type: "done" });
+        }
+      };
+      this.socket = socket;
+    }).finally(() => {
+      this.opening = null;
+    });
+    return this.opening;
+  }
+
+  /** Re-authenticates the open socket after the access token was refreshed. */
+  private async reauthenticate(token: string): Promise<void> {
+    this.token = token;
+    this.socket?.send(JSON.stringify({ type: "auth", token }));
+  }
+
+  /**
+   * Sends one message and calls `onEvent` for each event of the answer.
+   * Resolves after the turn's `done` event.
+   */
+  async send(content: string, onEvent: (event: ChatEvent) => void): Promise<void> {
+    await this.connect();
+    let id = this.nextId++;
+    let retried = false;
+
+    await new Promise<void>((resolve) => {
+      this.onEvent = async (event) => {
+        if ("id" in event && event.id !== undefined && event.id !== id) return;
+        if (event.type === "error" && event.code === "auth_expired" && !retried) {
+          retried = true;
+          const token = await this.refresh();
+          if (token) {
+            // Retried under a new id, so the rejected turn's own `done` is ignored.
+            id = this.nextId++;
+            await this.reauthenticate(token);
+            this.socket?.send(JSON.stringify({ type: "message", content, id }));
+            return;
+          }
+        }
+        onEvent(event);
+        if (event.type === "done") {
+          this.onEvent = null;
+          resolve();
+        }
+      };
+      this.socket?.send(JSON.stringify({ type: "message", content, id }));
+    });
+  }
+
+  /** Stops the answer currently streaming; the server ends the turn with `done`. */
+  cancel(): void {
+    this.socket?.send(JSON.stringify({ type: "cancel" }));
+  }
+
+  close(): void {
+    this.socket?.close();
+    this.socket = null;
+  }
+}
+
+/**
+ * Fallback for when a WebSocket cannot be opened: one turn over
+ * `POST /api/chat` as Server-Sent Events, with the same typed events.
+ */
+export async function streamChatSSE(
+  token: string,
+  content: string,
+  onEvent: (event: ChatEvent) => void,
+  signal?: AbortSignal,
+): Promise<void> {
+  const response = await fetch(`${API_BASE_URL}/api/chat`, {
+    method: "POST",
+    headers: {
+      "Authorization": `Bearer ${token}`,
+      "Content-Type": "application/json",
+      "Accept": "text/event-stream",
+    },
+    body: JSON.stringify({ message: content }),
+    signal,
+  });
+  if (!response.ok) throw new Error(`API Error: ${response.status} ${response.statusText}`);
+  if (!response.body) throw new Error("Response body is null");
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) >= 0) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const data = frame.split("\n").filter(line => line.startsWith("data: ")).map(line => line.slice(6)).join("\n");
+      if (data) onEvent(JSON.parse(data));
+    }
+  }
+}